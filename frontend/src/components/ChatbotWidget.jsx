@@ -342,7 +342,7 @@
 //   );
 // }
 import { useState, useEffect, useRef } from "react";
-import { askChatbot, checkChatbotHealth } from "../services/chatbotService";
+import { askChatbotStream, checkChatbotHealth } from "../services/chatbotService";
 
 export default function ChatbotWidget() {
   const [messages, setMessages] = useState([
@@ -358,8 +358,9 @@ export default function ChatbotWidget() {
   const [isServiceActive, setIsServiceActive] = useState(true);
   const messagesEndRef = useRef(null);
   const inputRef = useRef(null);
-
-  // ── ALL LOGIC BELOW IS UNTOUCHED ──
+  const streamingRef = useRef(false);
+  // Issued by the server with the first answer; sent back so follow-ups continue the conversation
+  const sessionIdRef = useRef(null);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -378,7 +379,7 @@ export default function ChatbotWidget() {
   }, []);
 
   const handleSend = async () => {
-    if (!input.trim() || isLoading) return;
+    if (!input.trim() || isLoading || streamingRef.current) return;
 
     const userMessage = {
       id: Date.now(),
@@ -391,18 +392,56 @@ export default function ChatbotWidget() {
     setInput("");
     setIsLoading(true);
 
+    // The bot message is created on the first event with text and filled in as the answer streams in
+    const botMessageId = Date.now() + 1;
+    let meta = {};
+    let started = false;
+    const updateBotMessage = (update) =>
+      setMessages((prev) =>
+        prev.map((message) =>
+          message.id === botMessageId ? { ...message, ...update(message) } : message,
+        ),
+      );
+    // Replaces the bot message text, creating the message if nothing was shown yet
+    const setBotMessage = (fields) => {
+      if (started) {
+        updateBotMessage(() => fields);
+        return;
+      }
+      started = true;
+      setIsLoading(false);
+      setMessages((prev) => [
+        ...prev,
+        { id: botMessageId, type: "bot", ...meta, ...fields, timestamp: new Date() },
+      ]);
+    };
+
+    streamingRef.current = true;
     try {
-      const response = await askChatbot(input);
-      const botMessage = {
-        id: Date.now() + 1,
-        type: "bot",
-        text: response.answer,
-        sources: response.sources,
-        confidence: response.confidence,
-        relevanceScore: response.relevance_score,
-        timestamp: new Date(),
-      };
-      setMessages((prev) => [...prev, botMessage]);
+      const session = sessionIdRef.current ? { sessionId: sessionIdRef.current } : { newSession: true };
+      await askChatbotStream(input, {
+        onMeta: (data) => {
+          if (data.session_id) sessionIdRef.current = data.session_id;
+          meta = {
+            confidence: data.confidence,
+            relevanceScore: data.relevance_score,
+          };
+        },
+        onToken: (token) => {
+          if (!started) {
+            setBotMessage({ text: token });
+            return;
+          }
+          updateBotMessage((message) => ({ text: message.text + token }));
+        },
+        onDone: ({ answer }) => {
+          setBotMessage({ text: answer });
+        },
+        // The answer failed but the service is up: the error replaces any partial answer
+        onError: ({ message }) => {
+          setBotMessage({ text: message, isError: true });
+        },
+      }, 5, session);
     } catch (error) {
       const errorMessage = {
         id: Date.now() + 1,
@@ -414,6 +453,7 @@ export default function ChatbotWidget() {
       setMessages((prev) => [...prev, errorMessage]);
       setIsServiceActive(false);
     } finally {
+      streamingRef.current = false;
       setIsLoading(false);
     }
   };
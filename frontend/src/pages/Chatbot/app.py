@@ -1,18 +1,117 @@
-from flask import Flask, request, jsonify
+import os
+import json
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from src.search import RAGSearch
+from src.retrieval_policy import RetrievalPolicy
+from src.context_builder import ContextBuilder
+from src.session_store import SessionStore
+from src.llm_gateway import LLMGateway
+from src.async_runtime import AsyncRuntime, ServerBusyError
+from src.metrics import REGISTRY
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Initialize RAG Search with improved accuracy
-rag_search = RAGSearch(
-    persist_dir="./data/vector_store",
-    embedding_model="all-MiniLM-L6-v2",
-    llm_model="llama-3.3-70b-versatile"  # Llama 3.3 70B via Groq API
-)
+# "eager": sync the index and load every model before serving (slowest start)
+# "background": serve immediately, warm up in a thread; /ready reports 503 until done
+# "lazy": sync the index, then load each model on the request that first needs it
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background")
+if STARTUP_MODE not in ("eager", "background", "lazy"):
+    raise ValueError(f"Unknown STARTUP_MODE: {STARTUP_MODE}")
 
-print(f"[INFO] RAG Search initialized with {rag_search.vectorstore.collection.count()} documents.")
+# "chroma" (default) or "faiss" for the in-process FAISS store; migrate an
+# existing Chroma index first with: python -m src.faiss_store
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+
+# "writer": this process keeps the index in sync with data/ (default)
+# "reader": serve the snapshot published by a separate `python -m src.index_writer`
+# (FAISS only); used by the pre-fork workers started from gunicorn.conf.py
+INDEX_ROLE = os.getenv("INDEX_ROLE", "writer")
+if INDEX_ROLE not in ("writer", "reader"):
+    raise ValueError(f"Unknown INDEX_ROLE: {INDEX_ROLE}")
+
+# Requests run as coroutines on one shared event loop: LLM waits don't hold a
+# worker, CPU stages use RAGSearch's bounded thread pool, and excess load gets a 503
+def _make_runtime() -> AsyncRuntime:
+    return AsyncRuntime(
+        max_concurrent=int(os.getenv("MAX_CONCURRENT_REQUESTS", "32")),
+        max_queue=int(os.getenv("MAX_QUEUED_REQUESTS", "64")),
+        retry_after=int(os.getenv("RETRY_AFTER_SECONDS", "2"))
+    )
+
+# Parser processes started by src.dataloader (forkserver/spawn) re-run this script
+# as __mp_main__; they only parse files, so the search stack is built here only
+if __name__ != "__mp_main__":
+    # Initialize RAG Search with improved accuracy
+    rag_search = RAGSearch(
+        persist_dir="./data/faiss_store" if VECTOR_BACKEND == "faiss" else "./data/vector_store",
+        vector_backend=VECTOR_BACKEND,
+        faiss_index_type=os.getenv("FAISS_INDEX_TYPE", "hnsw"),
+        embedding_model="all-MiniLM-L6-v2",
+        llm_model="llama-3.3-70b-versatile",  # Llama 3.3 70B via Groq API
+        retrieval_mode="hybrid",  # Dense + BM25 so exact course codes and room numbers are not missed
+        micro_batching=os.getenv("MICRO_BATCHING", "1") == "1",  # Share encoder/reranker passes across concurrent requests
+        batch_window_ms=float(os.getenv("BATCH_WINDOW_MS", "5")),
+        inference_workers=int(os.getenv("INFERENCE_WORKERS", "16")),  # Requests in the embed/rerank stage at once; bounds batch size
+        inference_backend=os.getenv("INFERENCE_BACKEND", "torch"),  # "onnx-int8" runs both encoders quantized on CPU
+        lazy_startup=STARTUP_MODE != "eager",
+        read_only_index=INDEX_ROLE == "reader",
+        # "adaptive" trims candidates by dense score and re-ranks in early-exit cascades
+        retrieval_policy=RetrievalPolicy(mode=os.getenv("RETRIEVAL_POLICY", "fixed")),
+        context_builder=ContextBuilder(max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "2000"))),
+        multi_query=os.getenv("MULTI_QUERY", "0") == "1",  # Also search rephrasings, fused before re-ranking
+        intent_routing=os.getenv("INTENT_ROUTING", "off"),  # "rules"/"centroid" search only the question's document_type
+        rerank_token_cache=os.getenv("RERANK_TOKEN_CACHE", "1") == "1",  # Chunks are tokenized for the cross-encoder once, at index time
+        # Conversations in a SQLite file every worker shares; follow-ups reuse the previous turn's chunks
+        session_store=SessionStore(path=os.getenv("SESSION_STORE_PATH", "./data/sessions.sqlite3"),
+                                   max_sessions=int(os.getenv("MAX_SESSIONS", "10000")),
+                                   ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", "1800"))),
+        # Pooled Groq client with coalescing, hedging, retries and a circuit breaker; LLM_GATEWAY=0 calls ChatGroq directly
+        llm_gateway=LLMGateway(
+            base_url=os.getenv("GROQ_BASE_URL") or None,  # e.g. benchmarks/stub_groq_server.py
+            deadline_seconds=float(os.getenv("LLM_DEADLINE_SECONDS", "30")),
+            hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95")) or None,
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+            failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+            reset_seconds=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+        ) if os.getenv("LLM_GATEWAY", "1") == "1" else None
+    )
+
+    print(f"[INFO] RAG Search initialized with {rag_search.vectorstore.count()} documents.")
+
+    def _background_warm_up():
+        try:
+            rag_search.warm_up()
+        except Exception:
+            pass  # Logged by warm_up; /ready keeps returning 503 with the error
+
+    if STARTUP_MODE == "background":
+        threading.Thread(target=_background_warm_up, name="rag-warm-up", daemon=True).start()
+    elif STARTUP_MODE == "lazy":
+        rag_search.warm_up(load_models=False)
+
+    runtime = _make_runtime()
+
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "60"))
+# /ask/batch: size limit, LLM calls in flight per batch, and the longest wait for the
+# next result (the first one waits for retrieval and re-ranking of the whole batch)
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "500"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+BATCH_TIMEOUT = float(os.getenv("BATCH_TIMEOUT_SECONDS", "300"))
+MAX_SESSION_ID_LENGTH = 128
+
+def init_worker():
+    """
+    Called in each worker after a pre-fork server forks this module: the event
+    loop and inference threads of the parent don't exist in the child
+    """
+    global runtime
+    runtime = _make_runtime()
+    rag_search.after_fork()
 
 @app.route('/')
 def home():
@@ -21,13 +120,23 @@ def home():
         'message': 'CampusConnect Chatbot API with Enhanced Accuracy',
         'features': [
             'Query preprocessing and expansion',
+            'Hybrid dense + BM25 retrieval',
             'Cross-encoder re-ranking',
             'Confidence scoring',
+            'Token streaming over Server-Sent Events',
+            'Exact and semantic answer caching',
             'Multi-document support',
+            'Conversational follow-ups with new_session and session_id',
             'Clean user interface without source exposure'
         ],
         'endpoints': {
-            '/ask': 'POST - Send a query to the chatbot (returns answer with confidence)',
+            '/ask': 'POST - Send a query (and optionally new_session or a session_id) to the chatbot (returns answer with confidence)',
+            '/ask/stream': 'POST - Same as /ask, streamed as Server-Sent Events (meta, token, done, error)',
+            '/ask/batch': 'POST - Answer a list of queries, streamed as JSON lines in completion order',
+            '/ready': 'GET - Readiness probe (503 while the index syncs and models warm up)',
+            '/cache/stats': 'GET - Answer cache hit/miss counters',
+            '/load': 'GET - Running/queued/rejected request counts and micro-batching histograms',
+            '/metrics': 'GET - Prometheus metrics: per-stage latency, request outcomes, cache lookups, LLM tokens',
             'response_fields': {
                 'answer': 'The chatbot response text',
                 'confidence': 'Confidence level and score',
@@ -36,24 +145,180 @@ def home():
         }
     })
 
+def _session_error(session_id, new_session):
+    if session_id is not None and (not isinstance(session_id, str) or len(session_id) > MAX_SESSION_ID_LENGTH):
+        return f'session_id must be a string of at most {MAX_SESSION_ID_LENGTH} characters'
+    if not isinstance(new_session, bool):
+        return 'new_session must be true or false'
+    return None
+
+def _resolve_session(session_id, new_session):
+    # Sessions are opt-in: a question without session_id or new_session stands alone and
+    # writes nothing. The server issues session ids: new_session, or an id that is unknown
+    # or expired, gets a new one, so a client can't pick its way into another conversation
+    if rag_search.sessions is None or (not session_id and not new_session):
+        return None
+    return rag_search.sessions.resolve(session_id)
+
 @app.route('/ask', methods=['POST'])
 def ask():
     data = request.json
     query = data.get('query', '')
     top_k = data.get('top_k', 5)  # Number of documents to use for context
+    session_id = data.get('session_id')  # Returned by the previous answer; continues that conversation
+    new_session = data.get('new_session', False)  # Starts a conversation; the answer carries its session_id
     
     if not query:
         return jsonify({'error': 'Query cannot be empty'}), 400
+    error = _session_error(session_id, new_session)
+    if error:
+        return jsonify({'error': error}), 400
+    session_id = _resolve_session(session_id, new_session)
     
     # Get enhanced response with confidence scoring
-    result = rag_search.ask(query, top_k=top_k)
+    try:
+        result = runtime.run(lambda: rag_search.ask_async(query, top_k=top_k, session_id=session_id),
+                             timeout=REQUEST_TIMEOUT)
+    except ServerBusyError as e:
+        response = jsonify({'error': 'The assistant is busy right now. Please try again shortly.'})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    except FutureTimeoutError:
+        return jsonify({'error': 'The request timed out. Please try again.'}), 504
     
     # Return simplified response without exposing sources to users
-    return jsonify({
+    response = {
         'answer': result['answer'],
         'confidence': result['confidence'],
         'relevance_score': result['relevance_score']
-    })
+    }
+    if session_id is not None:
+        response['session_id'] = session_id
+    return jsonify(response)
+
+@app.route('/ask/stream', methods=['POST'])
+def ask_stream():
+    data = request.json
+    query = data.get('query', '')
+    top_k = data.get('top_k', 5)
+    session_id = data.get('session_id')
+    new_session = data.get('new_session', False)
+
+    if not query:
+        return jsonify({'error': 'Query cannot be empty'}), 400
+    error = _session_error(session_id, new_session)
+    if error:
+        return jsonify({'error': error}), 400
+    session_id = _resolve_session(session_id, new_session)
+
+    try:
+        events = runtime.stream(lambda: rag_search.ask_stream_async(query, top_k=top_k, session_id=session_id),
+                                timeout=REQUEST_TIMEOUT)
+    except ServerBusyError as e:
+        response = jsonify({'error': 'The assistant is busy right now. Please try again shortly.'})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+
+    def generate():
+        # Server-Sent Events: one "event:"/"data:" block per item
+        try:
+            for event in events:
+                data = event['data']
+                if event['event'] == 'meta' and session_id is not None:
+                    data = {**data, 'session_id': session_id}
+                yield f"event: {event['event']}\ndata: {json.dumps(data)}\n\n"
+        except FutureTimeoutError:
+            yield f"event: error\ndata: {json.dumps({'message': 'The request timed out. Please try again.'})}\n\n"
+        finally:
+            events.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/ask/batch', methods=['POST'])
+def ask_batch():
+    data = request.json
+    queries = data.get('queries', [])
+    top_k = data.get('top_k', 5)
+
+    if not queries or not isinstance(queries, list) or not all(isinstance(q, str) and q for q in queries):
+        return jsonify({'error': 'queries must be a non-empty list of non-empty strings'}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({'error': f'At most {MAX_BATCH_QUERIES} queries per batch'}), 400
+
+    try:
+        results = runtime.stream(
+            lambda: rag_search.ask_batch_async(queries, top_k=top_k, max_concurrency=BATCH_LLM_CONCURRENCY),
+            timeout=BATCH_TIMEOUT
+        )
+    except ServerBusyError as e:
+        response = jsonify({'error': 'The assistant is busy right now. Please try again shortly.'})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+
+    def generate():
+        # One JSON object per line, as each answer completes; "index" points back into queries
+        try:
+            for result in results:
+                yield json.dumps({
+                    'index': result['index'],
+                    'query': result['query'],
+                    'answer': result['answer'],
+                    'confidence': result['confidence'],
+                    'relevance_score': result['relevance_score']
+                }) + "\n"
+        except FutureTimeoutError:
+            yield json.dumps({'error': 'The request timed out. Please try again.'}) + "\n"
+        finally:
+            results.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """
+    Readiness probe: 200 once the index is synced and models are warm, 503 before
+    """
+    status = rag_search.readiness()
+    if status['ready']:
+        return jsonify(status)
+    response = jsonify(status)
+    response.headers['Retry-After'] = str(runtime.retry_after)
+    return response, 503
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    if rag_search.answer_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **rag_search.answer_cache.stats()})
+
+@app.route('/load', methods=['GET'])
+def load():
+    return jsonify({**runtime.stats(), 'batching': rag_search.batching_stats()})
+
+# Read at scrape time through the module globals, so they follow init_worker()'s new runtime
+for _field in ('running', 'queued', 'rejected'):
+    REGISTRY.gauge('rag_runtime_requests', lambda field=_field: runtime.stats()[field],
+                   'Requests in the async runtime by state', state=_field)
+if __name__ != "__mp_main__":
+    REGISTRY.gauge('rag_answer_cache_entries', lambda: rag_search.answer_cache.stats()['entries'],
+                   'Answers held in the answer cache')
+    REGISTRY.gauge('rag_sessions', lambda: len(rag_search.sessions), 'Conversations held in the session store')
+    if rag_search.llm_gateway is not None:
+        for _state in ('closed', 'open', 'half_open'):
+            REGISTRY.gauge('rag_llm_circuit_state', lambda state=_state: float(rag_search.llm_gateway.breaker.state == state),
+                           'LLM circuit breaker state (1 for the current one)', state=_state)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    app.run(debug=True, port=5000, threaded=True)
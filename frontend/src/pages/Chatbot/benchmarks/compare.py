@@ -0,0 +1,54 @@
+import json
+import argparse
+from typing import Any, Dict
+
+# Metrics where a lower value is the improvement
+LOWER_IS_BETTER = ("latency_ms", "seconds", "_per_query", "recall_loss", "index_bytes", "tokenize_share",
+                  "max_score_difference")
+
+def flatten(value: Any, prefix: str = "") -> Dict[str, float]:
+    """
+    Numeric leaves of a results tree keyed by their dotted path
+    """
+    if isinstance(value, dict):
+        flat = {}
+        for key, child in value.items():
+            flat.update(flatten(child, f"{prefix}.{key}" if prefix else str(key)))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: float(value)}
+    return {}
+
+
+def load_results(path: str) -> Dict[str, float]:
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    flat = {}
+    for result in report["results"]:
+        flat.update(flatten(result, f"docs={result['corpus_documents']}"))
+    return flat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--filter", default="", help="Only metrics whose path contains this text, e.g. p95 or recall")
+    parser.add_argument("--threshold", type=float, default=5.0, help="Flag changes larger than this many percent")
+    args = parser.parse_args()
+
+    baseline, candidate = load_results(args.baseline), load_results(args.candidate)
+    for key in sorted(baseline.keys() & candidate.keys()):
+        if args.filter not in key or key.endswith(".count"):
+            continue
+        before, after = baseline[key], candidate[key]
+        change = (after - before) / abs(before) * 100 if before else 0.0
+        flag = ""
+        if abs(change) > args.threshold:
+            worse = change > 0 if any(part in key for part in LOWER_IS_BETTER) else change < 0
+            flag = "  <-- worse" if worse else "  <-- better"
+        print(f"{key:<70} {before:>12.3f} {after:>12.3f} {change:>+8.1f}%{flag}")
+
+
+if __name__ == "__main__":
+    main()
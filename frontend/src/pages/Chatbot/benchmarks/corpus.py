@@ -0,0 +1,101 @@
+import os
+import json
+import random
+from typing import Dict, List
+
+# Each fact names a made-up entity that appears nowhere else in the corpus, so
+# a chunk is relevant to a query exactly when it contains that entity's name
+FACT_TEMPLATES = [
+    ("The {name} club meets every {day} at {time} in room {room}.",
+     "When and where does the {name} club meet?"),
+    ("Registration for the {name} workshop closes on {date}; the fee is {fee} taka.",
+     "What is the registration deadline for the {name} workshop?"),
+    ("Professor {name} holds office hours on {day} in room {room} of the {building} building.",
+     "Where are Professor {name}'s office hours?"),
+    ("The {name} scholarship covers {percent} percent of tuition for students with a CGPA above {cgpa}.",
+     "How much tuition does the {name} scholarship cover?"),
+    ("The {name} festival takes place on {date} at the {building} auditorium and is organised by the {dept} department.",
+     "When is the {name} festival?"),
+    ("Course {code} ({name}) is taught by the {dept} department and has {credits} credit hours.",
+     "How many credits is the {name} course?"),
+]
+
+FILLER_SENTENCES = [
+    "Students are advised to check the notice board regularly for updates.",
+    "All campus facilities remain closed on public holidays unless announced otherwise.",
+    "The administration office is located on the ground floor of the main building.",
+    "Identity cards must be carried at all times inside the campus premises.",
+    "Late submissions are not accepted without prior approval from the department.",
+    "The central library offers quiet study rooms that can be booked online.",
+    "Hall residents must follow the visiting hours published by the provost office.",
+    "Semester results are published on the student portal after the examination committee meets.",
+    "Transport services run between the campus and the city centre on weekdays.",
+    "Clubs and societies recruit new members during the first two weeks of each semester.",
+]
+
+SYLLABLES = ["ka", "lo", "mi", "ren", "dus", "tor", "vel", "an", "qui", "zor", "bel", "ny", "sha", "pra", "gon", "tel"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+BUILDINGS = ["North", "South", "Academic", "Innovation", "Library", "Administrative"]
+DEPARTMENTS = ["CSE", "EEE", "MPE", "CEE", "BTM", "TVE"]
+
+def _unique_name(rng: random.Random, used: set) -> str:
+    while True:
+        name = "".join(rng.choice(SYLLABLES) for _ in range(3)).capitalize()
+        if name not in used:
+            used.add(name)
+            return name
+
+
+def _fill(template: str, name: str, rng: random.Random) -> str:
+    return template.format(
+        name=name,
+        day=rng.choice(DAYS),
+        time=f"{rng.randint(8, 17)}:{rng.choice(['00', '30'])}",
+        room=f"{rng.choice('ABCDE')}-{rng.randint(100, 499)}",
+        date=f"{rng.randint(1, 28)} {rng.choice(['January', 'March', 'May', 'August', 'October', 'December'])}",
+        fee=rng.randint(2, 40) * 50,
+        building=rng.choice(BUILDINGS),
+        percent=rng.choice([25, 50, 75, 100]),
+        cgpa=rng.choice(["3.50", "3.75", "3.90"]),
+        dept=rng.choice(DEPARTMENTS),
+        code=f"{rng.choice(DEPARTMENTS)}{rng.randint(4100, 4899)}",
+        credits=rng.choice([1.5, 3, 4]),
+    )
+
+
+def generate_corpus(out_dir: str, num_docs: int, facts_per_doc: int = 4, filler_per_fact: int = 6,
+                    seed: int = 0) -> List[Dict[str, str]]:
+    """
+    Write num_docs synthetic campus notices as .txt files into out_dir and
+    return the labelled query set.
+
+    Every fact gets its own paragraph padded with filler sentences, so document
+    length (and the number of chunks) grows with facts_per_doc and filler_per_fact.
+
+    Returns:
+        One {"query", "evidence", "source"} dict per fact; a retrieved chunk is
+        relevant if it contains the evidence string
+    """
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    used_names: set = set()
+    queries = []
+    for doc_number in range(num_docs):
+        file_name = f"notice_{doc_number:05d}.txt"
+        paragraphs = []
+        for _ in range(facts_per_doc):
+            name = _unique_name(rng, used_names)
+            fact_template, query_template = rng.choice(FACT_TEMPLATES)
+            filler = rng.sample(FILLER_SENTENCES, min(filler_per_fact, len(FILLER_SENTENCES)))
+            position = rng.randint(0, len(filler))
+            paragraphs.append(" ".join(filler[:position] + [_fill(fact_template, name, rng)] + filler[position:]))
+            queries.append({"query": query_template.format(name=name), "evidence": name, "source": file_name})
+        with open(os.path.join(out_dir, file_name), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(paragraphs))
+    return queries
+
+
+def save_queries(queries: List[Dict[str, str]], path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        for query in queries:
+            f.write(json.dumps(query) + "\n")
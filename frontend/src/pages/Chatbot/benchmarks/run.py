@@ -0,0 +1,385 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from benchmarks.corpus import generate_corpus
+from benchmarks.stub_llm import StubLLM
+from src.dataloader import load_all_documents
+from src.embedding import EmbeddingPipeline
+from src.search import RAGSearch
+from src.metrics import REGISTRY
+from src.retrieval_policy import RetrievalPolicy, POLICY_MODES
+from src.faiss_store import INDEX_TYPES
+from src.token_store import ChunkTokenStore
+
+QUERY_STAGES = ("preprocess", "embed", "retrieve", "rerank", "prompt", "generate")
+
+def latency_summary(seconds: Sequence[float]) -> Dict[str, float]:
+    """
+    Percentiles of a list of durations, in milliseconds
+    """
+    if not seconds:
+        return {"count": 0}
+    ms = np.asarray(seconds) * 1000.0
+    return {
+        "count": len(ms),
+        "mean": float(ms.mean()),
+        "p50": float(np.percentile(ms, 50)),
+        "p90": float(np.percentile(ms, 90)),
+        "p95": float(np.percentile(ms, 95)),
+        "p99": float(np.percentile(ms, 99)),
+        "max": float(ms.max()),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_ingestion(rag_search: RAGSearch, data_dir: str, args) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Time the four ingestion stages on a fresh store. No embedding cache is
+    used, so every chunk is encoded. Returns the report and the chunk texts.
+    """
+    seconds = {}
+    started = time.perf_counter()
+    documents = load_all_documents(data_dir)
+    seconds["load_all_documents"] = time.perf_counter() - started
+
+    # Filling an extraction cache, then loading again from it (what a re-chunking rebuild pays)
+    cache_dir = tempfile.mkdtemp(prefix="rag-extraction-cache-")
+    extraction = {}
+    for stage in ("fill", "hit"):
+        started = time.perf_counter()
+        load_all_documents(data_dir, cache_dir=cache_dir)
+        extraction[f"{stage}_seconds"] = time.perf_counter() - started
+    extraction["speedup"] = seconds["load_all_documents"] / max(extraction["hit_seconds"], 1e-9)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    pipeline = EmbeddingPipeline(model_name=args.embedding_model, chunk_size=args.chunk_size,
+                                 chunk_overlap=args.chunk_overlap, backend=args.inference_backend)
+    started = time.perf_counter()
+    chunks = pipeline.chunk_documents(documents)
+    seconds["chunk_documents"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    embeddings = pipeline.embed_chunks(chunks)
+    seconds["embed_chunks"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    rag_search.vectorstore.add_documents(chunks, embeddings)
+    seconds["add_documents"] = time.perf_counter() - started
+
+    total = sum(seconds.values())
+    report = {
+        "documents": len(documents),
+        "chunks": len(chunks),
+        "seconds": {**seconds, "total": total},
+        "extraction_cache": extraction,
+        "throughput": {
+            "documents_loaded_per_s": len(documents) / max(seconds["load_all_documents"], 1e-9),
+            "documents_chunked_per_s": len(documents) / max(seconds["chunk_documents"], 1e-9),
+            "chunks_embedded_per_s": len(chunks) / max(seconds["embed_chunks"], 1e-9),
+            "chunks_added_per_s": len(chunks) / max(seconds["add_documents"], 1e-9),
+            "chunks_per_s": len(chunks) / max(total, 1e-9),
+        },
+    }
+    return report, [chunk.page_content for chunk in chunks]
+
+
+def run_query(rag_search: RAGSearch, query: str, top_k: int) -> Tuple[Dict[str, float], List[Dict], List[Dict]]:
+    """
+    One query through the same stages as RAGSearch.ask, timed separately.
+    Returns (stage seconds, first-stage candidates, re-ranked documents).
+    """
+    timings = {}
+    started = time.perf_counter()
+    processed_query = rag_search.query_preprocessor.preprocess(query)
+    timings["preprocess"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    query_embedding, variations = rag_search.embed(query, processed_query)
+    timings["embed"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    candidates = rag_search.retrieve(processed_query, query_embedding, top_k, variations)
+    timings["retrieve"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    reranked = rag_search.rerank(processed_query, candidates, top_k)
+    timings["rerank"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    prepared = rag_search.build_prompt(query, processed_query, reranked)
+    timings["prompt"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if prepared["prompt"] is not None:
+        rag_search.llm.invoke(prepared["prompt"])
+    timings["generate"] = time.perf_counter() - started
+    timings["total"] = sum(timings.values())
+    return timings, candidates, reranked
+
+
+def benchmark_queries(rag_search: RAGSearch, queries: List[str], top_k: int, concurrency: int) -> Dict[str, Any]:
+    """
+    Run queries on `concurrency` threads and summarise per-stage latencies
+    and throughput
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda query: run_query(rag_search, query, top_k)[0], queries))
+    wall = time.perf_counter() - started
+    return {
+        "queries": len(queries),
+        "queries_per_s": len(queries) / max(wall, 1e-9),
+        "latency_ms": {stage: latency_summary([timings[stage] for timings in results])
+                       for stage in QUERY_STAGES + ("total",)},
+    }
+
+
+def ranking_quality(ranked: List[List[Dict]], labels: List[Dict[str, str]], relevant_counts: List[int],
+                    ks: Sequence[int]) -> Dict[str, float]:
+    """
+    recall@k (share of each query's relevant chunks in its top k) and MRR,
+    averaged over queries. A chunk is relevant if it contains the label's evidence.
+    """
+    recalls = {k: [] for k in ks}
+    reciprocal_ranks = []
+    for docs, label, relevant_count in zip(ranked, labels, relevant_counts):
+        hits = [label["evidence"] in doc["content"] for doc in docs]
+        for k in ks:
+            recalls[k].append(sum(hits[:k]) / relevant_count)
+        reciprocal_ranks.append(1.0 / (hits.index(True) + 1) if True in hits else 0.0)
+    report = {f"recall@{k}": float(np.mean(values)) for k, values in recalls.items()}
+    report["mrr"] = float(np.mean(reciprocal_ranks))
+    return report
+
+
+def benchmark_rerank_tokenization(rag_search: RAGSearch, queries: List[str], chunk_texts: List[str], args,
+                                  store_dir: str) -> Dict[str, Any]:
+    """
+    Re-ranking latency with every pair tokenized per request (CrossEncoder.predict)
+    and with chunk token ids read from a ChunkTokenStore, and the share of each
+    spent preparing the model input. Each query is scored against as many random
+    chunks as the retrieval policy retrieves for re-ranking.
+    """
+    reranker = rag_search.reranker
+    tokenizer = reranker.model.tokenizer
+    store = ChunkTokenStore(store_dir, args.reranker_model)
+    started = time.perf_counter()
+    store.add(chunk_texts)
+    index_seconds = time.perf_counter() - started
+
+    rng = random.Random(args.seed)
+    timings: Dict[str, List[float]] = {name: [] for name in ("before_tokenize", "before_total", "after_tokenize", "after_total")}
+    max_difference = 0.0
+    previous_store = reranker.token_store
+    try:
+        for query in queries:
+            pairs = [[query, text] for text in rng.sample(chunk_texts, min(rag_search.candidate_k(args.top_k), len(chunk_texts)))]
+            # What CrossEncoder.predict does before the forward pass
+            started = time.perf_counter()
+            tokenizer([q for q, _ in pairs], [d for _, d in pairs], padding=True, truncation="longest_first",
+                      max_length=tokenizer.model_max_length, return_tensors="pt")
+            timings["before_tokenize"].append(time.perf_counter() - started)
+            reranker.token_store = None
+            started = time.perf_counter()
+            expected = reranker.predict(pairs, batch_size=len(pairs))
+            timings["before_total"].append(time.perf_counter() - started)
+
+            reranker.token_store = store
+            started = time.perf_counter()
+            reranker._pretokenized(pairs)
+            timings["after_tokenize"].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            scores = reranker.predict(pairs, batch_size=len(pairs))
+            timings["after_total"].append(time.perf_counter() - started)
+            max_difference = max(max_difference, float(np.abs(np.asarray(scores) - np.asarray(expected)).max()))
+    finally:
+        reranker.token_store = previous_store
+
+    def share(stage: str) -> float:
+        return sum(timings[f"{stage}_tokenize"]) / max(sum(timings[f"{stage}_total"]), 1e-9)
+
+    return {
+        "queries": len(queries),
+        "pairs_per_query": min(rag_search.candidate_k(args.top_k), len(chunk_texts)),
+        "index_seconds": index_seconds,
+        "latency_ms": {name: latency_summary(values) for name, values in timings.items()},
+        "tokenize_share": {"before": share("before"), "after": share("after")},
+        "max_score_difference": max_difference,
+    }
+
+
+def benchmark_quality(rag_search: RAGSearch, labels: List[Dict[str, str]], chunk_texts: List[str], top_k: int) -> Dict[str, Any]:
+    # Queries whose evidence got lost in chunking (should not happen) have no relevant chunk to find
+    relevant_counts = [sum(label["evidence"] in text for text in chunk_texts) for label in labels]
+    labelled = [(label, count) for label, count in zip(labels, relevant_counts) if count]
+    labels = [label for label, _ in labelled]
+    relevant_counts = [count for _, count in labelled]
+
+    pairs = REGISTRY.counter("rag_rerank_pairs_total")
+    pairs_before = pairs.value()
+    candidates, reranked = [], []
+    for label in labels:
+        _, first_stage, final = run_query(rag_search, label["query"], top_k)
+        candidates.append(first_stage)
+        reranked.append(final)
+    candidate_k = rag_search.candidate_k(top_k)
+    return {
+        "queries": len(labels),
+        # What the retrieval policy sends on: candidates kept and cross-encoder pairs scored
+        "candidates_per_query": float(np.mean([len(docs) for docs in candidates])),
+        "reranked_pairs_per_query": (pairs.value() - pairs_before) / max(len(labels), 1),
+        "retrieval": ranking_quality(candidates, labels, relevant_counts, sorted({1, 3, top_k, candidate_k})),
+        "reranked": ranking_quality(reranked, labels, relevant_counts, sorted({1, 3, top_k})),
+    }
+
+
+def benchmark_corpus_size(num_docs: int, args, work_dir: str) -> Dict[str, Any]:
+    data_dir = os.path.join(work_dir, f"corpus_{num_docs}")
+    labels = generate_corpus(data_dir, num_docs, facts_per_doc=args.facts_per_doc, seed=args.seed)
+    rag_search = RAGSearch(
+        persist_dir=os.path.join(work_dir, f"store_{num_docs}"),
+        data_dir=data_dir,
+        vector_backend=args.vector_backend,
+        faiss_index_type=args.faiss_index_type,
+        embedding_model=args.embedding_model,
+        reranker_model=args.reranker_model,
+        retrieval_mode=args.retrieval_mode,
+        retrieval_policy=RetrievalPolicy(mode=args.retrieval_policy),
+        multi_query=args.multi_query,
+        rerank_token_cache=args.rerank_token_cache,
+        inference_backend=args.inference_backend,
+        micro_batching=args.micro_batching,
+        cache_size=0,  # Every query runs the whole pipeline
+        lazy_startup=True,
+        llm=StubLLM(latency_seconds=args.llm_latency_ms / 1000.0),
+    )
+    print(f"[INFO] Benchmarking {num_docs} documents ({len(labels)} labelled queries)")
+    # Model loading is a startup cost, not part of ingestion or query latency
+    rag_search.vectorstore.model
+    rag_search.reranker.model
+    ingestion, chunk_texts = benchmark_ingestion(rag_search, data_dir, args)
+
+    rng = random.Random(args.seed)
+    sample = rng.sample(labels, min(args.queries, len(labels)))
+    # Touch every query code path once before anything is timed
+    for label in sample[:3]:
+        run_query(rag_search, label["query"], args.top_k)
+
+    query_texts = [label["query"] for label in sample]
+    # Enough queries per level that every worker thread stays busy
+    repeats = max(1, -(-max(args.concurrency) * 4 // len(query_texts)))
+    latency = {str(level): benchmark_queries(rag_search, query_texts * repeats, args.top_k, level)
+               for level in args.concurrency}
+    result = {
+        "corpus_documents": num_docs,
+        "ingestion": ingestion,
+        "query": latency,
+        "quality": benchmark_quality(rag_search, sample, chunk_texts, args.top_k),
+        "rerank_tokenization": benchmark_rerank_tokenization(rag_search, query_texts, chunk_texts, args,
+                                                             os.path.join(work_dir, f"tokens_{num_docs}")),
+    }
+    if args.vector_backend == "faiss":
+        # First-stage recall of the index against exact search, over the candidates the re-ranker would see
+        processed = [rag_search.query_preprocessor.preprocess(query) for query in query_texts]
+        result["index"] = rag_search.vectorstore.measure_recall(k=rag_search.candidate_k(args.top_k),
+                                                                queries=rag_search.vectorstore.embed_queries(processed))
+    return result
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the RAG pipeline")
+    parser.add_argument("--sizes", type=_int_list, default=[20, 100], help="Corpus sizes in documents, comma separated")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4], help="Query threads, comma separated")
+    parser.add_argument("--queries", type=int, default=50, help="Labelled queries sampled per corpus size")
+    parser.add_argument("--facts-per-doc", type=int, default=4)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--embedding-model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--reranker-model", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    parser.add_argument("--vector-backend", default="chroma", choices=["chroma", "faiss"])
+    parser.add_argument("--faiss-index-type", default="hnsw", choices=INDEX_TYPES)
+    parser.add_argument("--retrieval-mode", default="hybrid", choices=["dense", "hybrid"])
+    parser.add_argument("--retrieval-policy", default="fixed", choices=POLICY_MODES)
+    parser.add_argument("--multi-query", action="store_true", help="Retrieve for query rephrasings too")
+    parser.add_argument("--rerank-token-cache", action="store_true", help="Re-rank from index-time chunk token ids")
+    parser.add_argument("--inference-backend", default="torch")
+    parser.add_argument("--micro-batching", action="store_true")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Simulated LLM latency per call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<time>_<commit>.json)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated corpora and stores")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    started_at = datetime.now(timezone.utc)
+    work_dir = tempfile.mkdtemp(prefix="rag-benchmark-")
+    try:
+        results = [benchmark_corpus_size(num_docs, args, work_dir) for num_docs in args.sizes]
+    finally:
+        if args.keep:
+            print(f"[INFO] Benchmark data kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": commit,
+            "started_at": started_at.isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": vars(args),
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join("benchmarks", "results",
+                                          f"{started_at:%Y%m%d-%H%M%S}_{commit or 'nocommit'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for result in results:
+        print(f"\n{result['corpus_documents']} documents, {result['ingestion']['chunks']} chunks")
+        print(f"  ingestion: {result['ingestion']['throughput']['chunks_per_s']:.1f} chunks/s")
+        for level, stats in result["query"].items():
+            total = stats["latency_ms"]["total"]
+            print(f"  concurrency {level}: {stats['queries_per_s']:.1f} q/s, p50 {total['p50']:.1f} ms, p95 {total['p95']:.1f} ms")
+        quality = result["quality"]
+        print(f"  retrieval: {quality['retrieval']}  reranked: {quality['reranked']}")
+        tokenization = result["rerank_tokenization"]
+        latency = tokenization["latency_ms"]
+        print(f"  rerank of {tokenization['pairs_per_query']} pairs: p50 {latency['before_total']['p50']:.1f} ms "
+              f"({tokenization['tokenize_share']['before']:.0%} tokenizing) -> {latency['after_total']['p50']:.1f} ms "
+              f"({tokenization['tokenize_share']['after']:.0%}) with stored chunk token ids")
+        if "index" in result:
+            index = result["index"]
+            print(f"  {index['index_type']} index: recall@{index['k']} {index['recall_at_k']:.3f} vs exact, "
+                  f"{index['index_bytes'] / 2 ** 20:.1f} MiB ({index['compression']:.1f}x smaller than float32)")
+    print(f"\n[INFO] Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
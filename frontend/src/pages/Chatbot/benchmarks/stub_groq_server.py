@@ -0,0 +1,198 @@
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+class FaultConfig:
+    """
+    What the stub does to each request; changed at runtime through POST /control
+    """
+
+    FIELDS = {"latency_ms": float, "jitter_ms": float, "slow_rate": float, "slow_ms": float,
+              "error_rate": float, "rate_limit_rate": float, "retry_after": float, "down": bool,
+              "slow_next": int, "rate_limit_next": int}
+
+    def __init__(self, **values):
+        self.latency_ms = 50.0
+        self.jitter_ms = 0.0
+        self.slow_rate = 0.0  # Share of requests that take slow_ms instead (tail latency)
+        self.slow_ms = 2000.0
+        self.error_rate = 0.0  # Share answered with 500
+        self.rate_limit_rate = 0.0  # Share answered with 429
+        self.retry_after = 1.0
+        self.down = False  # Every request gets 503
+        # Deterministic faults for tests: the next N requests are slow / answered with 429
+        self.slow_next = 0
+        self.rate_limit_next = 0
+        self.update(values)
+        self.counts = {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0}
+        self.lock = threading.Lock()
+
+    def update(self, values: Dict[str, Any]):
+        for name, value in values.items():
+            if name in self.FIELDS and value is not None:
+                setattr(self, name, self.FIELDS[name](value))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+def _answer(messages: list) -> str:
+    prompt = messages[-1].get("content", "") if messages else ""
+    question = prompt.rsplit("STUDENT QUESTION:", 1)[-1].split("DETAILED ANSWER:")[0].strip()
+    return f"Stub answer to: {question}"
+
+
+def make_handler(faults: FaultConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, so connection pooling is exercised
+
+        def log_message(self, format, *args):
+            pass
+
+        def handle(self):
+            try:
+                super().handle()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Client gave up, e.g. the losing request of a hedge was cancelled
+
+        def _json(self, status: int, body: Dict[str, Any], headers: Dict[str, str] = None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _read_body(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            if self.path == "/control":
+                with faults.lock:
+                    self._json(200, {**faults.as_dict(), "counts": dict(faults.counts)})
+            else:
+                self._json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            body = self._read_body()
+            if self.path == "/control":
+                with faults.lock:
+                    faults.update(body)
+                self._json(200, faults.as_dict())
+                return
+            if self.path.rstrip("/") != "/openai/v1/chat/completions":
+                self._json(404, {"error": {"message": "not found"}})
+                return
+
+            roll = random.random()
+            with faults.lock:
+                faults.counts["requests"] += 1
+                down, error = faults.down, roll < faults.error_rate
+                limited = not (down or error) and (faults.rate_limit_next > 0 or
+                                                   roll < faults.error_rate + faults.rate_limit_rate)
+                if limited and faults.rate_limit_next > 0:
+                    faults.rate_limit_next -= 1
+                slow = not (down or error or limited) and (faults.slow_next > 0 or random.random() < faults.slow_rate)
+                if slow and faults.slow_next > 0:
+                    faults.slow_next -= 1
+                delay = (faults.slow_ms if slow else faults.latency_ms + random.uniform(0, faults.jitter_ms)) / 1000.0
+                retry_after = faults.retry_after
+            if down or error:
+                with faults.lock:
+                    faults.counts["errors"] += 1
+                self._json(503 if down else 500, {"error": {"message": "injected failure", "type": "internal_server_error"}})
+                return
+            if limited:
+                with faults.lock:
+                    faults.counts["rate_limited"] += 1
+                self._json(429, {"error": {"message": "injected rate limit", "type": "rate_limit_exceeded"}},
+                           {"retry-after": f"{retry_after:g}"})
+                return
+
+            time.sleep(delay)
+            answer = _answer(body.get("messages", []))
+            prompt_tokens = sum(len(m.get("content", "")) // 4 for m in body.get("messages", []))
+            completion_tokens = len(answer.split())
+            with faults.lock:
+                faults.counts["ok"] += 1
+            if body.get("stream"):
+                self._stream(body.get("model", "stub"), answer, prompt_tokens, completion_tokens)
+                return
+            self._json(200, {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+
+        def _stream(self, model: str, answer: str, prompt_tokens: int, completion_tokens: int):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def send(data: str):
+                payload = f"data: {data}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+
+            words = answer.split()
+            for i, word in enumerate(words):
+                chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model, "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word},
+                                                      "finish_reason": None}]}
+                send(json.dumps(chunk))
+            final = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                     "x_groq": {"usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                          "total_tokens": prompt_tokens + completion_tokens}}}
+            send(json.dumps(final))
+            send("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8900, **faults) -> ThreadingHTTPServer:
+    """
+    Start the stub in a background thread and return the server (call shutdown() to stop)
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(FaultConfig(**faults)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-groq", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Local Groq-compatible chat completions server with injectable latency and errors. "
+                    "Point the app at it with GROQ_BASE_URL=http://127.0.0.1:8900; change faults at runtime "
+                    "with e.g. curl -X POST localhost:8900/control -d '{\"down\": true}'"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of requests that take --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=2000.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(FaultConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, slow_rate=args.slow_rate, slow_ms=args.slow_ms,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after
+    )))
+    server.daemon_threads = True
+    print(f"[INFO] Stub Groq API on http://{args.host}:{args.port}")
+    server.serve_forever()
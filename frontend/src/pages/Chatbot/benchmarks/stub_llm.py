@@ -0,0 +1,42 @@
+import time
+import asyncio
+from types import SimpleNamespace
+from typing import AsyncIterator
+
+class StubLLM:
+    """
+    Offline stand-in for ChatGroq with the three methods RAGSearch calls.
+    Sleeps latency_seconds per call (spread over the tokens when streaming) and
+    answers with the first words of the prompt's question, so benchmarks
+    measure the pipeline rather than the network.
+    """
+
+    def __init__(self, latency_seconds: float = 0.0, answer_tokens: int = 20):
+        self.latency_seconds = latency_seconds
+        self.answer_tokens = answer_tokens
+        self.calls = 0
+
+    def _answer(self, prompt: str) -> str:
+        question = prompt.rsplit("STUDENT QUESTION:", 1)[-1].split("DETAILED ANSWER:")[0].strip()
+        words = (f"Stub answer to: {question} " * self.answer_tokens).split()
+        return " ".join(words[:self.answer_tokens])
+
+    def invoke(self, prompt: str):
+        self.calls += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return SimpleNamespace(content=self._answer(prompt))
+
+    async def ainvoke(self, prompt: str):
+        self.calls += 1
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return SimpleNamespace(content=self._answer(prompt))
+
+    async def astream(self, prompt: str) -> AsyncIterator[SimpleNamespace]:
+        self.calls += 1
+        words = self._answer(prompt).split()
+        for i, word in enumerate(words):
+            if self.latency_seconds:
+                await asyncio.sleep(self.latency_seconds / len(words))
+            yield SimpleNamespace(content=word if i == 0 else " " + word)
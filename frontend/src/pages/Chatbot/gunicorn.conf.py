@@ -0,0 +1,44 @@
+"""
+Pre-fork serving: gunicorn -c gunicorn.conf.py
+
+The master imports app.py once (preload_app), which loads the embedding model
+and cross-encoder and memory-maps the published FAISS snapshot read-only.
+Workers are forked from it and share those pages copy-on-write, so N workers
+cost roughly the memory of one. The index itself is written by a single
+separate process:
+
+    python -m src.index_writer --watch 30
+"""
+import os
+import sys
+import gc
+
+# Workers only read the index; the writer process publishes new snapshots they pick up
+os.environ.setdefault("VECTOR_BACKEND", "faiss")
+os.environ.setdefault("INDEX_ROLE", "reader")
+# Load every model in the master so the workers inherit them instead of loading their own
+os.environ.setdefault("STARTUP_MODE", "eager")
+
+wsgi_app = "app:app"
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+# Each worker serves requests on threads; they share its event loop and micro-batchers
+worker_class = "gthread"
+threads = int(os.getenv("WORKER_THREADS", "8"))
+preload_app = True
+# Answers can take a while to generate; REQUEST_TIMEOUT_SECONDS bounds them inside the app
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's reach: a collection in
+    # a worker would otherwise write to every object header and un-share the pages
+    gc.freeze()
+    server.log.info(f"Pre-forked app loaded; {gc.get_freeze_count()} objects frozen")
+
+
+def post_fork(server, worker):
+    # Each worker gets a slice of the cores instead of every worker using all of them
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(int(os.getenv("TORCH_THREADS", "1")))
+    sys.modules["app"].init_worker()
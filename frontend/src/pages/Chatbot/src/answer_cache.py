@@ -0,0 +1,132 @@
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+class AnswerCache:
+    """
+    Two-tier cache of RAG answers.
+
+    Tier 1 matches the preprocessed query string exactly. Tier 2 matches the
+    query embedding against cached query embeddings by cosine similarity.
+    Both tiers share one LRU order and TTL, and the whole cache is dropped
+    when a lookup sees a newer vector store version than it was filled against.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, similarity_threshold: float = 0.95):
+        """
+        Args:
+            max_entries: Maximum cached answers; least recently used are evicted first
+            ttl_seconds: Lifetime of an entry
+            similarity_threshold: Minimum cosine similarity for a semantic hit
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._store_version: Any = None
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: list = []
+        self._lock = threading.Lock()
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _check_version(self, store_version: Any):
+        if store_version != self._store_version:
+            if self._entries:
+                self.counters["invalidations"] += 1
+            self._entries.clear()
+            self._matrix = None
+            self._store_version = store_version
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if entry["expires_at"] <= now]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def get_exact(self, key: str, store_version: Any) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._check_version(store_version)
+            entry = self._entries.get(key)
+            if entry is None or entry["expires_at"] <= time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            self.counters["exact_hits"] += 1
+            return entry["result"]
+
+    def get_semantic(self, embedding: np.ndarray, store_version: Any, tag: Any = None) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached answer whose query embedding is most similar to this one,
+        if the similarity reaches the threshold. Counts a miss otherwise.
+        Only entries stored with the same tag (e.g. top_k) are considered.
+        """
+        with self._lock:
+            self._check_version(store_version)
+            self._expire(time.monotonic())
+            if not self._entries:
+                self.counters["misses"] += 1
+                return None
+
+            if self._matrix is None:
+                # Rebuilt only after inserts/evictions; lookups reuse the stacked matrix
+                self._matrix_keys = list(self._entries)
+                self._matrix = np.stack([self._entries[key]["embedding"] for key in self._matrix_keys])
+
+            query = _normalize(embedding)
+            similarities = self._matrix @ query
+            for i, key in enumerate(self._matrix_keys):
+                if self._entries[key]["tag"] != tag:
+                    similarities[i] = -1.0
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self.counters["misses"] += 1
+                return None
+
+            key = self._matrix_keys[best]
+            self._entries.move_to_end(key)
+            self.counters["semantic_hits"] += 1
+            return self._entries[key]["result"]
+
+    def put(self, key: str, embedding: np.ndarray, result: Dict[str, Any], store_version: Any, tag: Any = None):
+        """
+        Store an answer computed against store_version. Only lookups advance the
+        version: an answer from a request that started before the store changed
+        is dropped instead of wiping the entries stored since.
+        """
+        with self._lock:
+            if store_version != self._store_version:
+                return
+            self._entries[key] = {
+                "result": result,
+                "tag": tag,
+                "embedding": _normalize(embedding),
+                "expires_at": time.monotonic() + self.ttl_seconds,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.counters["exact_hits"] + self.counters["semantic_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+
+def _normalize(embedding: np.ndarray) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
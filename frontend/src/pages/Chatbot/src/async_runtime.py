@@ -0,0 +1,141 @@
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional
+
+class ServerBusyError(Exception):
+    """
+    Raised when the request queue is full. retry_after is the suggested
+    Retry-After value in seconds.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__("Too many requests in flight")
+        self.retry_after = retry_after
+
+
+class AsyncRuntime:
+    """
+    Runs request coroutines on one persistent event loop in a background thread.
+
+    A single long-lived loop lets every request share the async Groq HTTP
+    client and its connection pool. At most max_concurrent coroutines run at
+    once; up to max_queue more wait for a slot, and anything beyond that is
+    rejected immediately with ServerBusyError instead of piling up.
+    """
+
+    def __init__(self, max_concurrent: int = 32, max_queue: int = 64, retry_after: int = 2):
+        """
+        Args:
+            max_concurrent: Requests processed concurrently
+            max_queue: Requests allowed to wait for a slot before new ones are rejected
+            retry_after: Seconds suggested to rejected clients
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.loop = asyncio.new_event_loop()
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._admitted = 0
+        self._running = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run_loop, name="rag-async-loop", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _release(self, _future: Future):
+        with self._lock:
+            self._admitted -= 1
+
+    async def _guarded(self, coro_factory: Callable[[], Awaitable[Any]]) -> Any:
+        async with self._semaphore:
+            with self._lock:
+                self._running += 1
+            try:
+                return await coro_factory()
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+    def submit(self, coro_factory: Callable[[], Awaitable[Any]]) -> Future:
+        """
+        Schedule coro_factory() on the loop and return a concurrent Future.
+        A factory is taken rather than a coroutine so rejected requests never
+        create a coroutine that is left un-awaited.
+        Raises ServerBusyError when the queue is full.
+        """
+        with self._lock:
+            if self._admitted >= self.max_concurrent + self.max_queue:
+                self._rejected += 1
+                raise ServerBusyError(self.retry_after)
+            self._admitted += 1
+        future = asyncio.run_coroutine_threadsafe(self._guarded(coro_factory), self.loop)
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, coro_factory: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """
+        Submit and wait for the result from a synchronous caller (e.g. a Flask view).
+        """
+        future = self.submit(coro_factory)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def stream(self, agen_factory: Callable[[], AsyncIterator[Any]], timeout: Optional[float] = None) -> Iterator[Any]:
+        """
+        Run an async generator on the loop and return a synchronous iterator over
+        its items, for streaming responses from a synchronous caller.
+        Admission is checked immediately (ServerBusyError); closing the iterator
+        early (client disconnect) cancels the generator.
+
+        Args:
+            agen_factory: Returns the async generator to run
+            timeout: Longest wait for the next item before raising FutureTimeoutError
+        """
+        items: "queue.Queue" = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in agen_factory():
+                    items.put(("item", item))
+            except Exception as e:
+                items.put(("error", e))
+            finally:
+                items.put(("done", None))
+
+        future = self.submit(pump)
+
+        def iterate():
+            try:
+                while True:
+                    try:
+                        kind, value = items.get(timeout=timeout)
+                    except queue.Empty:
+                        raise FutureTimeoutError()
+                    if kind == "done":
+                        return
+                    if kind == "error":
+                        raise value
+                    yield value
+            finally:
+                future.cancel()
+
+        return iterate()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "running": self._running,
+                "queued": self._admitted - self._running,
+                "rejected": self._rejected,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+            }
@@ -0,0 +1,139 @@
+import sys
+import time
+import argparse
+import numpy as np
+import chromadb
+from chromadb.config import Settings
+from typing import List, Dict
+from src.models import INFERENCE_BACKENDS, load_embedding_model, load_cross_encoder
+
+SAMPLE_QUERIES = [
+    "When does the library open on weekends?",
+    "What is the deadline for course registration?",
+    "How do I join a student club?",
+    "Where is the examination hall?",
+    "What are the tuition fees for undergraduate students?",
+    "Who is the head of the computer science department?",
+    "When are the final exams this semester?",
+    "How can I apply for a scholarship?",
+    "What events are happening on campus this month?",
+    "What are the hostel rules for visitors?",
+]
+
+def _rank_correlation(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Spearman correlation: Pearson correlation of the ranks
+    """
+    if len(a) < 2:
+        return 1.0
+    ranks_a = np.argsort(np.argsort(a))
+    ranks_b = np.argsort(np.argsort(b))
+    return float(np.corrcoef(ranks_a, ranks_b)[0, 1])
+
+
+def _top_k_overlap(a: np.ndarray, b: np.ndarray, k: int) -> float:
+    k = min(k, len(a))
+    return len(set(np.argsort(-a)[:k]) & set(np.argsort(-b)[:k])) / k if k else 1.0
+
+
+def load_sample_corpus(persist_dir: str, collection_name: str, limit: int) -> List[str]:
+    client = chromadb.PersistentClient(path=persist_dir, settings=Settings(anonymized_telemetry=False))
+    collection = client.get_collection(collection_name)
+    return collection.get(include=["documents"], limit=limit)["documents"]
+
+
+def compare_embedding_backends(model_name: str, backend: str, queries: List[str], corpus: List[str], top_k: int) -> Dict:
+    """
+    Retrieve from corpus with the PyTorch model and with backend, and compare
+    the rankings per query.
+    """
+    results = {}
+    for name in ("torch", backend):
+        model = load_embedding_model(model_name, backend=name)
+        start = time.perf_counter()
+        doc_embeddings = model.encode(corpus, normalize_embeddings=True, show_progress_bar=False)
+        elapsed = time.perf_counter() - start
+        query_embeddings = model.encode(queries, normalize_embeddings=True, show_progress_bar=False)
+        results[name] = {"scores": query_embeddings @ doc_embeddings.T, "seconds": elapsed}
+
+    reference, candidate = results["torch"]["scores"], results[backend]["scores"]
+    return {
+        "top_k_overlap": float(np.mean([_top_k_overlap(r, c, top_k) for r, c in zip(reference, candidate)])),
+        "score_correlation": float(np.mean([_rank_correlation(r, c) for r, c in zip(reference, candidate)])),
+        "max_score_delta": float(np.max(np.abs(reference - candidate))),
+        "speedup": results["torch"]["seconds"] / max(results[backend]["seconds"], 1e-9),
+        "reference_scores": reference,
+    }
+
+
+def compare_reranker_backends(model_name: str, backend: str, queries: List[str], corpus: List[str],
+                              dense_scores: np.ndarray, candidates: int, top_k: int) -> Dict:
+    """
+    Re-rank the same dense candidates per query with both backends and compare
+    the resulting orders.
+    """
+    pairs_per_query = []
+    for query, scores in zip(queries, dense_scores):
+        candidate_ids = np.argsort(-scores)[:candidates]
+        pairs_per_query.append([[query, corpus[i]] for i in candidate_ids])
+
+    results = {}
+    for name in ("torch", backend):
+        model = load_cross_encoder(model_name, backend=name)
+        start = time.perf_counter()
+        scores = [np.asarray(model.predict(pairs, show_progress_bar=False)) for pairs in pairs_per_query]
+        results[name] = {"scores": scores, "seconds": time.perf_counter() - start}
+
+    reference, candidate = results["torch"]["scores"], results[backend]["scores"]
+    return {
+        "top_k_overlap": float(np.mean([_top_k_overlap(r, c, top_k) for r, c in zip(reference, candidate)])),
+        "score_correlation": float(np.mean([_rank_correlation(r, c) for r, c in zip(reference, candidate)])),
+        "max_score_delta": float(max(np.max(np.abs(r - c)) for r, c in zip(reference, candidate))),
+        "speedup": results["torch"]["seconds"] / max(results[backend]["seconds"], 1e-9),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a quantized/ONNX inference backend against the PyTorch models")
+    parser.add_argument("--backend", default="onnx-int8", choices=[b for b in INFERENCE_BACKENDS if b != "torch"])
+    parser.add_argument("--persist-dir", default="./data/vector_store")
+    parser.add_argument("--collection", default="pdf_documents")
+    parser.add_argument("--queries", help="File with one query per line (default: built-in campus questions)")
+    parser.add_argument("--corpus-size", type=int, default=500, help="Stored chunks to retrieve from")
+    parser.add_argument("--embedding-model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--reranker-model", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=15, help="Dense candidates re-ranked per query")
+    parser.add_argument("--min-overlap", type=float, default=0.8, help="Fail if mean top-k overlap is lower")
+    args = parser.parse_args()
+
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = SAMPLE_QUERIES
+    corpus = load_sample_corpus(args.persist_dir, args.collection, args.corpus_size)
+    if not corpus:
+        print(f"[ERROR] No documents in {args.persist_dir}; build the vector store first")
+        sys.exit(1)
+    print(f"[INFO] Comparing torch vs {args.backend} on {len(queries)} queries over {len(corpus)} chunks")
+
+    embedding = compare_embedding_backends(args.embedding_model, args.backend, queries, corpus, args.top_k)
+    reranker = compare_reranker_backends(args.reranker_model, args.backend, queries, corpus,
+                                         embedding.pop("reference_scores"), args.candidates, args.top_k)
+
+    passed = True
+    for label, report in (("embedding", embedding), ("reranker", reranker)):
+        print(f"\n{label} ({args.backend} vs torch)")
+        print(f"  top-{args.top_k} overlap:      {report['top_k_overlap']:.3f}")
+        print(f"  rank correlation:   {report['score_correlation']:.3f}")
+        print(f"  max score delta:    {report['max_score_delta']:.4f}")
+        print(f"  speedup:            {report['speedup']:.2f}x")
+        passed = passed and report["top_k_overlap"] >= args.min_overlap
+
+    print(f"\n[INFO] {'PASS' if passed else 'FAIL'} (min top-{args.top_k} overlap {args.min_overlap})")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter
+from typing import List
+from src.search import RAGSearch, LLM_ERROR_ANSWER
+
+def read_queries(path: str) -> List[str]:
+    """
+    One query per line; .jsonl files hold objects with a "query" field
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if path.endswith(".jsonl"):
+        return [json.loads(line)["query"] for line in lines]
+    return lines
+
+
+async def run_batch(rag_search: RAGSearch, queries: List[str], output_path: str, top_k: int = 5,
+                    max_concurrency: int = 8, include_sources: bool = False) -> Counter:
+    """
+    Answer queries through RAGSearch.ask_batch_async and append one JSON line per
+    answer to output_path as it completes. Returns counts by confidence level
+    plus "failed".
+    """
+    summary = Counter()
+    with open(output_path, "w", encoding="utf-8") as out:
+        async for result in rag_search.ask_batch_async(queries, top_k=top_k, max_concurrency=max_concurrency):
+            record = {
+                "index": result["index"],
+                "query": result["query"],
+                "answer": result["answer"],
+                "confidence": result["confidence"],
+                "relevance_score": result["relevance_score"],
+                "num_sources": result["num_sources"],
+                "cache_hit": result.get("cache_hit"),
+            }
+            if include_sources:
+                record["sources"] = result["sources"]
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            summary["failed" if result["answer"] == LLM_ERROR_ANSWER else result["confidence"]["level"]] += 1
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a file of questions through the RAG pipeline in one batch")
+    parser.add_argument("input", help="Questions, one per line (.txt) or {\"query\": ...} objects (.jsonl)")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="JSONL results, in completion order")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM calls in flight at once")
+    parser.add_argument("--include-sources", action="store_true", help="Add the re-ranked sources to each result")
+    parser.add_argument("--vector-backend", default="chroma", choices=["chroma", "faiss"])
+    parser.add_argument("--persist-dir", help="Vector store directory (default: the app's for --vector-backend)")
+    parser.add_argument("--retrieval-mode", default="hybrid", choices=["dense", "hybrid"])
+    parser.add_argument("--inference-backend", default="torch")
+    args = parser.parse_args()
+
+    queries = read_queries(args.input)
+    if not queries:
+        print(f"[ERROR] No queries in {args.input}")
+        sys.exit(1)
+    rag_search = RAGSearch(
+        persist_dir=args.persist_dir or ("./data/faiss_store" if args.vector_backend == "faiss" else "./data/vector_store"),
+        vector_backend=args.vector_backend,
+        retrieval_mode=args.retrieval_mode,
+        inference_backend=args.inference_backend,
+    )
+
+    started = time.perf_counter()
+    summary = asyncio.run(run_batch(rag_search, queries, args.output, args.top_k, args.concurrency, args.include_sources))
+    elapsed = time.perf_counter() - started
+    print(f"[INFO] Answered {len(queries)} queries in {elapsed:.1f}s ({len(queries) / elapsed:.1f} queries/s) -> {args.output}")
+    print(f"[INFO] Confidence: {dict(summary)}")
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Sequence
+from src.metrics import Histogram, REGISTRY
+
+# Batch-size buckets for the batch_size histogram
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+class MicroBatcher:
+    """
+    Collects small inference jobs from concurrent callers and runs them as one
+    batched call.
+
+    The worker takes the oldest pending job, then keeps gathering jobs until
+    either max_batch_size items are collected or max_wait_ms has passed since
+    that first job arrived. The combined items go through batch_fn in one
+    forward pass and each caller gets back exactly the slice of results for
+    its own items, in order.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], Sequence[Any]], max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0, name: str = "batcher"):
+        """
+        Args:
+            batch_fn: Maps a list of items to a sequence (list or array) of results of equal length
+            max_batch_size: Item count that triggers an immediate flush
+            max_wait_ms: Longest time the first job in a batch waits for company
+            name: Used for the worker thread and histogram names
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        # Registered for /metrics; a batcher recreated after fork replaces its predecessor's
+        self.batch_sizes = REGISTRY.register(Histogram(f"{name}_batch_size", BATCH_SIZE_BUCKETS, "Items per batched call"))
+        self.queue_wait = REGISTRY.register(
+            Histogram(f"{name}_queue_wait_seconds", description="Time a job waited before its batch ran"))
+        self._pending: deque = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name=f"{name}-worker", daemon=True)
+        self._worker.start()
+
+    def submit(self, items: List[Any]) -> Future:
+        """
+        Queue items for the next batch. The Future resolves to their results.
+        """
+        future: Future = Future()
+        if not items:
+            future.set_result([])
+            return future
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is closed")
+            self._pending.append((list(items), future, time.perf_counter()))
+            self._condition.notify()
+        return future
+
+    def __call__(self, items: List[Any]) -> Sequence[Any]:
+        return self.submit(items).result()
+
+    def _collect(self) -> List[tuple]:
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return []
+            deadline = self._pending[0][2] + self.max_wait
+            while True:
+                queued_items = sum(len(job[0]) for job in self._pending)
+                remaining = deadline - time.perf_counter()
+                if queued_items >= self.max_batch_size or remaining <= 0 or self._closed:
+                    break
+                self._condition.wait(remaining)
+
+            # Take whole jobs up to max_batch_size; a single oversized job still runs on its own
+            batch = [self._pending.popleft()]
+            size = len(batch[0][0])
+            while self._pending and size + len(self._pending[0][0]) <= self.max_batch_size:
+                job = self._pending.popleft()
+                size += len(job[0])
+                batch.append(job)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+            started = time.perf_counter()
+            items = [item for job_items, _, _ in batch for item in job_items]
+            for _, _, enqueued in batch:
+                self.queue_wait.observe(started - enqueued)
+            self.batch_sizes.observe(len(items))
+
+            try:
+                results = self.batch_fn(items)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for job_items, future, _ in batch:
+                future.set_result(results[offset:offset + len(job_items)])
+                offset += len(job_items)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._worker.join()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_seconds": self.queue_wait.snapshot(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
@@ -0,0 +1,159 @@
+import re
+from typing import Dict, List, Optional, Set
+
+WORD_PATTERN = re.compile(r"\w+")
+
+def estimate_tokens(text: str, chars_per_token: float = 4.0) -> int:
+    """
+    Rough LLM token count; Llama-family tokenizers average about 4 characters
+    per token on English prose
+    """
+    return int(len(text) / chars_per_token + 0.5)
+
+
+def _shingles(text: str, size: int = 3) -> Set[str]:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _join_overlapping(first: str, second: str, min_overlap: int) -> Optional[str]:
+    """
+    first and second as one text when one contains the other or second starts
+    with at least min_overlap characters that first ends with; None otherwise
+    """
+    if second in first:
+        return first
+    if first in second:
+        return second
+    head = second[:min_overlap]
+    if len(head) < min_overlap:
+        return None
+    position = first.find(head, max(0, len(first) - len(second)))
+    while position != -1:
+        if second.startswith(first[position:]):
+            return first + second[len(first) - position:]
+        position = first.find(head, position + 1)
+    return None
+
+
+class ContextBuilder:
+    """
+    Turns re-ranked chunks into the context block of the prompt.
+
+    1. Chunks of the same source_file and page that overlap (the splitter repeats
+       up to chunk_overlap characters) or directly follow each other (by the
+       splitter's start_index, when the index has it) are merged into one passage
+    2. Passages that repeat an already kept one (word 3-gram Jaccard similarity
+       of at least duplicate_threshold, e.g. the same notice in two PDFs) are dropped
+    3. Passages are packed best rerank score first until max_tokens is reached;
+       the first passage that doesn't fit is cut at a sentence boundary if at
+       least min_passage_tokens of budget remain
+    """
+
+    def __init__(self, max_tokens: int = 2000, duplicate_threshold: float = 0.8, min_overlap: int = 20,
+                 min_passage_tokens: int = 100, chars_per_token: float = 4.0):
+        """
+        Args:
+            max_tokens: Token budget of the whole context block
+            duplicate_threshold: Similarity above which a passage counts as a repeat
+            min_overlap: Shortest shared text that merges two chunks
+            min_passage_tokens: Smallest truncated passage worth including
+            chars_per_token: Characters per token for estimate_tokens()
+        """
+        self.max_tokens = max_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.min_overlap = min_overlap
+        self.min_passage_tokens = min_passage_tokens
+        self.chars_per_token = chars_per_token
+
+    def merge(self, results: List[Dict]) -> List[Dict]:
+        """
+        Merge overlapping or adjacent chunks of the same page.
+
+        Returns:
+            Passages {"content", "score", "start_index"}, best score first; a
+            passage scores the best rerank_score of its chunks
+        """
+        passages: List[Dict] = []
+        for result in results:
+            metadata = result.get('metadata') or {}
+            passage = {
+                "key": (metadata.get('source_file'), metadata.get('page')),
+                "content": result.get('content', ''),
+                "score": result.get('rerank_score', result.get('similarity_score', 0.0)),
+                "start_index": metadata.get('start_index'),
+            }
+            # A merge can make a passage overlap one it didn't before, so repeat until nothing joins
+            while True:
+                for other in passages:
+                    if other["key"] != passage["key"] or other["key"] == (None, None):
+                        continue
+                    joined = self._join(other, passage)
+                    if joined is not None:
+                        passages.remove(other)
+                        passage = joined
+                        break
+                else:
+                    break
+            passages.append(passage)
+        return sorted(passages, key=lambda passage: passage["score"], reverse=True)
+
+    def _join(self, a: Dict, b: Dict) -> Optional[Dict]:
+        first, second = (a, b) if (a["start_index"] or 0) <= (b["start_index"] or 0) else (b, a)
+        content = _join_overlapping(first["content"], second["content"], self.min_overlap)
+        if content is None:
+            content = _join_overlapping(second["content"], first["content"], self.min_overlap)
+        if content is None and first["start_index"] is not None and second["start_index"] is not None:
+            # Neighbours without overlap: the splitter dropped only the separator between them
+            gap = second["start_index"] - (first["start_index"] + len(first["content"]))
+            if 0 <= gap <= 2:
+                content = first["content"] + "\n" + second["content"]
+        if content is None:
+            return None
+        return {
+            "key": a["key"],
+            "content": content,
+            "score": max(a["score"], b["score"]),
+            "start_index": first["start_index"],
+        }
+
+    def _is_duplicate(self, shingles: Set[str], kept: List[Set[str]]) -> bool:
+        for other in kept:
+            union = len(shingles | other)
+            if union and len(shingles & other) / union >= self.duplicate_threshold:
+                return True
+        return False
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        cut = text[:int(max_tokens * self.chars_per_token)]
+        sentence_end = max(cut.rfind(". "), cut.rfind("\n"))
+        # Keep whole sentences unless that would throw away most of the cut
+        return cut[:sentence_end + 1].rstrip() if sentence_end > len(cut) // 2 else cut.rstrip()
+
+    def build(self, results: List[Dict]) -> List[str]:
+        """
+        Context passages for the prompt from re-ranked results, best first,
+        within max_tokens altogether
+        """
+        packed: List[str] = []
+        kept_shingles: List[Set[str]] = []
+        budget = self.max_tokens
+        for passage in self.merge(results):
+            content = passage["content"].strip()
+            if not content:
+                continue
+            shingles = _shingles(content)
+            if self._is_duplicate(shingles, kept_shingles):
+                continue
+            tokens = estimate_tokens(content, self.chars_per_token)
+            if tokens > budget:
+                if budget < self.min_passage_tokens:
+                    break
+                content = self._truncate(content, budget)
+                tokens = estimate_tokens(content, self.chars_per_token)
+            packed.append(content)
+            kept_shingles.append(shingles)
+            budget -= tokens
+        return packed
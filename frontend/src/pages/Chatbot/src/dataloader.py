@@ -1,9 +1,19 @@
+import os
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
-from typing import List, Any
-from langchain_community.document_loaders import PyMuPDFLoader, TextLoader, CSVLoader
-from langchain_community.document_loaders import Docx2txtLoader
-from langchain_community.document_loaders.excel import UnstructuredExcelLoader
-from langchain_community.document_loaders import JSONLoader
+from typing import List, Any, Dict, Iterable, Iterator, Optional, Tuple
+
+# Document type -> filename keywords, checked in this order; also used to classify queries (src/intent_classifier.py)
+DOCUMENT_TYPE_KEYWORDS = [
+    ('events', ['event', 'fest', 'program', 'schedule']),
+    ('courses', ['course', 'syllabus', 'curriculum', 'class']),
+    ('clubs', ['club', 'society', 'organization']),
+    ('facilities', ['facility', 'campus', 'building', 'room']),
+    ('sponsorship', ['sponsor', 'partner', 'funding']),
+    ('policies', ['rule', 'regulation', 'policy', 'guideline']),
+]
 
 def classify_document(filename: str) -> str:
     """
@@ -12,120 +22,222 @@ def classify_document(filename: str) -> str:
     """
     filename_lower = filename.lower()
     
-    if any(keyword in filename_lower for keyword in ['event', 'fest', 'program', 'schedule']):
-        return 'events'
-    elif any(keyword in filename_lower for keyword in ['course', 'syllabus', 'curriculum', 'class']):
-        return 'courses'
-    elif any(keyword in filename_lower for keyword in ['club', 'society', 'organization']):
-        return 'clubs'
-    elif any(keyword in filename_lower for keyword in ['facility', 'campus', 'building', 'room']):
-        return 'facilities'
-    elif any(keyword in filename_lower for keyword in ['sponsor', 'partner', 'funding']):
-        return 'sponsorship'
-    elif any(keyword in filename_lower for keyword in ['rule', 'regulation', 'policy', 'guideline']):
-        return 'policies'
+    for doc_type, keywords in DOCUMENT_TYPE_KEYWORDS:
+        if any(keyword in filename_lower for keyword in keywords):
+            return doc_type
+    return 'general'
+
+def _langchain_loader(class_name: str):
+    """
+    Wrap a langchain_community loader class. The (slow) langchain import happens
+    on the first file actually loaded, so scanning an up-to-date index skips it.
+    """
+    def load(path: Path) -> List[Any]:
+        from langchain_community import document_loaders
+        return getattr(document_loaders, class_name)(str(path)).load()
+    return load
+
+def _load_pdf(pdf_file: Path) -> List[Any]:
+    from langchain_community.document_loaders import PyMuPDFLoader
+    loader = PyMuPDFLoader(str(pdf_file))
+    loaded = loader.load()
+
+    # Classify document type
+    doc_type = classify_document(pdf_file.name)
+
+    # Add rich metadata to each page
+    for doc in loaded:
+        doc.metadata['source_file'] = pdf_file.name
+        doc.metadata['source_path'] = str(pdf_file)
+        doc.metadata['source_directory'] = str(pdf_file.parent)
+        doc.metadata['document_type'] = doc_type
+        doc.metadata['file_extension'] = 'pdf'
+    return loaded
+
+# Extension -> (label used in log messages, loader function)
+LOADERS = {
+    'pdf': ('PDF', _load_pdf),
+    'txt': ('TXT', _langchain_loader('TextLoader')),
+    'csv': ('CSV', _langchain_loader('CSVLoader')),
+    'xlsx': ('Excel', _langchain_loader('UnstructuredExcelLoader')),
+    'docx': ('Word', _langchain_loader('Docx2txtLoader')),
+    'json': ('JSON', _langchain_loader('JSONLoader')),
+}
+
+# Bump when a loader or the metadata added to its documents changes, so extraction caches are refilled
+LOADER_VERSION = 1
+# Package doing the actual parsing per extension; its version is part of the extraction cache key
+LOADER_PACKAGES = {
+    'pdf': 'pymupdf',
+    'xlsx': 'unstructured',
+    'docx': 'docx2txt',
+}
+
+@lru_cache(maxsize=None)
+def loader_version(extension: str) -> str:
+    """
+    Version string of the loader for an extension, e.g. "v1-pymupdf1.24.9"
+    """
+    from importlib import metadata
+
+    package = LOADER_PACKAGES.get(extension, 'langchain-community')
+    try:
+        package_version = metadata.version(package)
+    except metadata.PackageNotFoundError:
+        package_version = 'unknown'
+    return f"v{LOADER_VERSION}-{package}{package_version}"
+
+def load_file(file_path: Path, cache_dir: Optional[str] = None, content_hash: Optional[str] = None) -> List[Any]:
+    """
+    Load a single supported file into LangChain documents.
+    Raises ValueError for unsupported extensions; loader errors propagate to the caller.
+
+    With cache_dir, pages parsed before from the same content (see
+    src/extraction_cache.py) are read back lazily instead of parsing the file,
+    and newly parsed pages are stored. content_hash saves hashing the file again.
+    """
+    file_path = Path(file_path)
+    extension = file_path.suffix.lower().lstrip('.')
+    if extension not in LOADERS:
+        raise ValueError(f"Unsupported file type: {file_path}")
+    cache = None
+    if cache_dir:
+        from src.extraction_cache import ExtractionCache
+        from src.indexer import file_sha256
+
+        cache = ExtractionCache(cache_dir)
+        content_hash = content_hash or file_sha256(file_path)
+        cached = cache.get(file_path, content_hash)
+        if cached is not None:
+            return cached
+    _, loader_fn = LOADERS[extension]
+    documents = loader_fn(file_path)
+    # PDFs are tagged by _load_pdf; other types get the same document_type so filtered retrieval finds them
+    for doc in documents:
+        doc.metadata.setdefault('document_type', classify_document(file_path.name))
+    if cache is not None:
+        cache.put(file_path, documents, content_hash)
+    return documents
+
+def iter_supported_files(data_dir: str, exclude_dirs: Iterable[str] = (), skip_marker: Optional[str] = None) -> Iterator[Path]:
+    """
+    Walk the data directory once and yield every supported file.
+    Directories listed in exclude_dirs (e.g. the vector store) are not descended into,
+    nor are directories containing a file named skip_marker (e.g. other vector stores).
+    """
+    excluded = {os.path.normcase(str(Path(d).resolve())) for d in exclude_dirs}
+    for root, dirs, files in os.walk(Path(data_dir).resolve()):
+        if skip_marker and skip_marker in files:
+            dirs[:] = []
+            continue
+        dirs[:] = sorted(d for d in dirs if os.path.normcase(os.path.join(root, d)) not in excluded)
+        for name in sorted(files):
+            if Path(name).suffix.lower().lstrip('.') in LOADERS:
+                yield Path(root, name)
+
+def _load_file_safe(file_path: Path, cache_dir: Optional[str] = None,
+                    content_hash: Optional[str] = None) -> Tuple[Path, List[Any], Optional[str]]:
+    # Runs in a worker process: exceptions are returned, not raised, so one bad file doesn't stop the pool
+    try:
+        return file_path, load_file(file_path, cache_dir, content_hash), None
+    except Exception as e:
+        return file_path, [], str(e)
+
+def _make_executor(max_workers: int, use_processes: bool):
+    # Parsing is CPU-bound, so a process pool is used. sync() runs in a process that
+    # already has torch, Chroma and inference threads, and a forked child can deadlock
+    # on a lock one of them held at fork time. Parsers therefore come from a fresh
+    # forkserver with the loaders preloaded (spawn on Windows, which has none); both
+    # re-run the main script in each child, which app.py guards against.
+    if not use_processes:
+        return ThreadPoolExecutor(max_workers=max_workers)
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['src.dataloader'])
     else:
-        return 'general'
+        context = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+def iter_documents(file_paths: Iterable[Path], max_workers: Optional[int] = None, max_in_flight: Optional[int] = None,
+                   use_processes: bool = True, cache_dir: Optional[str] = None,
+                   content_hashes: Optional[Dict[Path, str]] = None) -> Iterator[Tuple[Path, List[Any], Optional[str]]]:
+    """
+    Load files in parallel and yield (file_path, documents, content_hash) as each file finishes.
+
+    Args:
+        file_paths: Files to load
+        max_workers: Parser processes (default: CPU count)
+        max_in_flight: Files submitted but not yet consumed; bounds peak memory (default: 2 x max_workers)
+        use_processes: Parse in worker processes (threads if False)
+        cache_dir: Extraction cache directory; files parsed before are read back
+                   from it here, without going through the pool
+        content_hashes: SHA-256 of files the caller already hashed, so no file is
+                        read twice for it; the others are hashed here when cache_dir
+                        is set. content_hash is None without cache_dir.
+
+    Files that fail to load are logged and skipped.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    max_in_flight = max(1, max_in_flight or 2 * max_workers)
+    file_iter = iter(file_paths)
+    cache = None
+    if cache_dir:
+        from src.extraction_cache import ExtractionCache
+        from src.indexer import file_sha256
+
+        cache = ExtractionCache(cache_dir)
+
+    with _make_executor(max_workers, use_processes) as executor:
+        in_flight = set()
+        hashes = {}
+        exhausted = False
+        while True:
+            # Keep the window full, then hand back whatever finished first
+            while not exhausted and len(in_flight) < max_in_flight:
+                file_path = next(file_iter, None)
+                if file_path is None:
+                    exhausted = True
+                    break
+                file_path = Path(file_path)
+                content_hash = (content_hashes or {}).get(file_path)
+                if cache is not None:
+                    content_hash = content_hash or file_sha256(file_path)
+                    cached = cache.get(file_path, content_hash)
+                    if cached is not None:
+                        print(f"[DEBUG] Loaded {len(cached)} docs from {file_path} (extraction cache)")
+                        yield file_path, cached, content_hash
+                        continue
+                future = executor.submit(_load_file_safe, file_path, cache_dir, content_hash)
+                hashes[future] = content_hash
+                in_flight.add(future)
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_path, loaded, error = future.result()
+                content_hash = hashes.pop(future)
+                if error is not None:
+                    print(f"[ERROR] Failed to load {file_path}: {error}")
+                    continue
+                print(f"[DEBUG] Loaded {len(loaded)} docs from {file_path}")
+                yield file_path, loaded, content_hash
 
-def load_all_documents(data_dir: str) -> List[Any]:
+def load_all_documents(data_dir: str, max_workers: Optional[int] = None, max_in_flight: Optional[int] = None,
+                       cache_dir: Optional[str] = None) -> List[Any]:
     """
     Load all supported files from the data directory and convert to LangChain document structure.
     Supported: PDF, TXT, CSV, Excel, Word, JSON
+    Files are parsed in parallel; use iter_documents to consume them as they finish.
+    With cache_dir, unchanged files are read from the extraction cache instead of parsed.
     """
     # Use project root data folder
     data_path = Path(data_dir).resolve()
     print(f"[DEBUG] Data path: {data_path}")
     documents = []
 
-    # PDF files
-    pdf_files = list(data_path.glob('**/*.pdf'))
-    print(f"[DEBUG] Found {len(pdf_files)} PDF files: {[str(f) for f in pdf_files]}")
-    for pdf_file in pdf_files:
-        print(f"[DEBUG] Loading PDF: {pdf_file}")
-        try:
-            loader = PyMuPDFLoader(str(pdf_file))
-            loaded = loader.load()
-            
-            # Classify document type
-            doc_type = classify_document(pdf_file.name)
-            
-            # Add rich metadata to each page
-            for doc in loaded:
-                doc.metadata['source_file'] = pdf_file.name
-                doc.metadata['source_path'] = str(pdf_file)
-                doc.metadata['source_directory'] = str(pdf_file.parent)
-                doc.metadata['document_type'] = doc_type
-                doc.metadata['file_extension'] = 'pdf'
-            
-            print(f"[DEBUG] Loaded {len(loaded)} PDF docs from {pdf_file} (Type: {doc_type})")
-            documents.extend(loaded)
-        except Exception as e:
-            print(f"[ERROR] Failed to load PDF {pdf_file}: {e}")
-
-    # TXT files
-    txt_files = list(data_path.glob('**/*.txt'))
-    print(f"[DEBUG] Found {len(txt_files)} TXT files: {[str(f) for f in txt_files]}")
-    for txt_file in txt_files:
-        print(f"[DEBUG] Loading TXT: {txt_file}")
-        try:
-            loader = TextLoader(str(txt_file))
-            loaded = loader.load()
-            print(f"[DEBUG] Loaded {len(loaded)} TXT docs from {txt_file}")
-            documents.extend(loaded)
-        except Exception as e:
-            print(f"[ERROR] Failed to load TXT {txt_file}: {e}")
-
-    # CSV files
-    csv_files = list(data_path.glob('**/*.csv'))
-    print(f"[DEBUG] Found {len(csv_files)} CSV files: {[str(f) for f in csv_files]}")
-    for csv_file in csv_files:
-        print(f"[DEBUG] Loading CSV: {csv_file}")
-        try:
-            loader = CSVLoader(str(csv_file))
-            loaded = loader.load()
-            print(f"[DEBUG] Loaded {len(loaded)} CSV docs from {csv_file}")
-            documents.extend(loaded)
-        except Exception as e:
-            print(f"[ERROR] Failed to load CSV {csv_file}: {e}")
-
-    # Excel files
-    xlsx_files = list(data_path.glob('**/*.xlsx'))
-    print(f"[DEBUG] Found {len(xlsx_files)} Excel files: {[str(f) for f in xlsx_files]}")
-    for xlsx_file in xlsx_files:
-        print(f"[DEBUG] Loading Excel: {xlsx_file}")
-        try:
-            loader = UnstructuredExcelLoader(str(xlsx_file))
-            loaded = loader.load()
-            print(f"[DEBUG] Loaded {len(loaded)} Excel docs from {xlsx_file}")
-            documents.extend(loaded)
-        except Exception as e:
-            print(f"[ERROR] Failed to load Excel {xlsx_file}: {e}")
-
-    # Word files
-    docx_files = list(data_path.glob('**/*.docx'))
-    print(f"[DEBUG] Found {len(docx_files)} Word files: {[str(f) for f in docx_files]}")
-    for docx_file in docx_files:
-        print(f"[DEBUG] Loading Word: {docx_file}")
-        try:
-            loader = Docx2txtLoader(str(docx_file))
-            loaded = loader.load()
-            print(f"[DEBUG] Loaded {len(loaded)} Word docs from {docx_file}")
-            documents.extend(loaded)
-        except Exception as e:
-            print(f"[ERROR] Failed to load Word {docx_file}: {e}")
-
-    # JSON files
-    json_files = list(data_path.glob('**/*.json'))
-    print(f"[DEBUG] Found {len(json_files)} JSON files: {[str(f) for f in json_files]}")
-    for json_file in json_files:
-        print(f"[DEBUG] Loading JSON: {json_file}")
-        try:
-            loader = JSONLoader(str(json_file))
-            loaded = loader.load()
-            print(f"[DEBUG] Loaded {len(loaded)} JSON docs from {json_file}")
-            documents.extend(loaded)
-        except Exception as e:
-            print(f"[ERROR] Failed to load JSON {json_file}: {e}")
+    for _, loaded, _ in iter_documents(iter_supported_files(data_path), max_workers=max_workers, max_in_flight=max_in_flight,
+                                    cache_dir=cache_dir):
+        documents.extend(loaded)
 
     print(f"[DEBUG] Total loaded documents: {len(documents)}")
-    return documents
\ No newline at end of file
+    return documents
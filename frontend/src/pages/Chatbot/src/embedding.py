@@ -1,29 +1,75 @@
-from typing import List, Any
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
+from typing import List, Any, Iterator, Optional, Tuple
 import numpy as np
+from src.embedding_cache import EmbeddingCache
+from src.models import get_embedding_model
 
 class EmbeddingPipeline:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2", chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", chunk_size: int = 1000, chunk_overlap: int = 200,
+                 batch_size: int = 64, cache_dir: Optional[str] = None, backend: str = "torch"):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.model = SentenceTransformer(model_name)
-        print(f"[INFO] Loaded embedding model: {model_name}")
+        self.batch_size = batch_size
+        self.model_name = model_name
+        self.backend = backend
+        # Embeddings are cached on disk by (model, text hash) so unchanged text is never re-encoded.
+        # Quantized backends produce slightly different vectors, so they get their own cache.
+        cache_model_name = model_name if backend == "torch" else f"{model_name}@{backend}"
+        self.cache = EmbeddingCache(cache_dir, cache_model_name) if cache_dir else None
+
+    @property
+    def model(self):
+        # Same instance the vector store uses for queries; loaded when the first chunk is embedded
+        return get_embedding_model(self.model_name, self.backend)
 
     def chunk_documents(self, documents: List[Any]) -> List[Any]:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
         splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.chunk_size,
             chunk_overlap=self.chunk_overlap,
             length_function=len,
-            separators=["\n\n", "\n", " ", ""]
+            separators=["\n\n", "\n", " ", ""],
+            add_start_index=True  # Lets the context builder merge neighbouring chunks
         )
         chunks = splitter.split_documents(documents)
         print(f"[INFO] Split {len(documents)} documents into {len(chunks)} chunks.")
         return chunks
 
     def embed_chunks(self, chunks: List[Any]) -> np.ndarray:
+        """
+        Embed chunks in batches of batch_size, reusing cached embeddings.
+        Returns a float32 array with one row per chunk.
+        """
         texts = [chunk.page_content for chunk in chunks]
         print(f"[INFO] Generating embeddings for {len(texts)} chunks...")
-        embeddings = self.model.encode(texts, show_progress_bar=True)
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        embeddings = np.empty((len(texts), self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        misses = list(range(len(texts)))
+        if self.cache is not None:
+            hits, misses = self.cache.lookup(texts)
+            for i, embedding in hits.items():
+                embeddings[i] = embedding
+            print(f"[INFO] Embedding cache: {len(hits)} hits, {len(misses)} misses")
+
+        for start in range(0, len(misses), self.batch_size):
+            batch_positions = misses[start:start + self.batch_size]
+            batch_texts = [texts[i] for i in batch_positions]
+            batch_embeddings = self.model.encode(batch_texts, batch_size=self.batch_size, show_progress_bar=False, convert_to_numpy=True)
+            embeddings[batch_positions] = batch_embeddings
+            # Written per batch so a crash mid-build keeps what was already encoded
+            if self.cache is not None:
+                self.cache.add(batch_texts, batch_embeddings)
+
         print(f"[INFO] Embeddings shape: {embeddings.shape}")
-        return embeddings
\ No newline at end of file
+        return embeddings
+
+    def iter_embedded_batches(self, chunks: List[Any]) -> Iterator[Tuple[List[Any], np.ndarray]]:
+        """
+        Yield (chunks, embeddings) batches so callers can upsert each batch
+        before the next is encoded, keeping memory bounded by batch_size.
+        """
+        for start in range(0, len(chunks), self.batch_size):
+            batch = chunks[start:start + self.batch_size]
+            yield batch, self.embed_chunks(batch)
@@ -0,0 +1,132 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import numpy as np
+from typing import List, Dict, Optional, Tuple
+
+KEY_BYTES = 16
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (model name, chunk-text hash).
+
+    Each model gets its own directory holding an append-only float32 matrix
+    (vectors.f32, read back through np.memmap) and a parallel file of 16-byte
+    text hashes (keys.bin). The hash -> row index is rebuilt in memory on open.
+    Rows are only appended, so a crash can at worst leave a partial tail row,
+    which is trimmed on the next open.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str):
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.dir = os.path.join(cache_dir, safe_name)
+        self.model_name = model_name
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.keys_path = os.path.join(self.dir, "keys.bin")
+        self.meta_path = os.path.join(self.dir, "meta.json")
+        self.dim: Optional[int] = None
+        self.index: Dict[bytes, int] = {}
+        self._matrix: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        os.makedirs(self.dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            self.dim = json.load(f)["dim"]
+
+        keys = b""
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "rb") as f:
+                keys = f.read()
+        row_bytes = 4 * self.dim
+        vector_rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        rows = min(len(keys) // KEY_BYTES, vector_rows)
+
+        # Trim any partially written tail so keys and vectors stay aligned
+        if os.path.exists(self.keys_path) and len(keys) != rows * KEY_BYTES:
+            with open(self.keys_path, "r+b") as f:
+                f.truncate(rows * KEY_BYTES)
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) != rows * row_bytes:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(rows * row_bytes)
+
+        self.index = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(rows)}
+        print(f"[INFO] Embedding cache for {self.model_name}: {rows} cached vectors")
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _get_matrix(self) -> np.memmap:
+        # Re-map when rows were appended since the last map
+        if self._matrix is None or self._matrix.shape[0] < len(self.index):
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.index), self.dim))
+        return self._matrix
+
+    def lookup(self, texts: List[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """
+        Look up cached embeddings.
+
+        Returns:
+            (hits, misses): hits maps position in texts -> embedding,
+            misses lists the positions that still need encoding
+        """
+        hits: Dict[int, np.ndarray] = {}
+        misses: List[int] = []
+        with self._lock:
+            if not self.index:
+                return hits, list(range(len(texts)))
+            matrix = self._get_matrix()
+            for i, text in enumerate(texts):
+                row = self.index.get(text_key(text))
+                if row is None:
+                    misses.append(i)
+                else:
+                    hits[i] = matrix[row]
+        return hits, misses
+
+    def add(self, texts: List[str], embeddings: np.ndarray):
+        """
+        Append embeddings for texts that are not cached yet.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or len(texts) != embeddings.shape[0]:
+            raise ValueError("Number of texts and embeddings must match")
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(embeddings.shape[1])
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model_name": self.model_name, "dim": self.dim}, f)
+            elif embeddings.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match cache dimension {self.dim}")
+
+            new_keys = []
+            new_rows = []
+            seen = set()
+            for text, embedding in zip(texts, embeddings):
+                key = text_key(text)
+                if key in self.index or key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_rows.append(embedding)
+            if not new_keys:
+                return
+
+            # Vectors first, then keys: a key is only visible once its vector is on disk
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(np.stack(new_rows)).tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(new_keys))
+            start = len(self.index)
+            for offset, key in enumerate(new_keys):
+                self.index[key] = start + offset
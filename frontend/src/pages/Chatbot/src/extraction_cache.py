@@ -0,0 +1,142 @@
+import os
+import json
+import shutil
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+from src.dataloader import classify_document, loader_version
+from src.indexer import file_sha256
+
+# Metadata values that name the file are stored as these tokens and filled in
+# for the path being loaded, so a copied or renamed file still hits the cache
+PATH_TOKENS = ("\x00path", "\x00name", "\x00parent")
+
+def _path_values(file_path: Path) -> List[str]:
+    return [str(file_path), file_path.name, str(file_path.parent)]
+
+
+class CachedDocuments(Sequence):
+    """
+    Pages of one cached file, built into Documents only when read. Page text
+    is sliced out of text.bin by offset, so iterating reads the file once and
+    indexing a single page reads only that page.
+    """
+
+    def __init__(self, entry_dir: str, file_path: Path, meta: Dict[str, Any]):
+        self.entry_dir = entry_dir
+        self.file_path = file_path
+        self.meta = meta
+        self._offsets = np.fromfile(os.path.join(entry_dir, "offsets.i64"), dtype=np.int64)
+        self._values = dict(zip(PATH_TOKENS, _path_values(file_path)))
+        # document_type comes from the filename, so a renamed file is classified again
+        self._document_type = (classify_document(file_path.name) if meta.get("source_file") != file_path.name
+                               else None)
+
+    def __len__(self) -> int:
+        return int(self.meta["pages"])
+
+    def _metadata(self, index: int) -> Dict[str, Any]:
+        metadata = dict(self.meta["constant"])
+        for key, values in self.meta["columns"].items():
+            if values[index] is not None:
+                metadata[key] = values[index]
+        for key, value in metadata.items():
+            if isinstance(value, str) and value in self._values:
+                metadata[key] = self._values[value]
+        if self._document_type is not None and "document_type" in metadata:
+            metadata["document_type"] = self._document_type
+        return metadata
+
+    def _document(self, index: int, text: bytes) -> Any:
+        from langchain_core.documents import Document
+
+        return Document(page_content=text.decode("utf-8"), metadata=self._metadata(index))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        with open(os.path.join(self.entry_dir, "text.bin"), "rb") as f:
+            f.seek(start)
+            return self._document(index, f.read(end - start))
+
+    def __iter__(self) -> Iterator[Any]:
+        with open(os.path.join(self.entry_dir, "text.bin"), "rb") as f:
+            for index in range(len(self)):
+                yield self._document(index, f.read(int(self._offsets[index + 1] - self._offsets[index])))
+
+
+class ExtractionCache:
+    """
+    Persistent cache of parsed pages keyed by (file content hash, loader version).
+
+    Each entry is a directory holding the concatenated UTF-8 page texts
+    (text.bin), the page start offsets (offsets.i64) and the metadata in
+    column form (meta.json): values shared by every page are stored once, the
+    rest as one list per key. Entries are written to a temporary directory and
+    renamed into place, so parser processes can fill the cache concurrently
+    and a reader never sees a partial entry. Re-chunking or re-embedding an
+    unchanged file then never parses it again.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    def entry_dir(self, content_hash: str, extension: str) -> str:
+        return os.path.join(self.cache_dir, content_hash[:2], f"{content_hash}-{extension}-{loader_version(extension)}")
+
+    def get(self, file_path: Path, content_hash: Optional[str] = None) -> Optional[CachedDocuments]:
+        """
+        The cached pages of file_path, or None if this content was not parsed
+        with the current loader yet
+        """
+        file_path = Path(file_path)
+        extension = file_path.suffix.lower().lstrip('.')
+        entry_dir = self.entry_dir(content_hash or file_sha256(file_path), extension)
+        try:
+            with open(os.path.join(entry_dir, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            return CachedDocuments(entry_dir, file_path, meta)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, file_path: Path, documents: List[Any], content_hash: Optional[str] = None):
+        """
+        Store the pages a loader produced for file_path
+        """
+        file_path = Path(file_path)
+        extension = file_path.suffix.lower().lstrip('.')
+        entry_dir = self.entry_dir(content_hash or file_sha256(file_path), extension)
+        if os.path.exists(entry_dir):
+            return
+        tokens = dict(zip(_path_values(file_path), PATH_TOKENS))
+
+        texts = [doc.page_content.encode("utf-8") for doc in documents]
+        rows = [{key: tokens.get(value, value) if isinstance(value, str) else value
+                 for key, value in doc.metadata.items()} for doc in documents]
+        keys = sorted({key for row in rows for key in row})
+        constant, columns = {}, {}
+        for key in keys:
+            values = [row.get(key) for row in rows]
+            if all(key in row for row in rows) and all(value == values[0] for value in values):
+                constant[key] = values[0]
+            else:
+                columns[key] = values
+        meta = {"source_file": file_path.name, "pages": len(documents), "constant": constant, "columns": columns}
+
+        tmp_dir = f"{entry_dir}.tmp{os.getpid()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        try:
+            with open(os.path.join(tmp_dir, "text.bin"), "wb") as f:
+                f.write(b"".join(texts))
+            np.cumsum([0] + [len(text) for text in texts], dtype=np.int64).tofile(os.path.join(tmp_dir, "offsets.i64"))
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, default=str)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another process stored the same content first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,898 @@
+import os
+import json
+import math
+import time
+import shutil
+import argparse
+import threading
+import numpy as np
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from src.vectorstore import BaseVectorStore, LEXICAL_INDEX_FILENAME, matches_where
+from src.lexical_index import BM25Index
+from src.indexer import MANIFEST_FILENAME
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq", "sq8", "binary")
+# Index types holding lossy codes instead of the vectors; their candidates are over-fetched for exact rescoring
+COMPRESSED_INDEX_TYPES = ("ivfpq", "sq8", "binary")
+CURRENT_FILENAME = "CURRENT"
+# Share of dead rows (deleted or replaced chunks) above which flush() compacts the store
+COMPACTION_RATIO = 0.25
+IDX_DTYPE = np.int64
+# Bits per product-quantizer code
+PQ_BITS = 8
+# Vectors needed to train the IVF-PQ codebooks: faiss wants 39 points per centroid
+# and each sub-quantizer has 2 ** PQ_BITS centroids
+PQ_MIN_TRAIN = 39 << PQ_BITS
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class ChunkFiles:
+    """
+    Append-only sidecar files holding one generation of the store.
+
+    vectors.f32   float32 rows (unit length), read through np.memmap
+    chunks.bin    JSON records {"text", "metadata"} back to back, read through np.memmap
+    chunks.idx    (offset, length) int64 pairs locating each record in chunks.bin
+    ids.jsonl     one chunk id per row, written last, so a row exists once its id line does
+    deleted.txt   rows that were deleted or replaced (tombstones)
+
+    Only what is needed to search (row -> id, live rows) is held in memory;
+    vectors and texts stay in the page cache, shared by every process that
+    maps the same files. A crash mid-append leaves at most a partial tail,
+    which is trimmed on the next open.
+
+    A read-only view can be capped at max_rows rows and the first max_deleted
+    tombstones, so it sees exactly a published snapshot while the writer keeps
+    appending to the same files.
+    """
+
+    def __init__(self, directory: str, read_only: bool = False, max_rows: Optional[int] = None,
+                 max_deleted: Optional[int] = None):
+        self.dir = directory
+        self.read_only = read_only
+        self.max_rows = max_rows
+        self.max_deleted = max_deleted
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.chunks_path = os.path.join(directory, "chunks.bin")
+        self.offsets_path = os.path.join(directory, "chunks.idx")
+        self.ids_path = os.path.join(directory, "ids.jsonl")
+        self.deleted_path = os.path.join(directory, "deleted.txt")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.dim: Optional[int] = None
+        self.ids: List[str] = []
+        self.deleted: set = set()
+        # Lines in deleted.txt, i.e. how many tombstones a snapshot of this state covers
+        self.deleted_entries = 0
+        self._vectors: Optional[np.memmap] = None
+        self._offsets: Optional[np.memmap] = None
+        self._chunks: Optional[np.memmap] = None
+        self._chunks_size = 0
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            self.dim = json.load(f)["dim"]
+
+        # (id, byte offset just past its line) for each complete id line
+        id_lines = []
+        if os.path.exists(self.ids_path):
+            end = 0
+            with open(self.ids_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n") or len(id_lines) == self.max_rows:
+                        break
+                    end += len(line)
+                    id_lines.append((json.loads(line), end))
+        vector_rows = os.path.getsize(self.vectors_path) // (4 * self.dim) if os.path.exists(self.vectors_path) else 0
+        offset_rows = os.path.getsize(self.offsets_path) // 16 if os.path.exists(self.offsets_path) else 0
+        rows = min(len(id_lines), vector_rows, offset_rows)
+        self.ids = [doc_id for doc_id, _ in id_lines[:rows]]
+
+        chunks_end = 0
+        if rows:
+            last = np.fromfile(self.offsets_path, dtype=IDX_DTYPE, count=2, offset=(rows - 1) * 16)
+            chunks_end = int(last[0] + last[1])
+        if not self.read_only:
+            # Trim anything written after the last committed row so all files stay aligned
+            for path, size in ((self.ids_path, id_lines[rows - 1][1] if rows else 0),
+                               (self.vectors_path, rows * 4 * self.dim),
+                               (self.offsets_path, rows * 16),
+                               (self.chunks_path, chunks_end)):
+                if os.path.exists(path) and os.path.getsize(path) != size:
+                    with open(path, "r+b") as f:
+                        f.truncate(size)
+
+        if os.path.exists(self.deleted_path):
+            with open(self.deleted_path, "r", encoding="utf-8") as f:
+                lines = [line for line in f if line.endswith("\n")][:self.max_deleted]
+            self.deleted_entries = len(lines)
+            self.deleted = {int(line) for line in lines if int(line) < rows}
+
+        if self.read_only and rows:
+            # Map now: a compaction may unlink these files later, and an open mapping keeps them readable
+            self.vectors
+            self._record_maps()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def live_rows(self) -> np.ndarray:
+        live = np.ones(len(self.ids), dtype=bool)
+        if self.deleted:
+            live[list(self.deleted)] = False
+        return np.flatnonzero(live)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        # Re-map after appends; an empty file cannot be mapped
+        rows = len(self.ids)
+        if rows == 0:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        if self._vectors is None or self._vectors.shape[0] != rows:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._vectors
+
+    def _record_maps(self) -> Tuple[np.memmap, np.memmap]:
+        rows = len(self.ids)
+        if self._offsets is None or self._offsets.shape[0] != rows:
+            self._offsets = np.memmap(self.offsets_path, dtype=IDX_DTYPE, mode="r", shape=(rows, 2))
+            last_offset, last_length = self._offsets[rows - 1]
+            self._chunks_size = int(last_offset + last_length)
+            self._chunks = np.memmap(self.chunks_path, dtype=np.uint8, mode="r", shape=(self._chunks_size,))
+        return self._offsets, self._chunks
+
+    def record(self, row: int) -> Tuple[str, Dict[str, Any]]:
+        """
+        (text, metadata) of a row
+        """
+        offsets, chunks = self._record_maps()
+        offset, length = offsets[row]
+        data = json.loads(chunks[offset:offset + length].tobytes())
+        return data["text"], data["metadata"]
+
+    def append(self, ids: List[str], embeddings: np.ndarray, texts: List[str], metadatas: List[Dict[str, Any]]) -> List[int]:
+        """
+        Append rows and return their row numbers. embeddings must already be normalized.
+        """
+        if self.dim is None:
+            self.dim = int(embeddings.shape[1])
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim}, f)
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match store dimension {self.dim}")
+
+        records = [json.dumps({"text": text, "metadata": metadata}, default=str).encode("utf-8")
+                   for text, metadata in zip(texts, metadatas)]
+        start = os.path.getsize(self.chunks_path) if os.path.exists(self.chunks_path) else 0
+        offsets = np.empty((len(records), 2), dtype=IDX_DTYPE)
+        for i, record in enumerate(records):
+            offsets[i] = (start, len(record))
+            start += len(record)
+
+        # Data first, ids last: a row only becomes visible once everything it points to is on disk
+        with open(self.chunks_path, "ab") as f:
+            f.write(b"".join(records))
+        with open(self.offsets_path, "ab") as f:
+            f.write(offsets.tobytes())
+        with open(self.vectors_path, "ab") as f:
+            f.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+        with open(self.ids_path, "ab") as f:
+            f.write("".join(json.dumps(doc_id) + "\n" for doc_id in ids).encode("utf-8"))
+
+        first_row = len(self.ids)
+        self.ids.extend(ids)
+        return list(range(first_row, len(self.ids)))
+
+    def mark_deleted(self, rows: List[int]):
+        if not rows:
+            return
+        with open(self.deleted_path, "a", encoding="utf-8") as f:
+            f.write("".join(f"{row}\n" for row in rows))
+        self.deleted.update(rows)
+        self.deleted_entries += len(rows)
+
+
+class FaissVectorStore(BaseVectorStore):
+    """
+    In-process vector store: chunk vectors, texts and metadata live in
+    memory-mapped sidecar files (ChunkFiles) and a FAISS index over their rows
+    answers nearest-neighbour queries.
+
+    index_type:
+        flat   exact inner-product search straight over the memory-mapped vectors
+        hnsw   faiss HNSW graph (fast, near-exact)
+        ivfpq  faiss IVF with product quantization (smallest); trained once enough
+               vectors exist, exact search is used until then
+        sq8    brute-force scan of 8-bit scalar-quantized vectors (4x smaller than float32)
+        binary brute-force Hamming scan of sign bits (32x smaller than float32)
+
+    Candidates are always rescored exactly against the stored vectors, so
+    similarity scores are true cosine similarities for every index type. The
+    compressed types fetch rescore_factor times more candidates first; only
+    those rows of the memory-mapped float32 vectors are read, so the float
+    copy does not need to be resident. measure_recall() reports how much the
+    compression costs compared with exact search.
+
+    persist_dir/CURRENT is a JSON snapshot naming the generation directory, how
+    many rows and tombstones of it are visible and which index file covers them.
+    A single writer appends in place and publishes a new snapshot on flush();
+    compaction and clear() write a new generation. Read-only instances (serving
+    workers) map exactly the published snapshot, index included, and switch to
+    a newer one in maybe_refresh(), so any number of processes share one copy
+    of the data in the page cache.
+    """
+
+    def __init__(self, persist_dir: str = "./data/faiss_store", embedding_model: str = "all-MiniLM-L6-v2",
+                 chunk_size: int = 1000, chunk_overlap: int = 200, batch_size: int = 256,
+                 inference_backend: str = "torch", index_type: str = "hnsw", hnsw_m: int = 32,
+                 ef_construction: int = 80, ef_search: int = 64, nprobe: int = 16,
+                 ivf_min_train: int = PQ_MIN_TRAIN, rescore_factor: int = 8, read_only: bool = False,
+                 refresh_interval: float = 2.0):
+        """
+        Args:
+            persist_dir: Directory holding the generations, lexical index and manifest
+            index_type: "flat", "hnsw", "ivfpq", "sq8" or "binary"
+            hnsw_m: Graph degree of the HNSW index
+            ef_construction: HNSW build-time beam width
+            ef_search: HNSW query-time beam width
+            nprobe: IVF lists scanned per query
+            ivf_min_train: Vectors needed before the IVF-PQ index is trained (at least PQ_MIN_TRAIN)
+            rescore_factor: Candidates fetched per result from compressed indexes for exact rescoring
+            read_only: Serve the published snapshot without writing; the writer is another process
+            refresh_interval: Seconds between checks for a newer snapshot when read_only
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index_type: {index_type} (expected one of {', '.join(INDEX_TYPES)})")
+        super().__init__(persist_dir, embedding_model, chunk_size, chunk_overlap, batch_size, inference_backend)
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+        self.ivf_min_train = max(ivf_min_train, PQ_MIN_TRAIN)
+        self.rescore_factor = rescore_factor
+        self.read_only = read_only
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._row_of: Dict[str, int] = {}
+        self._index = None
+        self._index_dirty = False
+        # Rows [0, _indexed_rows) are in the faiss index; later ones are searched exactly
+        self._indexed_rows = 0
+        # Rows the sq8 quantizer ranges were trained on; it is retrained once the store doubles
+        self._trained_rows = 0
+        self._index_file: Optional[str] = None
+        self._sequence = 0
+        self._published: Optional[Dict[str, Any]] = None
+        self._next_refresh = 0.0
+        self._writer_lock = None
+        # where filter (as JSON) -> (files it was built on, rows scanned, matching rows)
+        self._filter_rows: Dict[str, Tuple[ChunkFiles, int, List[int]]] = {}
+        if read_only:
+            self._open_reader()
+            self._init_lexical_index(sync=False)
+        else:
+            self._acquire_writer_lock()
+            self._open_writer()
+            self._init_lexical_index()
+
+    # --- snapshots ---
+
+    def _current_path(self) -> str:
+        return os.path.join(self.persist_dir, CURRENT_FILENAME)
+
+    def _read_current(self) -> Optional[Dict[str, Any]]:
+        path = self._current_path()
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read().strip()
+        if not content:
+            return None
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError:
+            # Older stores kept only the generation name; rows and index are rebuilt from the files
+            return {"generation": content}
+
+    def _next_generation(self) -> str:
+        number = int(self.generation.split("-")[1]) + 1 if getattr(self, "generation", None) else 1
+        return f"gen-{number:06d}"
+
+    def _publish(self):
+        """
+        Atomically replace CURRENT with the writer's state, then remove files no
+        snapshot points at any more. Readers that mapped them keep working off
+        the unlinked files until they refresh. Nothing is written if the state
+        is already published, so readers only reload on real changes.
+        """
+        snapshot = {
+            "generation": self.generation,
+            "rows": len(self.files),
+            "deleted": self.files.deleted_entries,
+            "index_type": self.index_type,
+            "index_file": self._index_file,
+            "index_rows": self._indexed_rows if self._index_file else 0,
+        }
+        if snapshot == self._published:
+            return
+        self._published = dict(snapshot)
+        self._sequence += 1
+        snapshot["sequence"] = self._sequence
+        tmp_path = self._current_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self._current_path())
+        for name in os.listdir(self.persist_dir):
+            if name.startswith("gen-") and name != self.generation:
+                shutil.rmtree(os.path.join(self.persist_dir, name), ignore_errors=True)
+        for name in os.listdir(self.files.dir):
+            if (name.startswith("index") and name != self._index_file) or name.endswith(".tmp"):
+                os.remove(os.path.join(self.files.dir, name))
+
+    def _acquire_writer_lock(self):
+        """
+        Only one process may write a store; readers never take the lock
+        """
+        os.makedirs(self.persist_dir, exist_ok=True)
+        try:
+            import fcntl
+        except ImportError:  # Windows: no advisory locks, a single writer is assumed
+            return
+        self._writer_lock = open(os.path.join(self.persist_dir, "writer.lock"), "w")
+        try:
+            fcntl.flock(self._writer_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._writer_lock.close()
+            raise RuntimeError(f"Another process is already writing the FAISS store at {self.persist_dir}; "
+                               f"open it with read_only=True")
+
+    def _open_writer(self):
+        snapshot = self._read_current()
+        if snapshot is None:
+            self.generation = self._next_generation()
+            self.files = ChunkFiles(os.path.join(self.persist_dir, self.generation))
+            self._publish()
+        else:
+            self.generation = snapshot["generation"]
+            self._sequence = snapshot.get("sequence", 0)
+            self._published = {key: value for key, value in snapshot.items() if key != "sequence"}
+            self.files = ChunkFiles(os.path.join(self.persist_dir, self.generation))
+        self._row_of = {self.files.ids[row]: int(row) for row in self.files.live_rows()}
+        self._load_index(snapshot or {})
+        print(f"[INFO] FAISS store ({self.index_type}) opened at {self.persist_dir}/{self.generation} "
+              f"with {len(self._row_of)} documents")
+
+    def _read_snapshot(self, snapshot: Dict[str, Any]) -> Tuple[ChunkFiles, Dict[str, int], Any, int]:
+        """
+        Map the files and index of a published snapshot read-only.
+        Raises FileNotFoundError if the writer removed them in the meantime.
+        """
+        directory = os.path.join(self.persist_dir, snapshot["generation"])
+        files = ChunkFiles(directory, read_only=True, max_rows=snapshot.get("rows"),
+                           max_deleted=snapshot.get("deleted"))
+        if len(files) < snapshot.get("rows", 0):
+            # The generation was compacted away since CURRENT was read
+            raise FileNotFoundError(directory)
+        row_of = {files.ids[row]: int(row) for row in files.live_rows()}
+        index, indexed_rows = None, 0
+        if snapshot.get("index_file") and snapshot.get("index_type") == self.index_type:
+            index = self._read_index(os.path.join(directory, snapshot["index_file"]), mmap=True)
+            indexed_rows = min(snapshot["index_rows"], len(files))
+        elif snapshot.get("index_file"):
+            print(f"[INFO] Published index is {snapshot.get('index_type')}, not {self.index_type}; using exact search")
+        return files, row_of, index, indexed_rows
+
+    def _open_reader(self, attempts: int = 5):
+        for attempt in range(attempts):
+            # Until the writer publishes, serve an empty store; maybe_refresh() picks the first snapshot up
+            snapshot = self._read_current() or {"generation": "gen-000001", "rows": 0, "deleted": 0}
+            try:
+                self._swap_in(snapshot, *self._read_snapshot(snapshot))
+                break
+            except FileNotFoundError:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(0.1)  # The writer published a new generation while it was being opened
+        print(f"[INFO] FAISS store ({self.index_type}) opened read-only at {self.persist_dir}/{self.generation} "
+              f"with {len(self._row_of)} documents")
+
+    def _swap_in(self, snapshot: Dict[str, Any], files: ChunkFiles, row_of: Dict[str, int], index, indexed_rows: int):
+        # Configured before it is visible: searches read the new state without the lock
+        if index is not None:
+            self._configure_index(index)
+        with self._lock:
+            self.generation = snapshot["generation"]
+            self._sequence = snapshot.get("sequence", 0)
+            self.files, self._row_of = files, row_of
+            self._index, self._indexed_rows = index, indexed_rows
+
+    def maybe_refresh(self):
+        """
+        Switch a read-only store to the latest published snapshot, at most once
+        per refresh_interval. In-flight queries finish on the snapshot they started with.
+        """
+        if not self.read_only or time.monotonic() < self._next_refresh:
+            return
+        self._next_refresh = time.monotonic() + self.refresh_interval
+        snapshot = self._read_current()
+        if snapshot is None or snapshot.get("sequence", 0) == self._sequence:
+            return
+        try:
+            state = self._read_snapshot(snapshot)
+        except FileNotFoundError:
+            return  # Superseded while opening; the next check sees the newer snapshot
+        lexical_index = BM25Index(os.path.join(self.persist_dir, LEXICAL_INDEX_FILENAME))
+        self._swap_in(snapshot, *state)
+        self.lexical_index = lexical_index
+        self.version += 1
+        print(f"[INFO] Refreshed FAISS store to snapshot {self._sequence} ({len(self._row_of)} documents)")
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError("This FAISS store is read-only; writes go through the index writer process")
+
+    # --- faiss index ---
+
+    def _read_index(self, path: str, mmap: bool = False):
+        import faiss
+
+        read = faiss.read_index_binary if self.index_type == "binary" else faiss.read_index
+        if mmap:
+            # Map the index file instead of copying it, so worker processes share its pages
+            try:
+                return read(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                if not os.path.exists(path):
+                    raise FileNotFoundError(path)
+        return read(path)
+
+    def _load_index(self, snapshot: Dict[str, Any]):
+        self._index = None
+        self._index_file = None
+        self._indexed_rows = 0
+        if self.index_type == "flat" or not len(self.files):
+            return
+        index_file = snapshot.get("index_file")
+        if (snapshot.get("index_type") != self.index_type or not index_file
+                or not os.path.exists(os.path.join(self.files.dir, index_file))):
+            self._build_index()
+            return
+
+        self._index = self._read_index(os.path.join(self.files.dir, index_file))
+        self._index_file = index_file
+        self._configure_index(self._index)
+        # Rows appended after the snapshot was written are added now
+        indexed_rows = snapshot["index_rows"]
+        self._indexed_rows = indexed_rows
+        self._trained_rows = indexed_rows
+        tail = [row for row in self.files.live_rows() if row >= indexed_rows]
+        if tail:
+            self._add_to_index(np.asarray(tail, dtype=np.int64))
+        self._indexed_rows = len(self.files)
+
+    def _configure_index(self, index):
+        import faiss
+
+        if self.index_type == "hnsw":
+            faiss.downcast_index(index.index).hnsw.efSearch = self.ef_search
+        elif self.index_type == "ivfpq":
+            index.nprobe = min(self.nprobe, index.nlist)
+
+    def _pq_subquantizers(self, dim: int) -> int:
+        # About 8 dimensions per sub-quantizer, and it must divide dim
+        for m in range(max(1, dim // 8), 0, -1):
+            if dim % m == 0:
+                return m
+        return 1
+
+    def _build_index(self):
+        """
+        (Re)build the faiss index from all live rows. IVF-PQ stays unbuilt
+        (exact search) until ivf_min_train vectors exist; sq8 learns its
+        per-dimension value ranges from the rows present now.
+        """
+        import faiss
+
+        self._index = None
+        self._indexed_rows = 0
+        live = self.files.live_rows()
+        dim = self.files.dim
+        if self.index_type == "flat" or dim is None:
+            return
+        if self.index_type == "hnsw":
+            hnsw = faiss.IndexHNSWFlat(dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            hnsw.hnsw.efConstruction = self.ef_construction
+            index = faiss.IndexIDMap(hnsw)
+        elif self.index_type == "binary":
+            index = faiss.IndexBinaryIDMap(faiss.IndexBinaryFlat(dim))
+        elif self.index_type == "sq8":
+            if not len(live):
+                return
+            index = faiss.IndexIDMap(faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit,
+                                                                faiss.METRIC_INNER_PRODUCT))
+            index.train(np.ascontiguousarray(self.files.vectors[self._training_sample(live)]))
+        else:
+            if len(live) < self.ivf_min_train:
+                return
+            nlist = int(max(1, min(4 * math.sqrt(len(live)), len(live) // 39)))
+            quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, self._pq_subquantizers(dim), PQ_BITS, faiss.METRIC_INNER_PRODUCT)
+            sample = self._training_sample(live)
+            print(f"[INFO] Training IVF-PQ index (nlist={nlist}) on {len(sample)} vectors...")
+            index.train(np.ascontiguousarray(self.files.vectors[sample]))
+        self._index = index
+        self._trained_rows = len(live)
+        self._configure_index(index)
+        self._add_to_index(live)
+
+    def _training_sample(self, live: np.ndarray, size: int = 100_000) -> np.ndarray:
+        return live if len(live) <= size else np.sort(np.random.default_rng(0).choice(live, size, replace=False))
+
+    def _index_input(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        What the faiss index takes for these (normalized) vectors: the floats,
+        or their sign bits packed into bytes for the binary index
+        """
+        if self.index_type == "binary":
+            return np.packbits(np.asarray(vectors) > 0, axis=1)
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def _add_to_index(self, rows: np.ndarray, block: int = 65536):
+        for start in range(0, len(rows), block):
+            part = rows[start:start + block]
+            self._index.add_with_ids(self._index_input(self.files.vectors[part]), part.astype(np.int64))
+        self._indexed_rows = len(self.files)
+        self._index_dirty = True
+
+    def _save_index(self):
+        """
+        Write the index under a new file name for the next snapshot; the file
+        of the published snapshot stays in place for readers still opening it.
+        """
+        import faiss
+
+        if self._index is None:
+            self._index_file = None
+            return
+        if not self._index_dirty:
+            return
+        index_file = f"index-{self._sequence + 1:06d}.faiss"
+        path = os.path.join(self.files.dir, index_file)
+        write = faiss.write_index_binary if self.index_type == "binary" else faiss.write_index
+        write(self._index, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self._index_file = index_file
+        self._index_dirty = False
+
+    # --- storage interface ---
+
+    def count(self) -> int:
+        return len(self._row_of)
+
+    def _upsert(self, ids: List[str], embeddings: np.ndarray, texts: List[str], metadatas: List[Dict[str, Any]]):
+        self._check_writable()
+        with self._lock:
+            rows = self.files.append(ids, _normalize_rows(embeddings), texts, metadatas)
+            replaced = []
+            for doc_id, row in zip(ids, rows):
+                old = self._row_of.get(doc_id)
+                if old is not None:
+                    replaced.append(old)
+                self._row_of[doc_id] = row
+            self.files.mark_deleted(replaced)
+            if self._index is not None:
+                self._add_to_index(np.asarray(rows, dtype=np.int64))
+            elif self.index_type in ("hnsw", "sq8", "binary"):
+                self._build_index()
+
+    def _delete_ids(self, ids: List[str]):
+        self._check_writable()
+        with self._lock:
+            rows = [self._row_of.pop(doc_id) for doc_id in ids if doc_id in self._row_of]
+            self.files.mark_deleted(rows)
+
+    def _clear(self):
+        self._check_writable()
+        with self._lock:
+            self.generation = self._next_generation()
+            self.files = ChunkFiles(os.path.join(self.persist_dir, self.generation))
+            self._row_of = {}
+            self._index = None
+            self._index_file = None
+            self._indexed_rows = 0
+            self._publish()
+            print(f"[INFO] Cleared FAISS store: {self.persist_dir}")
+
+    def _compact(self):
+        """
+        Copy live rows into a new generation and rebuild the index there;
+        flush() publishes it
+        """
+        generation = self._next_generation()
+        new_files = ChunkFiles(os.path.join(self.persist_dir, generation))
+        live = self.files.live_rows()
+        print(f"[INFO] Compacting FAISS store: {len(live)} live of {len(self.files)} rows")
+        for start in range(0, len(live), self.batch_size):
+            part = live[start:start + self.batch_size]
+            records = [self.files.record(row) for row in part]
+            new_files.append([self.files.ids[row] for row in part], np.asarray(self.files.vectors[part]),
+                             [text for text, _ in records], [metadata for _, metadata in records])
+        self.files = new_files
+        self.generation = generation
+        self._row_of = {doc_id: row for row, doc_id in enumerate(new_files.ids)}
+        self._build_index()
+
+    def flush(self):
+        """
+        Compact if too many rows are dead, train IVF-PQ once there is enough
+        data (and retrain sq8 once the store has doubled since its ranges were
+        learned), save the faiss and lexical indexes and publish a new
+        snapshot for readers.
+        """
+        self._check_writable()
+        with self._lock:
+            rows = len(self.files)
+            if rows and len(self.files.deleted) / rows > COMPACTION_RATIO:
+                self._compact()
+            elif self.index_type == "ivfpq" and self._index is None and self.count() >= self.ivf_min_train:
+                self._build_index()
+            elif self.index_type == "sq8" and self.count() >= 2 * self._trained_rows:
+                self._build_index()
+            self._save_index()
+            super().flush()
+            self._publish()
+
+    def _fetch(self, ids: List[str]) -> List[Tuple[str, str, Dict[str, Any], np.ndarray]]:
+        with self._lock:
+            fetched = []
+            for doc_id in ids:
+                row = self._row_of.get(doc_id)
+                if row is None:
+                    continue
+                text, metadata = self.files.record(row)
+                fetched.append((doc_id, text, metadata, np.array(self.files.vectors[row])))
+            return fetched
+
+    def _iter_texts(self, page_size: int) -> Iterator[Tuple[List[str], List[str]]]:
+        live = self.files.live_rows()
+        for start in range(0, len(live), page_size):
+            part = live[start:start + page_size]
+            yield [self.files.ids[row] for row in part], [self.files.record(row)[0] for row in part]
+
+    # The search helpers take the files and index to search rather than reading
+    # self.files and self._index, so a search sees one snapshot throughout
+
+    def _exact_search(self, files: ChunkFiles, query: np.ndarray, k: int, first_row: int = 0,
+                      block: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+        vectors = files.vectors
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+        dead = np.fromiter(files.deleted, dtype=np.int64) if files.deleted else None
+        for start in range(first_row, len(vectors), block):
+            scores = vectors[start:start + block] @ query
+            if dead is not None:
+                local = dead[(dead >= start) & (dead < start + block)] - start
+                scores[local] = -np.inf
+            rows = np.arange(start, start + len(scores))
+            if len(scores) > k:
+                top = np.argpartition(-scores, k)[:k]
+                scores, rows = scores[top], rows[top]
+            best_rows = np.concatenate([best_rows, rows])
+            best_scores = np.concatenate([best_scores, scores])
+        keep = np.isfinite(best_scores)
+        return best_rows[keep], best_scores[keep]
+
+    def _candidate_rows(self, files: ChunkFiles, index, query: np.ndarray, k: int) -> np.ndarray:
+        # Tombstoned rows may still be in the index, so fetch more until k live rows are found
+        fetch = k * (self.rescore_factor if self.index_type in COMPRESSED_INDEX_TYPES else 1)
+        while True:
+            fetch = min(fetch, index.ntotal)
+            _, found = index.search(self._index_input(query[None, :]), fetch)
+            # A reader's index never covers rows beyond its snapshot, but guard anyway
+            rows = [row for row in found[0] if 0 <= row < len(files) and row not in files.deleted]
+            if len(rows) >= k or fetch >= index.ntotal:
+                return np.asarray(rows, dtype=np.int64)
+            fetch *= 4
+
+    def _rows_matching(self, files: ChunkFiles, where: Dict[str, Any]) -> np.ndarray:
+        """
+        Live rows whose metadata matches where. The matches are kept per filter
+        and extended with rows appended since, so only new rows are parsed.
+        """
+        key = json.dumps(where, sort_keys=True)
+        cached_files, scanned, matched = self._filter_rows.get(key, (None, 0, []))
+        if cached_files is not files:
+            scanned, matched = 0, []
+        for row in range(scanned, len(files)):
+            if matches_where(files.record(row)[1], where):
+                matched.append(row)
+        self._filter_rows[key] = (files, len(files), matched)
+        rows = np.asarray(matched, dtype=np.int64)
+        if files.deleted:
+            rows = rows[~np.isin(rows, np.fromiter(files.deleted, dtype=np.int64))]
+        return rows
+
+    def _search_rows(self, files: ChunkFiles, index, indexed_rows: int, query: np.ndarray, k: int) -> np.ndarray:
+        """
+        Candidate rows for the k nearest live rows: an exact scan, or the index
+        plus an exact scan of rows appended since it was built
+        """
+        if index is None:
+            rows, _ = self._exact_search(files, query, k)
+            return rows
+        rows = self._candidate_rows(files, index, query, k)
+        if indexed_rows < len(files):
+            tail, _ = self._exact_search(files, query, k, first_row=indexed_rows)
+            rows = np.union1d(rows, tail)
+        return rows
+
+    def _rescore(self, files: ChunkFiles, query: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Exact rescoring from the stored vectors keeps scores comparable across index types
+        rows = np.sort(rows)
+        scores = np.asarray(files.vectors[rows]) @ query
+        order = np.argsort(-scores)[:k]
+        return rows[order], scores[order]
+
+    def _dense_search(self, query_embedding: np.ndarray, top_k: int,
+                      where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        query = _normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+        with self._lock:
+            snapshot = (self.files, self._index, self._indexed_rows, self.count())
+            if not self.read_only:
+                # The writer's files and index change in place, so its searches keep the lock
+                return self._search_snapshot(query, top_k, where, *snapshot)
+        # A reader's snapshot is never modified, only replaced by _swap_in, so concurrent
+        # queries search it without the lock and finish on the snapshot they started with
+        return self._search_snapshot(query, top_k, where, *snapshot)
+
+    def _search_snapshot(self, query: np.ndarray, top_k: int, where: Optional[Dict[str, Any]], files: ChunkFiles,
+                         index, indexed_rows: int, count: int) -> List[Dict[str, Any]]:
+        k = min(top_k, count)
+        if k <= 0:
+            return []
+        if where:
+            # A filtered subset is searched exactly: it is a fraction of the store by design
+            rows = self._rows_matching(files, where)
+        else:
+            rows = self._search_rows(files, index, indexed_rows, query, k)
+        rows, scores = self._rescore(files, query, rows, k)
+
+        retrieved_docs = []
+        for rank, (row, similarity) in enumerate(zip(rows.tolist(), scores.tolist()), 1):
+            text, metadata = files.record(row)
+            retrieved_docs.append({
+                "id": files.ids[row],
+                "content": text,
+                "metadata": metadata,
+                "similarity_score": similarity,
+                "distance": 1 - similarity,
+                "rank": rank
+            })
+        return retrieved_docs
+
+    def measure_recall(self, k: int = 10, queries: Optional[np.ndarray] = None,
+                       sample_size: int = 200) -> Dict[str, Any]:
+        """
+        Measure what the index costs in recall and saves in memory, compared
+        with exact search over the float32 vectors.
+
+        Args:
+            k: Results compared per query (use the retrieval candidate depth)
+            queries: Query embeddings (default: sample_size stored vectors, each
+                excluding itself, as stand-ins for queries)
+            sample_size: Stored vectors sampled when no queries are given
+
+        Returns:
+            index_type, queries, k, recall_at_k (share of the exact top k the
+            index path returns, after rescoring), recall_loss (1 - recall_at_k),
+            index_bytes (serialized index, or the vectors for exact search),
+            float32_bytes and compression (float32_bytes / index_bytes)
+        """
+        import faiss
+
+        with self._lock:
+            live = self.files.live_rows()
+            if queries is None:
+                sample = self._training_sample(live, sample_size)
+                queries, skip = np.asarray(self.files.vectors[sample]), sample
+            else:
+                queries, skip = _normalize_rows(queries), None
+            k = min(k, len(live) - (1 if skip is not None else 0))
+            recalls = []
+            for i, query in enumerate(queries):
+                if k <= 0:
+                    break
+                # One extra result covers the query vector itself when it is a stored row
+                fetch = k + (1 if skip is not None else 0)
+                exact, _ = self._rescore(self.files, query, self._exact_search(self.files, query, fetch)[0], fetch)
+                approx, _ = self._rescore(self.files, query, self._search_rows(self.files, self._index, self._indexed_rows,
+                                                                               query, fetch), fetch)
+                if skip is not None:
+                    exact, approx = exact[exact != skip[i]][:k], approx[approx != skip[i]][:k]
+                recalls.append(len(np.intersect1d(exact, approx)) / len(exact))
+
+            float32_bytes = len(live) * (self.files.dim or 0) * 4
+            if self._index is None:
+                index_bytes = float32_bytes
+            elif self.index_type == "binary":
+                index_bytes = len(faiss.serialize_index_binary(self._index))
+            else:
+                index_bytes = len(faiss.serialize_index(self._index))
+        recall = float(np.mean(recalls)) if recalls else 1.0
+        return {
+            "index_type": self.index_type,
+            "queries": len(recalls),
+            "k": k,
+            "recall_at_k": recall,
+            "recall_loss": 1.0 - recall,
+            "index_bytes": index_bytes,
+            "float32_bytes": float32_bytes,
+            "compression": float32_bytes / index_bytes if index_bytes else 1.0,
+        }
+
+
+def migrate_from_chroma(chroma_dir: str, persist_dir: str, collection_name: str = "pdf_documents",
+                        index_type: str = "hnsw", page_size: int = 1000) -> FaissVectorStore:
+    """
+    Copy every chunk (id, embedding, text, metadata) of a Chroma collection into a
+    FAISS store without re-embedding. The Chroma index manifest is copied too, so
+    the next incremental sync treats all files as already indexed.
+    """
+    import chromadb
+    from chromadb.config import Settings
+
+    client = chromadb.PersistentClient(path=chroma_dir, settings=Settings(anonymized_telemetry=False))
+    collection = client.get_collection(collection_name)
+    settings = {"embedding_model": "all-MiniLM-L6-v2", "chunk_size": 1000, "chunk_overlap": 200}
+    manifest_path = os.path.join(chroma_dir, MANIFEST_FILENAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            settings.update(json.load(f).get("settings", {}))
+
+    store = FaissVectorStore(persist_dir=persist_dir, embedding_model=settings["embedding_model"],
+                             chunk_size=settings["chunk_size"], chunk_overlap=settings["chunk_overlap"],
+                             index_type=index_type)
+    store.clear()
+    total = collection.count()
+    print(f"[INFO] Migrating {total} chunks from Chroma collection '{collection_name}'...")
+    for offset in range(0, total, page_size):
+        page = collection.get(include=["documents", "metadatas", "embeddings"], limit=page_size, offset=offset)
+        store._upsert(page["ids"], np.asarray(page["embeddings"], dtype=np.float32), page["documents"], page["metadatas"])
+        store.lexical_index.add(page["ids"], page["documents"])
+        print(f"[INFO] Migrated {min(offset + page_size, total)}/{total}")
+    store.flush()
+    if os.path.exists(manifest_path):
+        shutil.copyfile(manifest_path, os.path.join(persist_dir, MANIFEST_FILENAME))
+    print(f"[INFO] Migration finished: {store.count()} chunks in {persist_dir}")
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a Chroma collection into a FAISS vector store")
+    parser.add_argument("--from-chroma", default="./data/vector_store", help="Chroma persist directory")
+    parser.add_argument("--collection", default="pdf_documents")
+    parser.add_argument("--persist-dir", default="./data/faiss_store", help="FAISS store directory")
+    parser.add_argument("--index-type", default="hnsw", choices=INDEX_TYPES)
+    parser.add_argument("--report", action="store_true",
+                        help="Instead of migrating, print recall and size of an --index-type index of --persist-dir")
+    parser.add_argument("--k", type=int, default=15, help="Results compared per query with --report")
+    args = parser.parse_args()
+    if args.report:
+        store = FaissVectorStore(persist_dir=args.persist_dir, index_type=args.index_type)
+        print(json.dumps(store.measure_recall(k=args.k), indent=2))
+        return
+    migrate_from_chroma(args.from_chroma, args.persist_dir, args.collection, args.index_type)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import os
+import time
+import argparse
+from typing import Optional
+from src.faiss_store import INDEX_TYPES, FaissVectorStore
+from src.models import INFERENCE_BACKENDS
+from src.token_store import ChunkTokenStore
+
+def run_writer(data_dir: str, persist_dir: str, index_type: str = "hnsw", inference_backend: str = "torch",
+               watch: float = 0.0, reranker_model: Optional[str] = None):
+    """
+    Single writer of a FAISS store served by read-only workers: sync the store
+    with data_dir (only new or changed files are embedded) and publish a
+    snapshot, once or every `watch` seconds. With reranker_model, the workers'
+    cross-encoder token ids of new chunks are stored too (see src/token_store.py).
+    """
+    store = FaissVectorStore(persist_dir=persist_dir, index_type=index_type, inference_backend=inference_backend)
+    if reranker_model:
+        store.token_store = ChunkTokenStore(os.path.join(persist_dir, "token_cache"), reranker_model)
+    while True:
+        started = time.perf_counter()
+        # Publishes a new snapshot only if something changed
+        stats = store.sync_directory(data_dir)
+        print(f"[INFO] Index sync finished in {time.perf_counter() - started:.1f}s: {stats}; "
+              f"{store.count()} documents published")
+        if not watch:
+            return store
+        time.sleep(watch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep a FAISS store in sync with the documents directory")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--persist-dir", default="./data/faiss_store")
+    parser.add_argument("--index-type", default="hnsw", choices=INDEX_TYPES)
+    parser.add_argument("--inference-backend", default="torch", choices=INFERENCE_BACKENDS)
+    parser.add_argument("--watch", type=float, default=0.0, help="Re-sync every N seconds (default: sync once and exit)")
+    parser.add_argument("--reranker-model", default="cross-encoder/ms-marco-MiniLM-L-6-v2",
+                        help="Cross-encoder whose token ids are stored for new chunks")
+    parser.add_argument("--no-rerank-token-cache", action="store_true", help="Don't store chunk token ids")
+    args = parser.parse_args()
+    run_writer(args.data_dir, args.persist_dir, args.index_type, args.inference_backend, args.watch,
+               None if args.no_rerank_token_cache else args.reranker_model)
+
+
+if __name__ == "__main__":
+    main()
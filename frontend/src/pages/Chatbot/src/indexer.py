@@ -0,0 +1,256 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import List, Any, Dict, Optional
+
+MANIFEST_FILENAME = "index_manifest.json"
+MANIFEST_VERSION = 1
+EXTRACTION_CACHE_DIRNAME = "extraction_cache"
+
+def file_sha256(file_path: Path, block_size: int = 1 << 20) -> str:
+    """
+    Hash a file's contents without reading it into memory in one go.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def make_chunk_id(source_key: str, text: str, page: Any = None, occurrence: int = 0) -> str:
+    """
+    Build a deterministic chunk id from the source file and the chunk content.
+    The same chunk of the same file always gets the same id, so re-indexing
+    upserts in place instead of creating duplicates.
+
+    Args:
+        source_key: Stable identifier of the source file (relative path)
+        text: Chunk text
+        page: Page number the chunk came from, if any
+        occurrence: Disambiguates identical chunks within one file
+    """
+    file_part = hashlib.sha1(source_key.encode("utf-8")).hexdigest()[:12]
+    chunk_part = hashlib.sha1(f"{page}\x00{text}".encode("utf-8")).hexdigest()[:16]
+    chunk_id = f"{file_part}_{chunk_part}"
+    if occurrence:
+        chunk_id += f"_{occurrence}"
+    return chunk_id
+
+def assign_chunk_ids(chunks: List[Any], default_source: Optional[str] = None) -> List[str]:
+    """
+    Assign deterministic ids to a list of chunks.
+    The source key is taken from the chunk metadata unless default_source is given.
+    """
+    ids = []
+    seen: Dict[str, int] = {}
+    for chunk in chunks:
+        metadata = chunk.metadata or {}
+        source_key = default_source or str(metadata.get('source_path') or metadata.get('source', 'unknown'))
+        base_id = make_chunk_id(source_key, chunk.page_content, metadata.get('page'))
+        occurrence = seen.get(base_id, 0)
+        seen[base_id] = occurrence + 1
+        ids.append(make_chunk_id(source_key, chunk.page_content, metadata.get('page'), occurrence))
+    return ids
+
+
+class IndexManifest:
+    """
+    Per-file record of what is currently in the vector store:
+    path -> mtime, size, content hash and the ids of the chunks it produced.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.settings: Dict[str, Any] = {}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.exists = os.path.exists(path)
+        if self.exists:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.settings = data.get("settings", {})
+                self.files = data.get("files", {})
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] Could not read index manifest {self.path}: {e}")
+
+    def save(self):
+        """
+        Write the manifest atomically so a crash never leaves a half-written file.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "settings": self.settings, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
+        self.exists = True
+
+
+class IncrementalIndexer:
+    """
+    Keeps a vector store in sync with a data directory.
+    Only new or changed files are loaded, chunked and embedded; chunks of
+    removed files are deleted. Unchanged files cost one stat() call.
+    """
+
+    def __init__(self, store: Any, data_dir: str, max_workers: Optional[int] = None, max_in_flight: Optional[int] = None):
+        """
+        Args:
+            store: Vector store exposing add_documents(chunks, embeddings, ids), delete(ids),
+                   clear(), count(), flush(), persist_dir and get_embedding_pipeline()
+            data_dir: Directory to index
+            max_workers: Parallel file parsers (default: CPU count)
+            max_in_flight: Parsed files buffered ahead of embedding (default: 2 x max_workers)
+        """
+        self.store = store
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight
+        self.data_dir = Path(data_dir).resolve()
+        self.persist_dir = Path(store.persist_dir).resolve()
+        self.manifest = IndexManifest(os.path.join(store.persist_dir, MANIFEST_FILENAME))
+        # Manifest entries from before a settings reset, kept only for their content hashes
+        self._previous_files: Dict[str, Dict[str, Any]] = {}
+
+    def _current_settings(self) -> Dict[str, Any]:
+        return {
+            "embedding_model": self.store.embedding_model,
+            "chunk_size": self.store.chunk_size,
+            "chunk_overlap": self.store.chunk_overlap,
+        }
+
+    def scan(self) -> Dict[str, Path]:
+        """
+        Return supported files under data_dir keyed by their posix path relative to it.
+        The vector store's own directory is skipped, as is any other directory
+        holding an index manifest (e.g. a Chroma store next to a FAISS one).
+        """
+        from src.dataloader import iter_supported_files
+
+        return {
+            file_path.relative_to(self.data_dir).as_posix(): file_path
+            for file_path in iter_supported_files(self.data_dir, exclude_dirs=[self.persist_dir], skip_marker=MANIFEST_FILENAME)
+        }
+
+    def plan(self, files: Dict[str, Path]) -> Dict[str, List[str]]:
+        """
+        Compare the files on disk against the manifest.
+        mtime and size are checked first; the content hash is only computed
+        when they differ, so touching a file does not trigger re-embedding.
+        """
+        plan = {"added": [], "changed": [], "removed": [], "unchanged": []}
+        self._hashes: Dict[str, str] = {}
+
+        for key, file_path in files.items():
+            stat = file_path.stat()
+            entry = self.manifest.files.get(key)
+            if entry is None:
+                plan["added"].append(key)
+                previous = self._previous_files.get(key)
+                if previous and previous.get("mtime") == stat.st_mtime and previous.get("size") == stat.st_size:
+                    # Re-indexed after a settings change: the old hash still finds its extraction cache entry
+                    self._hashes[key] = previous["sha256"]
+                continue
+            if entry.get("mtime") == stat.st_mtime and entry.get("size") == stat.st_size:
+                plan["unchanged"].append(key)
+                continue
+            content_hash = file_sha256(file_path)
+            self._hashes[key] = content_hash
+            if content_hash == entry.get("sha256"):
+                entry["mtime"], entry["size"] = stat.st_mtime, stat.st_size
+                plan["unchanged"].append(key)
+            else:
+                plan["changed"].append(key)
+
+        plan["removed"] = [key for key in self.manifest.files if key not in files]
+        return plan
+
+    def _reset_if_incompatible(self) -> bool:
+        """
+        Drop everything when the manifest cannot describe the store: either it is
+        missing while the store has data (legacy random ids), or the embedding
+        model / chunking settings changed. The dropped entries' content hashes
+        are still used by plan(), so unchanged files are not read again.
+        """
+        settings = self._current_settings()
+        legacy = not self.manifest.exists and self.store.count() > 0
+        changed_settings = self.manifest.exists and self.manifest.settings != settings
+        if legacy or changed_settings:
+            reason = "no index manifest found" if legacy else "embedding/chunking settings changed"
+            print(f"[INFO] Rebuilding vector store from scratch ({reason})")
+            self.store.clear()
+            self._previous_files = self.manifest.files
+            self.manifest.files = {}
+        self.manifest.settings = settings
+        return legacy or changed_settings
+
+    def _index_documents(self, key: str, documents: List[Any]) -> List[str]:
+        old_ids = set(self.manifest.files.get(key, {}).get("chunk_ids", []))
+        emb_pipe = self.store.get_embedding_pipeline()
+        chunks = emb_pipe.chunk_documents(documents)
+        chunk_ids = assign_chunk_ids(chunks, default_source=key)
+
+        # Chunks whose id already exists have identical text and page, so they keep their embedding
+        new_chunks = [(chunk_id, chunk) for chunk_id, chunk in zip(chunk_ids, chunks) if chunk_id not in old_ids]
+        stale_ids = old_ids.difference(chunk_ids)
+        if stale_ids:
+            self.store.delete(sorted(stale_ids))
+        if new_chunks:
+            ids = [chunk_id for chunk_id, _ in new_chunks]
+            docs = [chunk for _, chunk in new_chunks]
+            start = 0
+            for batch, embeddings in emb_pipe.iter_embedded_batches(docs):
+                self.store.add_documents(batch, embeddings, ids=ids[start:start + len(batch)])
+                start += len(batch)
+        print(f"[INFO] Indexed {key}: {len(new_chunks)} new, {len(stale_ids)} removed, "
+              f"{len(chunk_ids) - len(new_chunks)} unchanged chunks")
+        return chunk_ids
+
+    def sync(self) -> Dict[str, int]:
+        """
+        Bring the vector store up to date with data_dir.
+        Returns counts of added, changed, removed and unchanged files.
+        """
+        self._reset_if_incompatible()
+        files = self.scan()
+        plan = self.plan(files)
+        print(f"[INFO] Index sync: {len(plan['added'])} added, {len(plan['changed'])} changed, "
+              f"{len(plan['removed'])} removed, {len(plan['unchanged'])} unchanged files")
+
+        for key in plan["removed"]:
+            chunk_ids = self.manifest.files.pop(key).get("chunk_ids", [])
+            if chunk_ids:
+                self.store.delete(chunk_ids)
+
+        # Files are parsed in a worker pool and embedded here as soon as each one finishes
+        from src.dataloader import iter_documents
+
+        keys_by_path = {files[key]: key for key in plan["added"] + plan["changed"]}
+        # Parsed pages are cached by content hash, so a rebuild after a chunking change doesn't parse again.
+        # Changed files were hashed by plan() and files unchanged since a settings reset keep their old
+        # hash; the loader hashes the other added ones and hands the hash back
+        cache_dir = os.path.join(self.store.persist_dir, EXTRACTION_CACHE_DIRNAME)
+        known_hashes = {files[key]: content_hash for key, content_hash in self._hashes.items()}
+        documents_iter = iter_documents(list(keys_by_path), max_workers=self.max_workers, max_in_flight=self.max_in_flight,
+                                        cache_dir=cache_dir, content_hashes=known_hashes) if keys_by_path else []
+        for file_path, documents, content_hash in documents_iter:
+            key = keys_by_path[file_path]
+            stat = file_path.stat()
+            content_hash = content_hash or file_sha256(file_path)
+            chunk_ids = self._index_documents(key, documents)
+            self.manifest.files[key] = {
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "sha256": content_hash,
+                "chunk_ids": chunk_ids,
+            }
+            # Save after every file so an interrupted sync resumes where it stopped
+            self.manifest.save()
+
+        self.store.flush()
+        self.manifest.save()
+        self._previous_files = {}
+        return {name: len(keys) for name, keys in plan.items()}
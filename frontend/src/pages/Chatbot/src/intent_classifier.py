@@ -0,0 +1,108 @@
+import re
+import threading
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+from src.dataloader import DOCUMENT_TYPE_KEYWORDS
+
+INTENT_ROUTING_MODES = ("off", "rules", "centroid")
+
+# Words questions use for a type on top of its filename keywords (after query preprocessing).
+# Keywords match whole words plus a plain inflection (s/es/ed/ing), so compound and
+# irregular forms ("classroom", "laboratories") are listed explicitly
+QUERY_KEYWORDS = {
+    'events': ['competition', 'contest', 'seminar', 'workshop', 'ceremony', 'festival'],
+    'courses': ['exam', 'examination', 'semester', 'credit', 'grade', 'lecture', 'prerequisite', 'classroom'],
+    'clubs': ['member', 'membership', 'societies'],
+    'facilities': ['library', 'libraries', 'gymnasium', 'lab', 'laboratory', 'laboratories', 'hall', 'cafeteria',
+                   'hostel', 'parking', 'facilities'],
+    'sponsorship': ['fund'],
+    'policies': ['allowed', 'prohibited', 'penalty', 'penalties', 'policies'],
+}
+# Inflections a keyword may carry: "events", "classes", "funded", "parking"
+KEYWORD_SUFFIX = r'(?:s|es|ed|ing)?'
+
+class QueryIntentClassifier:
+    """
+    Guesses which document_type (see dataloader.classify_document) a question is about,
+    so retrieval can search only chunks of that type.
+
+    Keyword rules come first: the keywords classify_document uses on filenames
+    plus QUERY_KEYWORDS, matched as whole words. Confidence is the share of keyword hits that point to the winning
+    type. Questions no rule matches can fall back to an embedding-centroid model:
+    each type is represented by the embedding of its name and keywords, and
+    confidence is the softmax weight of the nearest one. Uses the query
+    embedding the pipeline already computed, so it costs no extra encode.
+    """
+
+    def __init__(self, keywords: Optional[List[Tuple[str, List[str]]]] = None,
+                 encode: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 min_confidence: float = 0.6, temperature: float = 0.05):
+        """
+        Args:
+            keywords: (document_type, keywords) pairs (default: dataloader.DOCUMENT_TYPE_KEYWORDS
+                extended with QUERY_KEYWORDS)
+            encode: Embeds a list of texts; enables the centroid model when given
+            min_confidence: Confidence needed before route() narrows the search
+            temperature: Softmax temperature over centroid cosine similarities
+        """
+        self.keywords = keywords or [(doc_type, words + QUERY_KEYWORDS.get(doc_type, []))
+                                     for doc_type, words in DOCUMENT_TYPE_KEYWORDS]
+        # Whole words, so "example" is not an exam and "label" not a lab
+        self._patterns = [(doc_type, re.compile(r'\b(?:' + '|'.join(map(re.escape, words)) + ')' + KEYWORD_SUFFIX + r'\b'))
+                          for doc_type, words in self.keywords]
+        self.encode = encode
+        self.min_confidence = min_confidence
+        self.temperature = temperature
+        self._centroids: Optional[np.ndarray] = None
+        self._centroid_lock = threading.Lock()
+
+    def _rule_scores(self, query: str) -> Dict[str, int]:
+        query_lower = query.lower()
+        scores = {}
+        for doc_type, pattern in self._patterns:
+            hits = len(pattern.findall(query_lower))
+            if hits:
+                scores[doc_type] = hits
+        return scores
+
+    @property
+    def centroids(self) -> np.ndarray:
+        """
+        Normalized embedding per document type, computed on first use
+        """
+        if self._centroids is None:
+            with self._centroid_lock:
+                if self._centroids is None:
+                    texts = [f"{doc_type}: {', '.join(keywords)}" for doc_type, keywords in self.keywords]
+                    centroids = np.asarray(self.encode(texts), dtype=np.float32)
+                    self._centroids = centroids / np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        return self._centroids
+
+    def classify(self, query: str, query_embedding: Optional[np.ndarray] = None) -> Tuple[Optional[str], float]:
+        """
+        Most likely document type of the query and the confidence in it (0-1);
+        (None, 0.0) when neither rules nor centroids have an opinion
+        """
+        scores = self._rule_scores(query)
+        if scores:
+            best = max(scores, key=scores.get)
+            return best, scores[best] / sum(scores.values())
+        if self.encode is None or query_embedding is None:
+            return None, 0.0
+
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        similarities = self.centroids @ (vector / max(float(np.linalg.norm(vector)), 1e-12))
+        weights = np.exp((similarities - similarities.max()) / self.temperature)
+        weights /= weights.sum()
+        best = int(np.argmax(weights))
+        return self.keywords[best][0], float(weights[best])
+
+    def route(self, query: str, query_embedding: Optional[np.ndarray] = None) -> Optional[Dict[str, str]]:
+        """
+        where filter restricting retrieval to the query's document type, or None
+        to search everything (no type or not confident enough)
+        """
+        doc_type, confidence = self.classify(query, query_embedding)
+        if doc_type is None or confidence < self.min_confidence:
+            return None
+        return {"document_type": doc_type}
@@ -0,0 +1,171 @@
+import os
+import re
+import math
+import heapq
+import pickle
+import threading
+from collections import Counter
+from typing import List, Dict, Tuple, Iterable
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase word tokens. Alphanumeric runs such as course codes (cse4501)
+    stay whole so they can be matched exactly.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Inverted BM25 index kept alongside the vector store.
+
+    Postings map term -> {doc_id: term frequency}; document lengths and IDF are
+    precomputed, so a query only touches the posting lists of its own terms
+    instead of rescoring every document like BM25Okapi does.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            path: Pickle file the index is persisted to
+            k1: Term frequency saturation
+            b: Length normalization strength
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.doc_terms: Dict[str, List[str]] = {}
+        self.total_length = 0
+        self.idf: Dict[str, float] = {}
+        self.doc_norms: Dict[str, float] = {}
+        self._idf_stale = False
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+            self.postings = state["postings"]
+            self.doc_lengths = state["doc_lengths"]
+            self.doc_terms = state["doc_terms"]
+            self.total_length = sum(self.doc_lengths.values())
+            self._idf_stale = True
+            print(f"[INFO] Loaded lexical index with {len(self.doc_lengths)} documents")
+        except Exception as e:
+            print(f"[ERROR] Could not load lexical index {self.path}: {e}")
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"postings": self.postings, "doc_lengths": self.doc_lengths, "doc_terms": self.doc_terms},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def _remove(self, doc_id: str):
+        for term in self.doc_terms.pop(doc_id, []):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id, 0)
+
+    def add(self, ids: List[str], texts: List[str]):
+        """
+        Index (or re-index) documents by id.
+        """
+        with self._lock:
+            for doc_id, text in zip(ids, texts):
+                if doc_id in self.doc_lengths:
+                    self._remove(doc_id)
+                term_counts = Counter(tokenize(text))
+                for term, tf in term_counts.items():
+                    self.postings.setdefault(term, {})[doc_id] = tf
+                length = sum(term_counts.values())
+                self.doc_lengths[doc_id] = length
+                self.doc_terms[doc_id] = list(term_counts)
+                self.total_length += length
+            self._idf_stale = True
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+            self._idf_stale = True
+
+    def clear(self):
+        with self._lock:
+            self.postings = {}
+            self.doc_lengths = {}
+            self.doc_terms = {}
+            self.total_length = 0
+            self.idf = {}
+            self.doc_norms = {}
+            self._idf_stale = False
+
+    def _refresh_idf(self):
+        # IDF and per-document length norms are recomputed once after a batch of writes, never per query
+        n_docs = len(self.doc_lengths)
+        avg_length = self.total_length / n_docs if n_docs else 1.0
+        self.idf = {
+            term: math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in self.postings.items()
+        }
+        self.doc_norms = {
+            doc_id: self.k1 * (1 - self.b + self.b * length / avg_length)
+            for doc_id, length in self.doc_lengths.items()
+        }
+        self._idf_stale = False
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Score documents containing at least one query term.
+        Returns (doc_id, bm25_score) pairs, best first.
+        """
+        with self._lock:
+            if not self.doc_lengths:
+                return []
+            if self._idf_stale:
+                self._refresh_idf()
+
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                weight = self.idf[term] * (self.k1 + 1)
+                doc_norms = self.doc_norms
+                for doc_id, tf in posting.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + weight * tf / (tf + doc_norms[doc_id])
+
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse several rankings of document ids: score(d) = sum over lists of 1 / (k + rank).
+
+    Args:
+        ranked_lists: Lists of ids, best first
+        k: Damping constant (60 is the value from the original RRF paper)
+
+    Returns:
+        (doc_id, fused_score) pairs, best first
+    """
+    fused: Dict[str, float] = {}
+    for ranking in ranked_lists:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,455 @@
+import time
+import random
+import asyncio
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict, deque
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, Optional
+from src.metrics import REGISTRY
+from src import logger
+
+class LLMUnavailableError(Exception):
+    """
+    The LLM could not answer: circuit open, deadline exceeded or retries exhausted
+    """
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _is_upstream_down(error: Exception) -> bool:
+    """
+    Timeouts, connection failures and 5xx: the errors that count towards opening the circuit
+    """
+    status = _status_code(error)
+    if status is not None:
+        return status >= 500
+    name = type(error).__name__
+    return isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)) or "Timeout" in name or "Connection" in name
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _shared(response: Any) -> SimpleNamespace:
+    # Coalesced callers get the text only, so the tokens of one upstream call are counted once
+    return SimpleNamespace(content=response.content, usage_metadata=None)
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive upstream failures. While open,
+    calls are refused; after reset_seconds a single probe call is let through
+    (half-open), and its outcome closes or re-opens the circuit. A probe that
+    ends without an outcome (cancelled) must call release_probe().
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._probing or time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._probing and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._probing = True
+                return True
+            return False
+
+    def release_probe(self):
+        """
+        A call let through by allow() ended without an outcome, e.g. its client
+        disconnected. If it was the half-open probe, the circuit stays open for
+        another reset_seconds instead of waiting forever for that outcome.
+        """
+        with self._lock:
+            if self._probing:
+                self._probing = False
+                self._opened_at = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("LLM circuit closed")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                if not self._probing:
+                    logger.error(f"LLM circuit opened after {self._failures} consecutive failures")
+                    REGISTRY.counter("rag_llm_circuit_opens_total", "Times the LLM circuit breaker opened").inc()
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class LLMGateway:
+    """
+    Resilience layer between RAGSearch and the chat model, with the same
+    invoke/ainvoke/astream interface.
+
+    - pooled connections: connect_groq() builds ChatGroq on shared keep-alive
+      httpx clients instead of the SDK defaults
+    - single-flight: identical prompts already in flight wait for that call
+      instead of sending their own
+    - deadline: every call, retries included, ends after deadline_seconds
+    - hedging (async only): when a call is slower than the hedge_percentile of
+      recent latencies, a second identical request is sent and the first
+      answer wins
+    - retries: rate limits (429), 5xx and connection errors are retried with
+      exponential backoff and jitter, honouring Retry-After
+    - circuit breaker: after repeated upstream failures calls fail fast with
+      LLMUnavailableError; the last answer to the same prompt is served
+      instead when there is one
+
+    Streams get the breaker, deadline and retries up to their first token.
+    """
+
+    def __init__(self, llm: Any = None, deadline_seconds: float = 30.0, hedge_percentile: Optional[float] = 0.95,
+                 hedge_min_samples: int = 20, max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 failure_threshold: int = 5, reset_seconds: float = 30.0, stale_cache_size: int = 256,
+                 base_url: Optional[str] = None, max_connections: int = 100):
+        """
+        Args:
+            llm: Chat model to wrap (or set later, e.g. by connect_groq())
+            deadline_seconds: Longest a call may take, retries and backoff included
+            hedge_percentile: Latency percentile (0-1) after which a hedged request is sent; None disables
+            hedge_min_samples: Latencies observed before hedging starts
+            max_retries: Retries of a rate-limited or failed call
+            backoff_base: First retry delay in seconds, doubled per retry
+            backoff_max: Longest retry delay
+            failure_threshold: Consecutive upstream failures that open the circuit
+            reset_seconds: How long the circuit stays open before a probe call
+            stale_cache_size: Last answers kept per prompt for serving while the upstream is down
+            base_url: Groq API URL for connect_groq() (e.g. the stub server in benchmarks/)
+            max_connections: Size of the HTTP connection pool
+        """
+        self.llm = llm
+        self.deadline_seconds = deadline_seconds
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.stale_cache_size = stale_cache_size
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self._latencies: deque = deque(maxlen=200)
+        self._stale: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Dict[str, Any]] = {}
+        self._inflight_async: Dict[Any, Dict[str, Any]] = {}
+
+    def connect_groq(self, api_key: str, model_name: str, **kwargs):
+        """
+        Wrap a ChatGroq whose sync and async HTTP clients keep up to
+        max_connections connections alive. The SDK's own retries are off:
+        retrying is the gateway's job.
+        """
+        import httpx
+        from langchain_groq import ChatGroq
+
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections,
+                              keepalive_expiry=60.0)
+        timeout = httpx.Timeout(self.deadline_seconds, connect=min(5.0, self.deadline_seconds))
+        self.llm = ChatGroq(
+            groq_api_key=api_key,
+            model_name=model_name,
+            base_url=self.base_url,
+            max_retries=0,
+            timeout=self.deadline_seconds,
+            http_client=httpx.Client(limits=limits, timeout=timeout),
+            http_async_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+            **kwargs
+        )
+        return self.llm
+
+    def after_fork(self):
+        # Calls in flight in the parent never finish in a forked child
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_async = {}
+
+    # --- shared policy ---
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Seconds after which a hedged request is sent, None while hedging is off
+        or too few latencies were observed
+        """
+        if not self.hedge_percentile or len(self._latencies) < self.hedge_min_samples:
+            return None
+        return float(np.percentile(list(self._latencies), self.hedge_percentile * 100))
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+        retry_after = _retry_after(error)
+        return max(delay, min(retry_after, self.backoff_max)) if retry_after is not None else delay
+
+    def _should_retry(self, error: Exception, attempt: int, deadline: float) -> Optional[float]:
+        """
+        Backoff before the next attempt, or None if the error is final
+        """
+        status = _status_code(error)
+        if attempt >= self.max_retries or not (status == 429 or _is_upstream_down(error)):
+            return None
+        if self.breaker.state == "open":
+            return None
+        delay = self._backoff(attempt, error)
+        if time.monotonic() + delay >= deadline:
+            return None
+        REGISTRY.counter("rag_llm_retries_total", "LLM calls retried by reason",
+                         reason="rate_limited" if status == 429 else "error").inc()
+        return delay
+
+    @staticmethod
+    def _key(prompt: str) -> str:
+        return hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, response: Any):
+        with self._lock:
+            self._stale[key] = response.content
+            self._stale.move_to_end(key)
+            while len(self._stale) > self.stale_cache_size:
+                self._stale.popitem(last=False)
+
+    def _unavailable(self, key: str, reason: str, cause: Optional[Exception] = None) -> SimpleNamespace:
+        """
+        The last answer to this prompt if there is one, LLMUnavailableError otherwise
+        """
+        with self._lock:
+            stale = self._stale.get(key)
+        if stale is not None:
+            REGISTRY.counter("rag_llm_fallbacks_total", "Answers served without the LLM by kind", kind="stale").inc()
+            return SimpleNamespace(content=stale, usage_metadata=None)
+        raise LLMUnavailableError(reason) from cause
+
+    def _record_outcome(self, error: Optional[Exception]):
+        if error is None:
+            outcome = "ok"
+        elif _status_code(error) == 429:
+            outcome = "rate_limited"
+        elif isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+            outcome = "timeout"
+        else:
+            outcome = "error"
+        REGISTRY.counter("rag_llm_calls_total", "Upstream LLM calls by outcome", outcome=outcome).inc()
+        # Only an upstream that doesn't answer counts against the circuit; a 429 or 400 is an answer
+        if error is not None and _is_upstream_down(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    # --- sync ---
+
+    def invoke(self, prompt: str) -> Any:
+        key = self._key(prompt)
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = {"done": threading.Event(), "response": None, "error": None}
+        if not leader:
+            REGISTRY.counter("rag_llm_coalesced_total", "Calls answered by an identical call already in flight").inc()
+            if not flight["done"].wait(self.deadline_seconds):
+                raise LLMUnavailableError("Deadline exceeded waiting for an identical call")
+            if flight["error"] is not None:
+                raise flight["error"]
+            return _shared(flight["response"])
+        try:
+            flight["response"] = self._call(prompt, key)
+            return flight["response"]
+        except Exception as e:
+            flight["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight["done"].set()
+
+    def _call(self, prompt: str, key: str) -> Any:
+        # The blocking client can't be interrupted, so its own timeout is the deadline per attempt
+        deadline = time.monotonic() + self.deadline_seconds
+        if not self.breaker.allow():
+            return self._unavailable(key, "LLM circuit is open")
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = self.llm.invoke(prompt)
+            except Exception as e:
+                self._record_outcome(e)
+                delay = self._should_retry(e, attempt, deadline)
+                if delay is None:
+                    return self._unavailable(key, f"LLM call failed: {e}", e)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._record_outcome(None)
+            self._latencies.append(time.monotonic() - started)
+            self._remember(key, response)
+            return response
+
+    # --- async ---
+
+    async def ainvoke(self, prompt: str) -> Any:
+        loop = asyncio.get_running_loop()
+        key = self._key(prompt)
+        flight_key = (id(loop), key)
+        flight = self._inflight_async.get(flight_key)
+        leader = flight is None
+        if leader:
+            # The call runs as its own task, so a caller that is cancelled (request timeout,
+            # client gone) doesn't cancel it for the identical calls waiting on it
+            flight = self._inflight_async[flight_key] = {"task": asyncio.ensure_future(self._acall(prompt, key)),
+                                                         "waiters": 0}
+
+            def finished(task: asyncio.Task):
+                if self._inflight_async.get(flight_key) is flight:
+                    del self._inflight_async[flight_key]
+                # Nobody may be waiting; don't let an unread exception be reported
+                task.cancelled() or task.exception()
+
+            flight["task"].add_done_callback(finished)
+        else:
+            REGISTRY.counter("rag_llm_coalesced_total", "Calls answered by an identical call already in flight").inc()
+
+        task = flight["task"]
+        flight["waiters"] += 1
+        try:
+            response = await asyncio.shield(task)
+        finally:
+            flight["waiters"] -= 1
+            if not flight["waiters"] and not task.done():
+                # The last caller gave up: stop the call, and let it release a half-open probe
+                task.cancel()
+                await asyncio.wait([task])
+        return response if leader else _shared(response)
+
+    async def _acall(self, prompt: str, key: str) -> Any:
+        deadline = time.monotonic() + self.deadline_seconds
+        if not self.breaker.allow():
+            return self._unavailable(key, "LLM circuit is open")
+        attempt = 0
+        try:
+            while True:
+                try:
+                    response = await self._hedged(prompt, deadline)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._record_outcome(e)
+                    delay = self._should_retry(e, attempt, deadline)
+                    if delay is None:
+                        return self._unavailable(key, f"LLM call failed: {e!r}", e)
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                self._record_outcome(None)
+                self._remember(key, response)
+                return response
+        except asyncio.CancelledError:
+            # Client gone, request timed out or batch cancelled: a probe must not hold the circuit half-open
+            self.breaker.release_probe()
+            raise
+
+    async def _hedged(self, prompt: str, deadline: float) -> Any:
+        """
+        One attempt: the call, plus a hedged duplicate if it runs past hedge_delay();
+        the first successful response wins and the other request is cancelled
+        """
+        started: Dict[asyncio.Task, float] = {}
+
+        def launch() -> asyncio.Task:
+            task = asyncio.ensure_future(self.llm.ainvoke(prompt))
+            started[task] = time.monotonic()
+            return task
+
+        pending = {launch()}
+        hedge_after = self.hedge_delay()
+        error: Optional[Exception] = None
+        try:
+            if hedge_after is not None and time.monotonic() + hedge_after < deadline:
+                done, _ = await asyncio.wait(pending, timeout=hedge_after)
+                if not done:
+                    REGISTRY.counter("rag_llm_hedges_total", "Hedged duplicate LLM requests sent").inc()
+                    pending.add(launch())
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError(f"LLM deadline of {self.deadline_seconds}s exceeded")
+                for task in done:
+                    if task.exception() is None:
+                        self._latencies.append(time.monotonic() - started[task])
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def astream(self, prompt: str) -> AsyncIterator[Any]:
+        deadline = time.monotonic() + self.deadline_seconds
+        key = self._key(prompt)
+        if not self.breaker.allow():
+            yield self._unavailable(key, "LLM circuit is open")
+            return
+        attempt = 0
+        while True:
+            stream = self.llm.astream(prompt).__aiter__()
+            started = time.monotonic()
+            try:
+                first = await asyncio.wait_for(stream.__anext__(), timeout=max(0.0, deadline - time.monotonic()))
+                break
+            except StopAsyncIteration:
+                self._record_outcome(None)
+                return
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                self._record_outcome(e)
+                delay = self._should_retry(e, attempt, deadline)
+                if delay is None:
+                    yield self._unavailable(key, f"LLM stream failed: {e!r}", e)
+                    return
+                await asyncio.sleep(delay)
+                attempt += 1
+        self._record_outcome(None)
+        self._latencies.append(time.monotonic() - started)
+        yield first
+        parts = [first.content or ""]
+        async for chunk in stream:
+            parts.append(chunk.content or "")
+            yield chunk
+        self._remember(key, SimpleNamespace(content="".join(parts)))
@@ -0,0 +1,39 @@
+import os
+import random
+
+# Lowest level printed; per-step request details are DEBUG, so they cost nothing by default
+LEVELS = {"DEBUG": 10, "INFO": 20, "ERROR": 40}
+LOG_LEVEL = LEVELS.get(os.getenv("LOG_LEVEL", "INFO").upper(), LEVELS["INFO"])
+# Share of requests whose one-line summary is printed at INFO
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+def enabled(level: str) -> bool:
+    return LEVELS[level] >= LOG_LEVEL
+
+
+def log(level: str, message: str):
+    """
+    Print message in the usual "[LEVEL] message" form if level is enabled
+    """
+    if LEVELS[level] >= LOG_LEVEL:
+        print(f"[{level}] {message}")
+
+
+def debug(message: str):
+    log("DEBUG", message)
+
+
+def info(message: str):
+    log("INFO", message)
+
+
+def error(message: str):
+    log("ERROR", message)
+
+
+def sampled() -> bool:
+    """
+    Whether this request's summary should be logged: every request at DEBUG,
+    LOG_SAMPLE_RATE of them at INFO
+    """
+    return enabled("DEBUG") or (enabled("INFO") and random.random() < LOG_SAMPLE_RATE)
@@ -0,0 +1,193 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond to tens of seconds
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """
+    Thread-safe fixed-bucket histogram (Prometheus semantics: bucket counts
+    are cumulative, each bucket counts observations <= its upper bound).
+    """
+
+    def __init__(self, name: str, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS, description: str = "",
+                 labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = {}
+        running = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            running += bucket_count
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = count
+        return {
+            "buckets": cumulative,
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0,
+        }
+
+
+class Counter:
+    """
+    Thread-safe monotonically increasing count
+    """
+
+    def __init__(self, name: str, description: str = "", labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def value(self) -> float:
+        with self._lock:
+            return self._value
+
+
+class Gauge:
+    """
+    Current value read from a callback at scrape time (queue depth, cache size, ...)
+    """
+
+    def __init__(self, name: str, fn: Callable[[], float], description: str = "",
+                 labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self.fn = fn
+
+    def value(self) -> float:
+        return float(self.fn())
+
+
+def _label_text(labels: Dict[str, str], extra: Optional[Dict[str, str]] = None) -> str:
+    merged = {**labels, **(extra or {})}
+    if not merged:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in merged.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(merged, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """
+    Named metrics of the process, rendered in the Prometheus text format.
+    A metric is identified by its name and labels; asking for an existing one
+    returns it, registering a new object under the same identity replaces it.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], object] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+        return name, tuple(sorted(labels.items()))
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[self._key(metric.name, metric.labels)] = metric
+        return metric
+
+    def _get_or_create(self, name: str, labels: Dict[str, str], factory):
+        key = self._key(name, labels)
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = factory()
+        return metric
+
+    def counter(self, name: str, description: str = "", **labels: str) -> Counter:
+        return self._get_or_create(name, labels, lambda: Counter(name, description, labels))
+
+    def histogram(self, name: str, description: str = "", buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+                  **labels: str) -> Histogram:
+        return self._get_or_create(name, labels, lambda: Histogram(name, buckets, description, labels))
+
+    def gauge(self, name: str, fn: Callable[[], float], description: str = "", **labels: str) -> Gauge:
+        return self.register(Gauge(name, fn, description, labels))
+
+    def render_prometheus(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format (version 0.0.4)
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: (metric.name, sorted(metric.labels.items())))
+        lines = []
+        described = set()
+        for metric in metrics:
+            kind = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}[type(metric)]
+            if metric.name not in described:
+                described.add(metric.name)
+                if metric.description:
+                    lines.append(f"# HELP {metric.name} {metric.description}")
+                lines.append(f"# TYPE {metric.name} {kind}")
+            if isinstance(metric, Histogram):
+                snapshot = metric.snapshot()
+                for bound, count in snapshot["buckets"].items():
+                    lines.append(f"{metric.name}_bucket{_label_text(metric.labels, {'le': bound})} {count}")
+                lines.append(f"{metric.name}_sum{_label_text(metric.labels)} {snapshot['sum']}")
+                lines.append(f"{metric.name}_count{_label_text(metric.labels)} {snapshot['count']}")
+            else:
+                try:
+                    value = metric.value()
+                except Exception:
+                    continue  # A gauge whose source is gone (e.g. not started yet) is left out
+                lines.append(f"{metric.name}{_label_text(metric.labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry served on /metrics
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = "rag_stage_duration_seconds"
+ERRORS_TOTAL = "rag_errors_total"
+
+@contextmanager
+def span(stage: str, trace: Optional[Dict[str, float]] = None) -> Iterator[None]:
+    """
+    Time a pipeline stage into rag_stage_duration_seconds{stage=...}.
+    An exception escaping the block also counts in rag_errors_total{stage=...}.
+
+    Args:
+        stage: Stage label, e.g. "embed" or "llm"
+        trace: Optional per-request dict that accumulates seconds per stage
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        REGISTRY.counter(ERRORS_TOTAL, "Errors by pipeline stage", stage=stage).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        REGISTRY.histogram(STAGE_SECONDS, "Time spent in each pipeline stage", stage=stage).observe(elapsed)
+        if trace is not None:
+            trace[stage] = trace.get(stage, 0.0) + elapsed
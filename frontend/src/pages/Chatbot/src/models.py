@@ -0,0 +1,142 @@
+import os
+import re
+import platform
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+# "torch": full-precision PyTorch weights (default)
+# "onnx": the same weights exported to an ONNX graph and run by onnxruntime
+# "onnx-int8": the ONNX graph with dynamically quantized int8 weights
+INFERENCE_BACKENDS = ("torch", "onnx", "onnx-int8")
+DEFAULT_EXPORT_DIR = "./model_cache/onnx"
+
+# One instance per (kind, model name, backend), shared by the query and ingest paths
+_registry: Dict[Tuple[str, str, str], Any] = {}
+_registry_lock = threading.Lock()
+
+def validate_backend(backend: str) -> str:
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend} (expected one of {', '.join(INFERENCE_BACKENDS)})")
+    return backend
+
+
+def detect_quantization_config() -> str:
+    """
+    Pick the onnxruntime dynamic quantization preset matching this CPU.
+    avx512_vnni has int8 dot-product instructions and gives the biggest speedup.
+    """
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return "avx2"
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512f" in flags:
+        return "avx512"
+    return "avx2"
+
+
+def _export_path(export_dir: str, model_name: str) -> str:
+    return os.path.join(export_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+
+
+def _quantized_model_dir(model_cls, model_name: str, export_dir: str, quantization_config: str) -> str:
+    """
+    Export model_name to ONNX and quantize it once; later loads reuse the files
+    under export_dir, so the export cost is paid only on the first start.
+    """
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    local_dir = _export_path(export_dir, model_name)
+    quantized_file = os.path.join(local_dir, "onnx", f"model_qint8_{quantization_config}.onnx")
+    if not os.path.exists(quantized_file):
+        print(f"[INFO] Exporting {model_name} to ONNX with int8 quantization ({quantization_config})...")
+        model = model_cls(model_name, backend="onnx")
+        model.save_pretrained(local_dir)
+        export_dynamic_quantized_onnx_model(model, quantization_config, local_dir)
+        print(f"[INFO] Quantized model saved to {quantized_file}")
+    return local_dir
+
+
+def _load(model_cls, model_name: str, backend: str, export_dir: str, quantization_config: Optional[str]):
+    validate_backend(backend)
+    if backend == "torch":
+        return model_cls(model_name)
+    if backend == "onnx":
+        return model_cls(model_name, backend="onnx")
+
+    quantization_config = quantization_config or detect_quantization_config()
+    local_dir = _quantized_model_dir(model_cls, model_name, export_dir, quantization_config)
+    return model_cls(local_dir, backend="onnx",
+                     model_kwargs={"file_name": f"onnx/model_qint8_{quantization_config}.onnx"})
+
+
+def load_embedding_model(model_name: str, backend: str = "torch", export_dir: str = DEFAULT_EXPORT_DIR,
+                         quantization_config: Optional[str] = None) -> Any:
+    """
+    Load a SentenceTransformer on the requested inference backend.
+
+    Args:
+        model_name: HuggingFace model name or local path
+        backend: One of INFERENCE_BACKENDS
+        export_dir: Where exported/quantized ONNX models are kept
+        quantization_config: onnxruntime preset ("avx2", "avx512", "avx512_vnni", "arm64"); detected if None
+
+    Returns:
+        A new SentenceTransformer with the usual encode() interface (see get_embedding_model for the shared one)
+    """
+    from sentence_transformers import SentenceTransformer
+
+    model = _load(SentenceTransformer, model_name, backend, export_dir, quantization_config)
+    print(f"[INFO] Embedding model {model_name} running on {backend} backend")
+    return model
+
+
+def load_cross_encoder(model_name: str, backend: str = "torch", export_dir: str = DEFAULT_EXPORT_DIR,
+                       quantization_config: Optional[str] = None) -> Any:
+    """
+    Load a CrossEncoder on the requested inference backend.
+    Arguments are the same as load_embedding_model.
+    """
+    from sentence_transformers import CrossEncoder
+
+    model = _load(CrossEncoder, model_name, backend, export_dir, quantization_config)
+    print(f"[INFO] Cross-encoder {model_name} running on {backend} backend")
+    return model
+
+
+def _shared(kind: str, loader, model_name: str, backend: str) -> Any:
+    key = (kind, model_name, backend)
+    model = _registry.get(key)
+    if model is None:
+        # Loading holds the lock so concurrent first requests don't load the model twice
+        with _registry_lock:
+            model = _registry.get(key)
+            if model is None:
+                model = _registry[key] = loader(model_name, backend=backend)
+    return model
+
+
+def get_embedding_model(model_name: str, backend: str = "torch") -> Any:
+    """
+    Return the process-wide SentenceTransformer for (model_name, backend),
+    loading it on first use.
+    """
+    return _shared("embedding", load_embedding_model, model_name, backend)
+
+
+def get_cross_encoder(model_name: str, backend: str = "torch") -> Any:
+    """
+    Return the process-wide CrossEncoder for (model_name, backend), loading it on first use.
+    """
+    return _shared("cross_encoder", load_cross_encoder, model_name, backend)
+
+
+def loaded_models() -> list:
+    """
+    (kind, model name, backend) of every model loaded so far
+    """
+    return [list(key) for key in _registry]
@@ -1,109 +1,199 @@
+import os
 import re
-from typing import List
+import json
+import time
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+# Abbreviations and synonyms, kept outside data/ so the indexer never loads them as a document
+DEFAULT_DICTIONARY_PATH = os.getenv("QUERY_DICTIONARY_PATH", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "query_dictionary.json"))
+
+# Used when the dictionary file is missing or unreadable
+DEFAULT_ABBREVIATIONS = {
+    'cs': 'computer science',
+    'cse': 'computer science engineering',
+    'ict': 'information communication technology',
+    'prof': 'professor',
+    'dept': 'department',
+    'sem': 'semester',
+    'reg': 'registration',
+    'lib': 'library',
+    'gym': 'gymnasium',
+    'univ': 'university',
+    'iut': 'islamic university of technology',
+    'fest': 'festival',
+    'comp': 'competition',
+    'regs': 'registration',
+    'info': 'information'
+}
+
+# Special characters except basic punctuation, together with whitespace, collapse to one space
+SEPARATOR_PATTERN = r'(?:[^\w\s\?\.\,\-]|\s)+'
+
+class _CompiledDictionary:
+    """
+    One immutable version of the dictionary: the term map and the regexes built from it
+    """
+
+    def __init__(self, terms: Dict[str, str]):
+        self.terms = terms
+        # Longest first so "regs" wins over "reg" where both could match
+        alternation = '|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+        term_pattern = rf'\b(?:{alternation})\b' if terms else r'(?!)'
+        self.terms_regex = re.compile(term_pattern)
+        self.separator_regex = re.compile(SEPARATOR_PATTERN)
+        # Cleaning and expansion in a single scan: group 1 is a term, anything else a separator run
+        self.combined_regex = re.compile(f'({term_pattern})|{SEPARATOR_PATTERN}')
+
+    def expand(self, match: re.Match) -> str:
+        term = match.group(1)
+        return self.terms[term] if term is not None else ' '
+
 
 class QueryPreprocessor:
     """
     Preprocess and expand queries for better retrieval accuracy.
+
+    The abbreviation and synonym dictionary is loaded from a JSON file
+    ({"abbreviations": {...}, "synonyms": {...}}, both mapping a lowercase term
+    to its replacement) and compiled into one alternation regex, so a query is
+    cleaned and expanded in a single scan whatever the dictionary size. The file
+    is re-read when it changes, and results are memoized per query.
     """
-    
-    def __init__(self):
-        # Domain-specific abbreviations
-        self.abbreviations = {
-            'cs': 'computer science',
-            'cse': 'computer science engineering',
-            'ict': 'information communication technology',
-            'prof': 'professor',
-            'dept': 'department',
-            'sem': 'semester',
-            'reg': 'registration',
-            'lib': 'library',
-            'gym': 'gymnasium',
-            'univ': 'university',
-            'iut': 'islamic university of technology',
-            'fest': 'festival',
-            'comp': 'competition',
-            'regs': 'registration',
-            'info': 'information'
-        }
-        
-        print("[INFO] Query preprocessor initialized")
-    
+
+    def __init__(self, dictionary_path: Optional[str] = DEFAULT_DICTIONARY_PATH, reload_interval: float = 5.0,
+                 cache_size: int = 4096):
+        """
+        Args:
+            dictionary_path: JSON dictionary file; None uses the built-in abbreviations only
+            reload_interval: Seconds between checks of the file's modification time (0 checks every query)
+            cache_size: Preprocessed queries remembered
+        """
+        self.dictionary_path = dictionary_path
+        self.reload_interval = reload_interval
+        self.cache_size = cache_size
+        self._mtime: Optional[float] = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._install(self._load())
+
+        print(f"[INFO] Query preprocessor initialized with {len(self.abbreviations)} terms")
+
+    @property
+    def abbreviations(self) -> Dict[str, str]:
+        return self._compiled.terms
+
+    def _load(self) -> Dict[str, str]:
+        if self.dictionary_path is None:
+            return dict(DEFAULT_ABBREVIATIONS)
+        try:
+            self._mtime = os.path.getmtime(self.dictionary_path)
+            with open(self.dictionary_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return dict(DEFAULT_ABBREVIATIONS)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] Could not read query dictionary {self.dictionary_path}: {e}")
+            return dict(self._compiled.terms) if hasattr(self, '_compiled') else dict(DEFAULT_ABBREVIATIONS)
+        terms = {}
+        for section in ('abbreviations', 'synonyms'):
+            for term, replacement in (data.get(section) or {}).items():
+                terms[term.lower()] = replacement.lower()
+        return terms
+
+    def _install(self, terms: Dict[str, str]):
+        # Replaced as a whole, so concurrent queries see either the old or the new dictionary
+        self._compiled = _CompiledDictionary(terms)
+        self._preprocess_cached = lru_cache(maxsize=self.cache_size)(self._preprocess_uncached)
+
+    def maybe_reload(self):
+        """
+        Reload the dictionary if its file changed; checked at most every reload_interval seconds
+        """
+        if self.dictionary_path is None or time.monotonic() < self._next_check:
+            return
+        with self._reload_lock:
+            if time.monotonic() < self._next_check:
+                return
+            self._next_check = time.monotonic() + self.reload_interval
+            try:
+                mtime = os.path.getmtime(self.dictionary_path)
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return
+            self._install(self._load())
+            print(f"[INFO] Reloaded query dictionary: {len(self.abbreviations)} terms")
+
     def expand_abbreviations(self, query: str) -> str:
         """
         Expand common abbreviations in the query.
-        
+
         Args:
             query: Original query string
-            
+
         Returns:
             Query with expanded abbreviations
         """
-        query_lower = query.lower()
-        
-        for abbr, full in self.abbreviations.items():
-            # Use word boundaries to avoid partial replacements
-            pattern = r'\b' + re.escape(abbr) + r'\b'
-            query_lower = re.sub(pattern, full, query_lower)
-        
-        return query_lower
-    
+        compiled = self._compiled
+        # Word boundaries in the pattern avoid partial replacements
+        return compiled.terms_regex.sub(lambda match: compiled.terms[match.group(0)], query.lower())
+
     def clean_query(self, query: str) -> str:
         """
         Clean the query by removing special characters and extra whitespace.
-        
+
         Args:
             query: Original query string
-            
+
         Returns:
             Cleaned query string
         """
-        # Remove special characters except spaces and basic punctuation
-        query = re.sub(r'[^\w\s\?\.\,\-]', ' ', query)
-        
-        # Remove extra whitespace
-        query = ' '.join(query.split())
-        
-        return query
-    
+        return self._compiled.separator_regex.sub(' ', query).strip()
+
     def preprocess(self, query: str) -> str:
         """
         Full preprocessing pipeline: clean and expand abbreviations.
-        
+
         Args:
             query: Original query string
-            
+
         Returns:
             Preprocessed query string
         """
-        # Clean first
-        query = self.clean_query(query)
-        
-        # Then expand abbreviations
-        query = self.expand_abbreviations(query)
-        
-        return query
-    
-    def generate_variations(self, query: str, max_variations: int = 2) -> List[str]:
+        self.maybe_reload()
+        return self._preprocess_cached(query)
+
+    def _preprocess_uncached(self, query: str) -> str:
+        compiled = self._compiled
+        return compiled.combined_regex.sub(compiled.expand, query.lower()).strip()
+
+    def generate_variations(self, query: str, max_variations: int = 3) -> List[str]:
         """
-        Generate alternative phrasings of the query.
-        For now, returns the original query. Can be enhanced with LLM-based expansion.
-        
+        Generate alternative phrasings of the query for multi-query retrieval.
+        Rule-based: the cleaned query without abbreviation expansion, the query
+        without its question mark, and "tell me about ..." for short statements.
+        Can be enhanced with LLM-based expansion.
+
         Args:
             query: Original query string
             max_variations: Maximum number of variations to generate
-            
+
         Returns:
-            List of query variations including the original
+            List of distinct query variations, starting with preprocess(query)
         """
-        variations = [query]
-        
+        expanded = self.preprocess(query)
+        variations = [expanded, self.clean_query(query).lower()]
+
         # Add simple variations
-        if '?' in query:
+        if '?' in expanded:
             # Remove question mark
-            variations.append(query.replace('?', ''))
-        
+            variations.append(' '.join(expanded.replace('?', ' ').split()))
+
         # Add "tell me about" variation if query is short
-        if len(query.split()) <= 5 and not query.lower().startswith(('what', 'when', 'where', 'who', 'how', 'why')):
-            variations.append(f"tell me about {query}")
-        
-        return variations[:max_variations + 1]
+        if len(expanded.split()) <= 5 and not expanded.startswith(('what', 'when', 'where', 'who', 'how', 'why')):
+            variations.append(f"tell me about {expanded}")
+
+        return list(dict.fromkeys(variations))[:max_variations + 1]
@@ -1,5 +1,7 @@
-from typing import List, Any
-from sentence_transformers import CrossEncoder
+from typing import List, Any, Optional, Tuple
+from src.models import get_cross_encoder
+from src import logger
+from src.metrics import REGISTRY
 import numpy as np
 
 class DocumentReranker:
@@ -8,16 +10,27 @@ class DocumentReranker:
     Cross-encoders are more accurate than bi-encoders but slower.
     """
     
-    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"):
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", backend: str = "torch"):
         """
         Initialize the reranker with a cross-encoder model.
         
         Args:
             model_name: HuggingFace model name for cross-encoding
+            backend: Inference backend, "torch", "onnx" or "onnx-int8" (see src/models.py)
         """
-        print(f"[INFO] Loading cross-encoder model: {model_name}")
-        self.model = CrossEncoder(model_name)
-        print(f"[INFO] Cross-encoder loaded successfully")
+        self.model_name = model_name
+        self.backend = backend
+        # Optional callable(list of pairs) -> scores, e.g. a MicroBatcher shared by concurrent requests
+        self.predictor = None
+        # Optional ChunkTokenStore: documents' token ids are read from it instead of tokenized per request
+        self.token_store = None
+
+    @property
+    def model(self):
+        """
+        The cross-encoder, loaded on first use
+        """
+        return get_cross_encoder(self.model_name, self.backend)
     
     def rerank(self, query: str, documents: List[dict], top_k: int = 5) -> List[dict]:
         """
@@ -38,16 +51,183 @@ class DocumentReranker:
         pairs = [[query, doc['content']] for doc in documents]
         
         # Get relevance scores
-        scores = self.model.predict(pairs)
-        
-        # Add rerank scores to documents
-        for doc, score in zip(documents, scores):
-            doc['rerank_score'] = float(score)
-            doc['original_score'] = doc.get('similarity_score', 0)
+        self._score(pairs, documents)
         
         # Sort by rerank score
         reranked_docs = sorted(documents, key=lambda x: x['rerank_score'], reverse=True)
         
-        print(f"[INFO] Re-ranked {len(documents)} documents, returning top {top_k}")
+        logger.debug(f"Re-ranked {len(documents)} documents, returning top {top_k}")
         
         return reranked_docs[:top_k]
+
+    def predict(self, pairs: List[List[str]], batch_size: int = 32) -> np.ndarray:
+        """
+        Cross-encoder scores of (query, document) pairs, the same as
+        CrossEncoder.predict. With a token_store only the queries are tokenized:
+        the documents' ids come from the store and the input tensors are
+        assembled from them.
+        """
+        inputs = self._pretokenized(pairs) if self.token_store is not None and pairs else None
+        if inputs is None:
+            return self.model.predict(pairs, batch_size=batch_size, show_progress_bar=False)
+        return self._forward(*inputs, batch_size)
+
+    def _pretokenized(self, pairs: List[List[str]]) -> Optional[Tuple[List[List[int]], List[List[int]]]]:
+        """
+        (input ids, token type ids) of each pair built from the stored document
+        ids; None when the model or a pair doesn't allow it (multi-label model,
+        pair longer than the model's max length)
+        """
+        model = self.model
+        if model.num_labels != 1:
+            return None
+        tokenizer = model.tokenizer
+        special_tokens = tokenizer.num_special_tokens_to_add(pair=True)
+        query_ids = {query: tokenizer(query, add_special_tokens=False)["input_ids"] for query in {q for q, _ in pairs}}
+        document_ids = self.token_store.get([document for _, document in pairs])
+        # Stored ids leave query_reserve tokens for the query, so pairs only overflow for longer
+        # queries. Those aren't truncated here: "longest_first" could cut the query instead of
+        # the document, so CrossEncoder.predict tokenizes the whole call.
+        if any(len(query_ids[query]) + len(ids) + special_tokens > self.token_store.max_length
+               for (query, _), ids in zip(pairs, document_ids)):
+            return None
+
+        sequences, type_ids = [], []
+        for (query, _), ids in zip(pairs, document_ids):
+            query_part, document_part = query_ids[query], ids.tolist()
+            sequences.append(tokenizer.build_inputs_with_special_tokens(query_part, document_part))
+            type_ids.append(tokenizer.create_token_type_ids_from_sequences(query_part, document_part))
+        return sequences, type_ids
+
+    def _forward(self, sequences: List[List[int]], type_ids: List[List[int]], batch_size: int) -> np.ndarray:
+        """
+        Scores of already tokenized pairs, padded per batch of similar length.
+        The features go through the CrossEncoder's modules like in
+        CrossEncoder.predict, so every backend and head scores them the same.
+        """
+        import torch
+        from sentence_transformers.util import batch_to_device
+
+        model = self.model
+        model.eval()
+        tokenizer = model.tokenizer
+        # Non-tensor entries of the model's own features (e.g. the input modality), passed along unchanged
+        extras = {name: value for name, value in model.preprocess([["", ""]]).items() if not torch.is_tensor(value)}
+        with_type_ids = "token_type_ids" in tokenizer.model_input_names
+        left = tokenizer.padding_side == "left"
+        order = np.argsort([-len(sequence) for sequence in sequences], kind="stable")
+        scores = np.empty(len(sequences), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            width = max(len(sequences[i]) for i in batch)
+            input_ids = np.full((len(batch), width), tokenizer.pad_token_id or 0, dtype=np.int64)
+            attention_mask = np.zeros((len(batch), width), dtype=np.int64)
+            token_type_ids = np.zeros((len(batch), width), dtype=np.int64)
+            for row, i in enumerate(batch):
+                span = slice(width - len(sequences[i]), width) if left else slice(0, len(sequences[i]))
+                input_ids[row, span] = sequences[i]
+                attention_mask[row, span] = 1
+                token_type_ids[row, span] = type_ids[i]
+            features = {"input_ids": torch.from_numpy(input_ids), "attention_mask": torch.from_numpy(attention_mask)}
+            if with_type_ids:
+                features["token_type_ids"] = torch.from_numpy(token_type_ids)
+            with torch.inference_mode():
+                batch_scores = model(batch_to_device({**features, **extras}, model.device))["scores"]
+                if batch_scores.dtype.itemsize < 4:
+                    batch_scores = batch_scores.float()
+                if model.activation_fn is not None:
+                    batch_scores = model.activation_fn(batch_scores)
+            scores[batch] = batch_scores.float().cpu().numpy().reshape(len(batch), -1)[:, 0]
+        return scores
+
+    def _score(self, pairs: List[List[str]], documents: List[dict]):
+        """
+        Cross-encode pairs and store the scores on their documents
+        """
+        scores = self.predictor(pairs) if self.predictor is not None else self.predict(pairs)
+        REGISTRY.counter("rag_rerank_pairs_total", "(query, document) pairs scored by the cross-encoder").inc(len(pairs))
+        
+        # Add rerank scores to documents
+        for doc, score in zip(documents, scores):
+            doc['rerank_score'] = float(score)
+            doc['original_score'] = doc.get('similarity_score', 0)
+
+    def rerank_cascade(self, query: str, documents: List[dict], top_k: int = 5, stage_size: int = 5,
+                       stop_score: float = 4.0, stop_margin: float = 3.0) -> List[dict]:
+        """
+        rerank() that scores documents in first-stage order a stage at a time and
+        stops before the end once the result is settled. The first stage is
+        max(top_k, stage_size) documents; after each stage scoring stops when
+        - the top_k best scores are all at least stop_score, or
+        - the best score of the stage just scored is more than stop_margin below
+          the current top_k-th score (deeper candidates are not competitive)
+        Unscored documents are left out of the result.
+
+        Args:
+            query: The search query
+            documents: Candidates in first-stage order, best first
+            top_k: Number of top documents to return
+            stage_size: Documents per cross-encoder call after the first
+            stop_score: Score the whole top_k must reach to stop
+            stop_margin: Score deficit of a stage that stops the cascade
+
+        Returns:
+            Re-ranked list of documents with rerank_score set
+        """
+        if not documents:
+            return []
+
+        stage = documents[:max(top_k, stage_size)]
+        scored = 0
+        while stage:
+            self._score([[query, doc['content']] for doc in stage], stage)
+            scored += len(stage)
+
+            best = sorted((doc['rerank_score'] for doc in documents[:scored]), reverse=True)
+            kth = best[min(top_k, scored) - 1]
+            if kth >= stop_score:
+                break
+            # Not for the first stage: it holds the top_k being compared against
+            if scored > len(stage) and max(doc['rerank_score'] for doc in stage) < kth - stop_margin:
+                break
+            stage = documents[scored:scored + stage_size]
+
+        if scored < len(documents):
+            REGISTRY.counter("rag_rerank_early_exits_total", "Cascade re-rankings stopped before the last candidate").inc()
+        reranked_docs = sorted(documents[:scored], key=lambda x: x['rerank_score'], reverse=True)
+        logger.debug(f"Cascade re-ranked {scored} of {len(documents)} documents, returning top {top_k}")
+        return reranked_docs[:top_k]
+
+    def rerank_batch(self, queries: List[str], documents_per_query: List[List[dict]], top_k: int = 5,
+                     batch_size: int = 64) -> List[List[dict]]:
+        """
+        rerank() for several queries with a single cross-encoder call over all
+        (query, document) pairs. The model is called directly rather than through
+        the predictor, so a bulk job doesn't hold up interactive requests' batches.
+
+        Args:
+            queries: The search queries
+            documents_per_query: Candidate documents of each query
+            top_k: Number of top documents to return per query
+            batch_size: Pairs per forward pass inside that call
+
+        Returns:
+            One re-ranked list per query
+        """
+        pairs = [[query, doc['content']] for query, documents in zip(queries, documents_per_query) for doc in documents]
+        if not pairs:
+            return [[] for _ in queries]
+        scores = self.predict(pairs, batch_size=batch_size)
+        REGISTRY.counter("rag_rerank_pairs_total", "(query, document) pairs scored by the cross-encoder").inc(len(pairs))
+
+        reranked = []
+        offset = 0
+        for documents in documents_per_query:
+            for doc, score in zip(documents, scores[offset:offset + len(documents)]):
+                doc['rerank_score'] = float(score)
+                doc['original_score'] = doc.get('similarity_score', 0)
+            offset += len(documents)
+            reranked.append(sorted(documents, key=lambda x: x['rerank_score'], reverse=True)[:top_k])
+
+        logger.debug(f"Re-ranked {len(pairs)} pairs for {len(queries)} queries in one batch")
+        return reranked
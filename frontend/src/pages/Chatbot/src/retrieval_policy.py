@@ -0,0 +1,91 @@
+import math
+from typing import Dict, List
+from src.metrics import REGISTRY
+
+POLICY_MODES = ("fixed", "adaptive")
+
+class RetrievalPolicy:
+    """
+    Decides how many first-stage candidates reach the cross-encoder and how
+    many of them it scores.
+
+    "fixed" is the original behaviour: min(top_k * 3, 15) candidates, all re-ranked.
+
+    "adaptive" retrieves the same depth but uses the dense similarity
+    distribution to cut it down before re-ranking:
+    - depth: when the leader's similarity is at least confident_similarity,
+      the extra candidates beyond top_k shrink linearly as the gap between the
+      leader and the (top_k + 1)-th candidate grows towards decisive_gap; a
+      decisive leader leaves only top_k candidates (re-ranking just reorders them)
+    - filter: candidates beyond the first top_k whose similarity is more than
+      filter_margin below the leader are dropped
+    - cascade: the rest is scored cascade_size at a time (see
+      DocumentReranker.rerank_cascade), stopping once the top_k scores reach
+      stop_score or a stage's best falls stop_margin below the current top_k
+
+    The first top_k candidates in first-stage order are never dropped, so a
+    hybrid query keeps its exact BM25 matches even when their cosine similarity is low.
+    """
+
+    def __init__(self, mode: str = "fixed", max_candidates: int = 15, depth_factor: int = 3,
+                 confident_similarity: float = 0.6, decisive_gap: float = 0.15, filter_margin: float = 0.3,
+                 cascade_size: int = 5, stop_score: float = 4.0, stop_margin: float = 3.0):
+        """
+        Args:
+            mode: "fixed" or "adaptive"
+            max_candidates: Upper bound on retrieved candidates
+            depth_factor: Candidates retrieved per wanted document, capped by max_candidates
+            confident_similarity: Leader cosine similarity from which depth is reduced
+            decisive_gap: Leader lead over the (top_k + 1)-th candidate that needs no extra candidates
+            filter_margin: Similarity below the leader at which extra candidates are dropped
+            cascade_size: Candidates scored per cross-encoder call (the first call scores at least top_k)
+            stop_score: Cross-encoder score (logit) the top_k must all reach to stop early;
+                4.0 is where calculate_confidence starts reporting "high"
+            stop_margin: How far a stage's best score may trail the current top_k before the rest is skipped
+        """
+        if mode not in POLICY_MODES:
+            raise ValueError(f"Unknown retrieval policy: {mode}")
+        self.mode = mode
+        self.max_candidates = max_candidates
+        self.depth_factor = depth_factor
+        self.confident_similarity = confident_similarity
+        self.decisive_gap = decisive_gap
+        self.filter_margin = filter_margin
+        self.cascade_size = cascade_size
+        self.stop_score = stop_score
+        self.stop_margin = stop_margin
+
+    def candidate_k(self, top_k: int) -> int:
+        """
+        Candidates to retrieve when top_k documents are wanted
+        """
+        return min(top_k * self.depth_factor, self.max_candidates)
+
+    def select(self, candidates: List[Dict], top_k: int) -> List[Dict]:
+        """
+        The candidates, in first-stage order, that go on to re-ranking
+        """
+        if self.mode == "fixed" or len(candidates) <= top_k:
+            return candidates
+
+        similarities = sorted((doc.get("similarity_score", 0.0) for doc in candidates), reverse=True)
+        leader = similarities[0]
+        extra = len(candidates) - top_k
+        if leader >= self.confident_similarity:
+            gap = leader - similarities[top_k]
+            extra = math.ceil(extra * max(0.0, 1.0 - gap / self.decisive_gap))
+
+        floor = leader - self.filter_margin
+        tail = [doc for doc in candidates[top_k:] if doc.get("similarity_score", 0.0) >= floor][:extra]
+        dropped = len(candidates) - top_k - len(tail)
+        REGISTRY.counter("rag_candidates_dropped_total", "First-stage candidates cut before re-ranking").inc(dropped)
+        return candidates[:top_k] + tail
+
+    def rerank(self, reranker, query: str, candidates: List[Dict], top_k: int) -> List[Dict]:
+        """
+        Re-rank selected candidates: all at once for "fixed", in cascades for "adaptive"
+        """
+        if self.mode == "fixed":
+            return reranker.rerank(query, candidates, top_k=top_k)
+        return reranker.rerank_cascade(query, candidates, top_k=top_k, stage_size=self.cascade_size,
+                                       stop_score=self.stop_score, stop_margin=self.stop_margin)
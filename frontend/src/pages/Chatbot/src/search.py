@@ -1,44 +1,295 @@
 import os
+import re
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from typing import List, Dict
+from typing import Any, List, Dict, Optional, AsyncIterator, Tuple
 from src.vectorstore import ChromaVectorStore
 from src.reranker import DocumentReranker
+from src.retrieval_policy import RetrievalPolicy
+from src.context_builder import ContextBuilder, estimate_tokens
+from src.intent_classifier import INTENT_ROUTING_MODES, QueryIntentClassifier
 from src.query_preprocessor import QueryPreprocessor
-from langchain_groq import ChatGroq
-from sklearn.metrics.pairwise import cosine_similarity
+from src.answer_cache import AnswerCache
+from src.session_store import SessionStore
+from src.llm_gateway import LLMGateway, LLMUnavailableError
+from src.token_store import ChunkTokenStore
+from src.batching import MicroBatcher
+from src.models import validate_backend, loaded_models
+from src.metrics import REGISTRY, span
+from src import logger
 import numpy as np
 
 load_dotenv()
 
+PROMPT_TEMPLATE = """You are a helpful campus assistant for CampusConnect. Your role is to provide accurate, specific information based on official campus documents.
+
+CRITICAL INSTRUCTIONS:
+1. Answer ONLY based on the provided context from official documents
+2. If the context doesn't contain enough information, say: "I don't have specific information about that in my knowledge base. Please contact the campus office or visit the official campus website for more details."
+3. Be specific with dates, times, locations, deadlines, and requirements
+4. If multiple sources provide different information, mention all perspectives
+5. Use bullet points for lists and multiple items
+6. Be concise but comprehensive - provide complete answers
+7. If asked about procedures, list all steps clearly
+8. Provide information naturally without citing sources
+
+CONTEXT FROM OFFICIAL CAMPUS DOCUMENTS:
+{context}
+
+{history}STUDENT QUESTION: {question}
+
+DETAILED ANSWER:"""
+
+NO_RESULTS_ANSWER = "I don't have information about that in my knowledge base. Please ask questions related to campus events, clubs, courses, facilities, or other campus-specific topics."
+LLM_ERROR_ANSWER = "I encountered an error processing your question. Please try again."
+# Answer served from the retrieved context alone while the LLM is unavailable
+FALLBACK_ANSWER_PREFIX = "I can't generate a full answer right now, but this is the most relevant information from the campus documents:\n\n"
+FALLBACK_EXCERPT_CHARS = 600
+LOW_CONFIDENCE_NOTE = "\n\n⚠️ Note: My confidence in this answer is low. Please verify this information with official campus sources."
+# Words that refer back to an earlier turn; such follow-ups are searched together with the previous question
+FOLLOW_UP_PATTERN = re.compile(r"\b(?:it|its|that|this|those|these|they|them|their|there|same|also)\b")
+# Longest search text a chain of follow-ups grows to (the most recent words are kept)
+MAX_FOLLOW_UP_WORDS = 32
+# Buckets for the rag_context_tokens histogram
+CONTEXT_TOKEN_BUCKETS = (100, 250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
+
 class RAGSearch:
-    def __init__(self, persist_dir: str = "./data/vector_store", embedding_model: str = "all-MiniLM-L6-v2", llm_model: str = "llama-3.3-70b-versatile"):
-        self.vectorstore = ChromaVectorStore(persist_dir=persist_dir, embedding_model=embedding_model)
+    def __init__(self, persist_dir: str = "./data/vector_store", embedding_model: str = "all-MiniLM-L6-v2", llm_model: str = "llama-3.3-70b-versatile", data_dir: str = "data",
+                 retrieval_mode: str = "dense", cache_size: int = 1024, cache_ttl: float = 3600,
+                 cache_similarity_threshold: float = 0.95, inference_workers: int = 4,
+                 micro_batching: bool = False, batch_window_ms: float = 5.0, max_batch_size: int = 32,
+                 inference_backend: str = "torch", lazy_startup: bool = False, vector_backend: str = "chroma",
+                 faiss_index_type: str = "hnsw", read_only_index: bool = False, llm: Any = None,
+                 reranker_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+                 retrieval_policy: Optional[RetrievalPolicy] = None, context_builder: Optional[ContextBuilder] = None,
+                 multi_query: bool = False, query_variations: int = 3, intent_routing: str = "off",
+                 intent_min_confidence: float = 0.6, session_store: Optional[SessionStore] = None,
+                 history_max_tokens: int = 300, llm_gateway: Optional[LLMGateway] = None,
+                 rerank_token_cache: bool = False):
+        """
+        Args:
+            persist_dir: Vector store directory
+            embedding_model: SentenceTransformer model for dense retrieval
+            llm_model: Groq model name
+            data_dir: Directory of source documents to index
+            retrieval_mode: "dense" for vector search only, "hybrid" to fuse it with BM25
+            cache_size: Maximum cached answers (0 disables the answer cache)
+            cache_ttl: Seconds a cached answer stays valid
+            cache_similarity_threshold: Cosine similarity needed for a semantic cache hit
+            inference_workers: Threads ask_async uses for embedding, retrieval and re-ranking
+            micro_batching: Batch query embeddings and re-rank pairs across concurrent requests
+            batch_window_ms: How long a micro-batch waits for more jobs
+            max_batch_size: Items that flush a micro-batch immediately
+            inference_backend: "torch", "onnx" or "onnx-int8" for the embedding and cross-encoder models
+            lazy_startup: Return without syncing the index or loading any model; call warm_up() later
+                (e.g. from a background thread) or let models load on first use
+            vector_backend: "chroma" (ChromaDB) or "faiss" (in-process FaissVectorStore)
+            faiss_index_type: "flat", "hnsw", "ivfpq", "sq8" or "binary" when vector_backend is "faiss"
+            read_only_index: Serve the published FAISS snapshot and never write it (pre-fork
+                workers); a separate index writer process keeps it in sync with data_dir
+            llm: Chat model to use instead of ChatGroq (anything with invoke/ainvoke/astream,
+                e.g. the offline stub in benchmarks/); GROQ_API_KEY is then not required
+            reranker_model: Cross-encoder used to re-rank retrieved candidates
+            retrieval_policy: Candidate depth and re-ranking policy (default: fixed depth, re-rank all)
+            context_builder: Merges, dedupes and packs re-ranked chunks into the prompt's token budget
+            multi_query: Also retrieve for rule-based rephrasings of the query and fuse the rankings
+            query_variations: Rephrasings per query in multi-query mode
+            intent_routing: "off", "rules" (keyword rules) or "centroid" (rules, then embedding
+                centroids) to search only chunks of the question's document_type
+            intent_min_confidence: Classifier confidence needed to narrow the search
+            session_store: Conversation state for session_id requests (None: every question stands alone)
+            history_max_tokens: Token budget of the previous turns included in a follow-up's prompt
+            llm_gateway: Pooling, coalescing, hedging, retry and circuit-breaker layer the LLM is
+                called through (wraps llm when given, else ChatGroq); None calls the model directly
+            rerank_token_cache: Store the cross-encoder token ids of chunks when they are indexed,
+                so re-ranking tokenizes only the query
+        """
+        if retrieval_mode not in ("dense", "hybrid"):
+            raise ValueError(f"Unknown retrieval_mode: {retrieval_mode}")
+        self.retrieval_mode = retrieval_mode
+        validate_backend(inference_backend)
+        if read_only_index and vector_backend != "faiss":
+            raise ValueError("read_only_index requires vector_backend='faiss'")
+        self.read_only_index = read_only_index
+        if vector_backend == "faiss":
+            from src.faiss_store import FaissVectorStore
+
+            self.vectorstore = FaissVectorStore(persist_dir=persist_dir, embedding_model=embedding_model,
+                                                inference_backend=inference_backend, index_type=faiss_index_type,
+                                                read_only=read_only_index)
+        elif vector_backend == "chroma":
+            self.vectorstore = ChromaVectorStore(persist_dir=persist_dir, embedding_model=embedding_model,
+                                                 inference_backend=inference_backend)
+        else:
+            raise ValueError(f"Unknown vector_backend: {vector_backend}")
         
         # Initialize reranker for improved accuracy
-        self.reranker = DocumentReranker(model_name="cross-encoder/ms-marco-MiniLM-L-6-v2")
+        self.reranker = DocumentReranker(model_name=reranker_model, backend=inference_backend)
+        if rerank_token_cache:
+            # Filled by the indexer (the index writer's, for a read-only index) and on re-ranking misses
+            token_store = ChunkTokenStore(os.path.join(persist_dir, "token_cache"), reranker_model,
+                                          read_only=read_only_index)
+            self.vectorstore.token_store = token_store
+            self.reranker.token_store = token_store
+        self.retrieval_policy = retrieval_policy or RetrievalPolicy()
+        self.context_builder = context_builder or ContextBuilder()
+        self.multi_query = multi_query
+        self.query_variations = query_variations
+        if intent_routing not in INTENT_ROUTING_MODES:
+            raise ValueError(f"Unknown intent_routing: {intent_routing}")
+        self.intent_classifier = QueryIntentClassifier(
+            encode=self.vectorstore.embed_queries if intent_routing == "centroid" else None,
+            min_confidence=intent_min_confidence
+        ) if intent_routing != "off" else None
         
+        self.sessions = session_store
+        self.history_max_tokens = history_max_tokens
+
         # Initialize query preprocessor
         self.query_preprocessor = QueryPreprocessor()
+
+        # Answer cache: exact match on the preprocessed query, then semantic match on its embedding
+        self.answer_cache = AnswerCache(
+            max_entries=cache_size,
+            ttl_seconds=cache_ttl,
+            similarity_threshold=cache_similarity_threshold
+        ) if cache_size > 0 else None
         
-        # Check if vector store has documents, if not build it
-        if self.vectorstore.collection.count() == 0:
-            from src.dataloader import load_all_documents
-            print("[INFO] Vector store is empty. Building from documents...")
-            docs = load_all_documents("data")
-            self.vectorstore.build_from_documents(docs)
+        self.micro_batching = micro_batching
+        self.batch_window_ms = batch_window_ms
+        self.max_batch_size = max_batch_size
+        self.inference_workers = inference_workers
+        self._start_workers()
         
-        groq_api_key = os.getenv("GROQ_API_KEY")
-        if not groq_api_key:
+        self.data_dir = data_dir
+        self.llm_model = llm_model
+        self.groq_api_key = os.getenv("GROQ_API_KEY")
+        if not self.groq_api_key and llm is None:
             raise ValueError("GROQ_API_KEY environment variable is not set")
-        
-        # Initialize LLM with proper temperature for consistent, factual responses
-        self.llm = ChatGroq(
-            groq_api_key=groq_api_key, 
-            model_name=llm_model,
-            temperature=0.2,  # Low temperature for factual, consistent responses
-            max_tokens=1024
-        )
-        print(f"[INFO] Groq LLM initialized: {llm_model}")
+        self.llm_gateway = llm_gateway
+        if llm is not None and llm_gateway is not None:
+            llm_gateway.llm = llm
+            llm = llm_gateway
+        self._llm = llm
+        self._llm_lock = threading.Lock()
+
+        self._ready = threading.Event()
+        self.warmup_seconds: Optional[float] = None
+        self.warmup_error: Optional[str] = None
+        if not lazy_startup:
+            self.warm_up()
+
+    def _start_workers(self):
+        """
+        Create the micro-batchers and the inference thread pool. Threads don't
+        survive fork(), so after_fork() calls this again in each worker process.
+        """
+        # Concurrent requests share forward passes instead of each running batch-of-1 inference
+        self.encode_batcher = None
+        self.rerank_batcher = None
+        if self.micro_batching:
+            self.encode_batcher = MicroBatcher(
+                lambda texts: self.vectorstore.model.encode(texts, batch_size=len(texts), show_progress_bar=False),
+                max_batch_size=self.max_batch_size, max_wait_ms=self.batch_window_ms, name="query_encode"
+            )
+            # A request contributes up to 15 (query, chunk) pairs, so the rerank batch is sized in pairs
+            self.rerank_batcher = MicroBatcher(
+                lambda pairs: self.reranker.predict(pairs, batch_size=len(pairs)),
+                max_batch_size=self.max_batch_size * 8, max_wait_ms=self.batch_window_ms, name="rerank"
+            )
+        self.vectorstore.query_encoder = self.encode_batcher
+        self.reranker.predictor = self.rerank_batcher
+
+        # Bounded pool for the CPU-bound stages of ask_async
+        self._executor = ThreadPoolExecutor(max_workers=self.inference_workers, thread_name_prefix="rag-inference")
+
+    def after_fork(self):
+        """
+        Re-create thread-backed state in a forked worker process. Models, the
+        memory-mapped index and the caches inherited from the parent are kept.
+        """
+        self._start_workers()
+        self.vectorstore.after_fork()
+        if self.llm_gateway is not None:
+            self.llm_gateway.after_fork()
+
+    @property
+    def llm(self):
+        """
+        Groq chat model, created on first use (importing langchain_groq is slow)
+        """
+        if self._llm is None:
+            with self._llm_lock:
+                if self._llm is None and self.llm_gateway is not None:
+                    # Pooled client without SDK retries; the gateway handles those
+                    self.llm_gateway.connect_groq(self.groq_api_key, self.llm_model, temperature=0.2, max_tokens=1024)
+                    self._llm = self.llm_gateway
+                    print(f"[INFO] Groq LLM initialized behind the gateway: {self.llm_model}")
+                elif self._llm is None:
+                    from langchain_groq import ChatGroq
+
+                    # Initialize LLM with proper temperature for consistent, factual responses
+                    self._llm = ChatGroq(
+                        groq_api_key=self.groq_api_key,
+                        model_name=self.llm_model,
+                        temperature=0.2,  # Low temperature for factual, consistent responses
+                        max_tokens=1024
+                    )
+                    print(f"[INFO] Groq LLM initialized: {self.llm_model}")
+        return self._llm
+
+    @llm.setter
+    def llm(self, llm):
+        self._llm = llm
+
+    def warm_up(self, load_models: bool = True):
+        """
+        Sync the index with data_dir and, if load_models, load the embedding model,
+        cross-encoder and LLM client and run one inference through each model so
+        the first request doesn't pay for it. Marks the instance ready when done;
+        a failure is kept in warmup_error and leaves it not ready.
+        """
+        started = time.perf_counter()
+        try:
+            # Bring the vector store up to date: only new or changed files are embedded.
+            # A read-only index is kept up to date by the index writer instead
+            if not self.read_only_index:
+                self.vectorstore.sync_directory(self.data_dir)
+            if load_models:
+                self.vectorstore.model.encode(["warm up"], show_progress_bar=False)
+                self.reranker.model.predict([["warm up", "warm up"]], show_progress_bar=False)
+                self.llm
+        except Exception as e:
+            self.warmup_error = str(e)
+            print(f"[ERROR] Warm-up failed: {e}")
+            raise
+        self.warmup_seconds = time.perf_counter() - started
+        self.warmup_error = None
+        self._ready.set()
+        print(f"[INFO] Warm-up finished in {self.warmup_seconds:.1f}s")
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def readiness(self) -> Dict:
+        """
+        Readiness details for health checks
+        """
+        return {
+            "ready": self.is_ready(),
+            "warmup_seconds": self.warmup_seconds,
+            "warmup_error": self.warmup_error,
+            "models_loaded": loaded_models(),
+        }
+
+    def batching_stats(self) -> Dict:
+        """
+        Batch-size and queue-wait histograms of the micro-batchers (empty when disabled)
+        """
+        return {batcher.name: batcher.stats() for batcher in (self.encode_batcher, self.rerank_batcher) if batcher is not None}
 
     def search_and_summarize(self, query: str, top_k: int = 5) -> str:
         """Legacy method for backward compatibility"""
@@ -82,7 +333,7 @@ class RAGSearch:
         
         return {"level": level, "score": float(normalized_score)}
     
-    def ask(self, query: str, top_k: int = 5) -> dict:
+    def ask(self, query: str, top_k: int = 5, session_id: Optional[str] = None) -> dict:
         """
         Advanced RAG function with improved accuracy through:
         1. Query preprocessing and expansion
@@ -94,39 +345,642 @@ class RAGSearch:
         Args:
             query: The user's question
             top_k: Number of final documents to use (default: 5)
+            session_id: Conversation the question belongs to; follow-up turns reuse
+                the previous turn's chunks and see its history (needs session_store)
             
         Returns:
             dict with keys: answer, sources, context, confidence, relevance_score
         """
-        print(f"[INFO] Processing query: {query}")
+        started = time.perf_counter()
+        trace: Dict[str, float] = {}
+        logger.debug(f"Processing query: {query}")
         
         # Step 1: Preprocess query
-        processed_query = self.query_preprocessor.preprocess(query)
-        print(f"[INFO] Preprocessed query: {processed_query}")
+        with span("preprocess", trace):
+            processed_query = self.query_preprocessor.preprocess(query)
+        logger.debug(f"Preprocessed query: {processed_query}")
+
+        session = self._get_session(session_id)
+        if session is not None:
+            # Follow-ups depend on the conversation, so they bypass the answer cache
+            prepared = self._prepare_follow_up(query, processed_query, top_k, session, trace)
+            result = self._finish(prepared, *self._generate(prepared, trace))
+            self._remember(session_id, query, processed_query, result, prepared)
+            return self._record_request("sync", query, result, trace, started)
         
-        # Step 2: Retrieve more candidates for re-ranking (fetch 3x more)
-        initial_k = min(top_k * 3, 15)
-        results = self.vectorstore.query(processed_query, top_k=initial_k)
+        # Answers are only valid for the index state they were generated from. A
+        # read-only worker checks for a newer snapshot first: cache hits never reach
+        # the store queries that would otherwise pick it up
+        self.vectorstore.maybe_refresh()
+        store_version = self.vectorstore.version
+        cached = self._cache_lookup_exact(processed_query, top_k, store_version)
+        if cached is not None:
+            self._remember(session_id, query, processed_query, cached)
+            return self._record_request("sync", query, cached, trace, started)
+
+        with span("embed", trace):
+            query_embedding, variations = self.embed(query, processed_query)
+        cached = self._cache_lookup_semantic(query_embedding, top_k, store_version)
+        if cached is not None:
+            self._remember(session_id, query, processed_query, cached)
+            return self._record_request("sync", query, cached, trace, started)
+
+        prepared = self._prepare(query, processed_query, query_embedding, top_k, trace, variations)
+        answer, failed = self._generate(prepared, trace)
+
+        result = self._finish(prepared, answer, failed)
+        if not failed:
+            self._cache_store(processed_query, query_embedding, top_k, store_version, result)
+        self._remember(session_id, query, processed_query, result, prepared)
+        return self._record_request("sync", query, result, trace, started)
+
+    def _generate(self, prepared: dict, trace: Optional[Dict[str, float]] = None):
+        """
+        (answer, failed) for a prepared prompt; no LLM call when nothing was retrieved
+        """
+        if prepared["prompt"] is None:
+            return NO_RESULTS_ANSWER, False
+        try:
+            # Generate response with optimal parameters for accuracy
+            with span("llm", trace):
+                response = self.llm.invoke(prepared["prompt"])
+            self._record_token_usage(response)
+            return response.content, False
+        except LLMUnavailableError as e:
+            logger.error(f"LLM unavailable, answering from context: {str(e)}")
+            return self._fallback_answer(prepared), True
+        except Exception as e:
+            logger.error(f"LLM invocation failed: {str(e)}")
+            return None, True
+
+    async def ask_async(self, query: str, top_k: int = 5, session_id: Optional[str] = None) -> dict:
+        """
+        Async variant of ask(). Embedding, retrieval and re-ranking run on a
+        bounded thread pool so the event loop stays free, and the LLM call is
+        awaited through ChatGroq.ainvoke instead of blocking a worker.
+        Returns the same dict as ask().
+        """
+        started = time.perf_counter()
+        trace: Dict[str, float] = {}
+        loop = asyncio.get_running_loop()
+        with span("preprocess", trace):
+            processed_query = self.query_preprocessor.preprocess(query)
+
+        session = await self._get_session_async(session_id)
+        if session is not None:
+            prepared = await loop.run_in_executor(self._executor, self._prepare_follow_up, query, processed_query,
+                                                  top_k, session, trace)
+            result = self._finish(prepared, *await self._generate_async(prepared, trace))
+            await self._remember_async(session_id, query, processed_query, result, prepared)
+            return self._record_request("async", query, result, trace, started)
+
+        self.vectorstore.maybe_refresh()
+        store_version = self.vectorstore.version
+        cached = self._cache_lookup_exact(processed_query, top_k, store_version)
+        if cached is not None:
+            await self._remember_async(session_id, query, processed_query, cached)
+            return self._record_request("async", query, cached, trace, started)
+
+        with span("embed", trace):
+            query_embedding, variations = await loop.run_in_executor(self._executor, self.embed, query, processed_query)
+        cached = self._cache_lookup_semantic(query_embedding, top_k, store_version)
+        if cached is not None:
+            await self._remember_async(session_id, query, processed_query, cached)
+            return self._record_request("async", query, cached, trace, started)
+
+        prepared = await loop.run_in_executor(self._executor, self._prepare, query, processed_query, query_embedding, top_k,
+                                              trace, variations)
+        answer, failed = await self._generate_async(prepared, trace)
+
+        result = self._finish(prepared, answer, failed)
+        if not failed:
+            self._cache_store(processed_query, query_embedding, top_k, store_version, result)
+        await self._remember_async(session_id, query, processed_query, result, prepared)
+        return self._record_request("async", query, result, trace, started)
+
+    async def _generate_async(self, prepared: dict, trace: Optional[Dict[str, float]] = None):
+        """
+        (answer, failed) for a prepared prompt; no LLM call when nothing was retrieved
+        """
+        if prepared["prompt"] is None:
+            return NO_RESULTS_ANSWER, False
+        try:
+            with span("llm", trace):
+                response = await self.llm.ainvoke(prepared["prompt"])
+            self._record_token_usage(response)
+            return response.content, False
+        except LLMUnavailableError as e:
+            logger.error(f"LLM unavailable, answering from context: {str(e)}")
+            return self._fallback_answer(prepared), True
+        except Exception as e:
+            logger.error(f"LLM invocation failed: {str(e)}")
+            return None, True
+
+    async def ask_batch_async(self, queries: List[str], top_k: int = 5, max_concurrency: int = 8) -> AsyncIterator[dict]:
+        """
+        Answer many queries at once. Retrieval runs batched (see _prepare_batch),
+        then up to max_concurrency LLM calls are in flight at a time. Yields the
+        ask() result dict of each query plus its "index" and "query", in
+        completion order. Answers are cached like ask_async()'s, so a batch can
+        also pre-warm the answer cache.
+        """
+        loop = asyncio.get_running_loop()
+        entries = await loop.run_in_executor(self._executor, self._prepare_batch, queries, top_k)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def answer(entry: dict) -> dict:
+            if entry["cached"] is not None:
+                return entry
+            async with semaphore:
+                answer_text, failed = await self._generate_async(entry["prepared"])
+            entry["result"] = self._finish(entry["prepared"], answer_text, failed)
+            if not failed:
+                self._cache_store(entry["processed_query"], entry["embedding"], top_k, entry["store_version"], entry["result"])
+            return entry
+
+        tasks = [asyncio.ensure_future(answer(entry)) for entry in entries]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                entry = await next_done
+                result = entry["cached"] if entry["cached"] is not None else entry["result"]
+                self._count_request("batch", result)
+                for index in entry["indexes"]:
+                    yield {"index": index, "query": queries[index], **result}
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def ask_stream_async(self, query: str, top_k: int = 5, session_id: Optional[str] = None) -> AsyncIterator[dict]:
+        """
+        Streaming variant of ask_async(). Yields events as dicts with "event" and "data":
+        - "meta": confidence and relevance_score, sent as soon as re-ranking finishes
+        - "token": a piece of answer text as it arrives from ChatGroq.astream
+        - "done": the full answer, including the low-confidence disclaimer if any
+        - "error": the generic error message when the LLM call fails
+        Cache hits are replayed as a meta event, one token event and done.
+        """
+        started = time.perf_counter()
+        trace: Dict[str, float] = {}
+        loop = asyncio.get_running_loop()
+        with span("preprocess", trace):
+            processed_query = self.query_preprocessor.preprocess(query)
+
+        session = await self._get_session_async(session_id)
+        self.vectorstore.maybe_refresh()
+        store_version = self.vectorstore.version
+        cached, query_embedding, variations = None, None, None
+        if session is None:
+            cached = self._cache_lookup_exact(processed_query, top_k, store_version)
+        if cached is None and session is None:
+            with span("embed", trace):
+                query_embedding, variations = await loop.run_in_executor(self._executor, self.embed, query, processed_query)
+            cached = self._cache_lookup_semantic(query_embedding, top_k, store_version)
+        if cached is not None:
+            await self._remember_async(session_id, query, processed_query, cached)
+            self._record_request("stream", query, cached, trace, started)
+            yield {"event": "meta", "data": {"confidence": cached["confidence"], "relevance_score": cached["relevance_score"]}}
+            yield {"event": "token", "data": {"text": cached["answer"]}}
+            yield {"event": "done", "data": {"answer": cached["answer"]}}
+            return
+
+        if session is not None:
+            prepared = await loop.run_in_executor(self._executor, self._prepare_follow_up, query, processed_query,
+                                                  top_k, session, trace)
+        else:
+            prepared = await loop.run_in_executor(self._executor, self._prepare, query, processed_query, query_embedding,
+                                                  top_k, trace, variations)
+        confidence = prepared["confidence"]
+        yield {"event": "meta", "data": {"confidence": confidence, "relevance_score": confidence["score"]}}
+
+        if prepared["prompt"] is None:
+            result = self._finish(prepared, NO_RESULTS_ANSWER, False)
+            yield {"event": "token", "data": {"text": result["answer"]}}
+        else:
+            parts = []
+            try:
+                # Includes the time the client takes to read each token, like the request duration
+                with span("llm", trace):
+                    async for chunk in self.llm.astream(prepared["prompt"]):
+                        self._record_token_usage(chunk)
+                        if chunk.content:
+                            parts.append(chunk.content)
+                            yield {"event": "token", "data": {"text": chunk.content}}
+            except LLMUnavailableError as e:
+                if parts:
+                    logger.error(f"LLM streaming failed: {str(e)}")
+                    self._record_request("stream", query, self._finish(prepared, None, True), trace, started)
+                    yield {"event": "error", "data": {"message": LLM_ERROR_ANSWER}}
+                    return
+                logger.error(f"LLM unavailable, answering from context: {str(e)}")
+                result = self._finish(prepared, self._fallback_answer(prepared), True)
+                await self._remember_async(session_id, query, processed_query, result, prepared)
+                self._record_request("stream", query, result, trace, started)
+                yield {"event": "token", "data": {"text": result["answer"]}}
+                yield {"event": "done", "data": {"answer": result["answer"]}}
+                return
+            except Exception as e:
+                logger.error(f"LLM streaming failed: {str(e)}")
+                self._record_request("stream", query, self._finish(prepared, None, True), trace, started)
+                yield {"event": "error", "data": {"message": LLM_ERROR_ANSWER}}
+                return
+            result = self._finish(prepared, "".join(parts), False)
+            # The disclaimer is only known to apply once the answer is complete, so it goes last
+            if result["answer"].endswith(LOW_CONFIDENCE_NOTE):
+                yield {"event": "token", "data": {"text": LOW_CONFIDENCE_NOTE}}
+
+        if session is None:
+            self._cache_store(processed_query, query_embedding, top_k, store_version, result)
+        await self._remember_async(session_id, query, processed_query, result, prepared)
+        self._record_request("stream", query, result, trace, started)
+        yield {"event": "done", "data": {"answer": result["answer"]}}
+
+    def _count_request(self, mode: str, result: dict) -> str:
+        """
+        Count a finished request in rag_requests_total{mode, outcome} and return the outcome
+        """
+        if result.get("cache_hit"):
+            outcome = "cache_hit"
+        elif result["answer"] == LLM_ERROR_ANSWER:
+            outcome = "error"
+        elif result["answer"].startswith(FALLBACK_ANSWER_PREFIX):
+            outcome = "fallback"
+        elif result["num_sources"] == 0:
+            outcome = "no_results"
+        else:
+            outcome = "answered"
+        REGISTRY.counter("rag_requests_total", "Answered questions by mode and outcome", mode=mode, outcome=outcome).inc()
+        return outcome
+
+    def _record_request(self, mode: str, query: str, result: dict, trace: Dict[str, float], started: float) -> dict:
+        """
+        Request-level metrics plus the sampled one-line summary; returns result unchanged
+        """
+        elapsed = time.perf_counter() - started
+        outcome = self._count_request(mode, result)
+        REGISTRY.histogram("rag_request_duration_seconds", "End-to-end time of one question", mode=mode).observe(elapsed)
+        if logger.sampled():
+            stages = " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in trace.items())
+            logger.info(f"{mode} request {outcome} in {elapsed * 1000:.1f}ms ({stages}) query={query[:80]!r}")
+        return result
+
+    @staticmethod
+    def _record_token_usage(message: Any):
+        """
+        Add an LLM response's (or stream chunk's) token counts to rag_llm_tokens_total
+        """
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            prompt_tokens, completion_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        else:
+            usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+            prompt_tokens, completion_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        if prompt_tokens:
+            REGISTRY.counter("rag_llm_tokens_total", "LLM tokens used", kind="prompt").inc(prompt_tokens)
+        if completion_tokens:
+            REGISTRY.counter("rag_llm_tokens_total", "LLM tokens used", kind="completion").inc(completion_tokens)
+
+    def _cache_lookup_exact(self, processed_query: str, top_k: int, store_version: int) -> Optional[dict]:
+        if self.answer_cache is None:
+            return None
+        cached = self.answer_cache.get_exact(f"{top_k}:{processed_query}", store_version)
+        if cached is None:
+            return None
+        REGISTRY.counter("rag_cache_lookups_total", "Answer cache lookups by result", result="exact").inc()
+        return {**cached, "cache_hit": "exact"}
+
+    def _cache_lookup_semantic(self, query_embedding: np.ndarray, top_k: int, store_version: int) -> Optional[dict]:
+        if self.answer_cache is None:
+            return None
+        cached = self.answer_cache.get_semantic(query_embedding, store_version, tag=top_k)
+        result = "semantic" if cached is not None else "miss"
+        REGISTRY.counter("rag_cache_lookups_total", "Answer cache lookups by result", result=result).inc()
+        return {**cached, "cache_hit": "semantic"} if cached is not None else None
+
+    def _cache_store(self, processed_query: str, query_embedding: np.ndarray, top_k: int, store_version: int, result: dict):
+        if self.answer_cache is not None:
+            self.answer_cache.put(f"{top_k}:{processed_query}", query_embedding, result, store_version, tag=top_k)
+
+    def _prepare_batch(self, queries: List[str], top_k: int) -> List[dict]:
+        """
+        _prepare() for many queries with one call per stage: one encode for all
+        uncached queries (and their rephrasings in multi-query mode), one multi-query store lookup
+        (plus one per routed document type with intent routing), one cross-encoder call
+        over every (query, chunk) pair. Queries that preprocess to the same text
+        are answered once.
+
+        Returns:
+            One entry per distinct query: "indexes" into queries, "processed_query",
+            "store_version", "embedding", and either "cached" (a finished result)
+            or "prepared" (the _prepare() dict, cached is None)
+        """
+        self.vectorstore.maybe_refresh()
+        store_version = self.vectorstore.version
+        entries: Dict[str, dict] = {}
+        for index, query in enumerate(queries):
+            processed_query = self.query_preprocessor.preprocess(query)
+            if processed_query in entries:
+                entries[processed_query]["indexes"].append(index)
+                continue
+            entries[processed_query] = {
+                "indexes": [index],
+                "query": query,
+                "processed_query": processed_query,
+                "store_version": store_version,
+                "embedding": None,
+                "cached": self._cache_lookup_exact(processed_query, top_k, store_version),
+                "prepared": None,
+            }
+        entries = list(entries.values())
+
+        pending = [entry for entry in entries if entry["cached"] is None]
+        if pending:
+            # Every phrasing of every query in one encode and one store lookup
+            for entry in pending:
+                entry["texts"] = self.query_texts(entry["query"], entry["processed_query"])
+            with span("batch_embed"):
+                embeddings = self.vectorstore.model.encode([text for entry in pending for text in entry["texts"]],
+                                                           batch_size=64, show_progress_bar=False)
+            offset = 0
+            for entry in pending:
+                entry["embeddings"] = embeddings[offset:offset + len(entry["texts"])]
+                offset += len(entry["texts"])
+                entry["embedding"] = entry["embeddings"][0]
+                entry["cached"] = self._cache_lookup_semantic(entry["embedding"], top_k, store_version)
+            pending = [entry for entry in pending if entry["cached"] is None]
+
+        if pending:
+            with span("batch_retrieve"):
+                initial_k = self.candidate_k(top_k)
+                for entry in pending:
+                    entry["where"] = self.route(entry["processed_query"], entry["embedding"])
+                    entry["retrieved"] = None
+                # One store lookup per document type routed to, then one for everything unrouted or too thin
+                routes: Dict[str, List[dict]] = {}
+                for entry in pending:
+                    if entry["where"] is not None:
+                        routes.setdefault(entry["where"]["document_type"], []).append(entry)
+                for group in routes.values():
+                    self._batch_search(group, initial_k, group[0]["where"])
+                unfiltered = [entry for entry in pending
+                              if not self._count_route(entry["where"], len(entry["retrieved"] or []), top_k)]
+                self._batch_search(unfiltered, initial_k)
+                # Depth and filter apply per query; the cascade doesn't, all pairs go in one call
+                retrieved = [self.retrieval_policy.select(entry["retrieved"], top_k) for entry in pending]
+            # Step 3: Re-rank all queries' candidates together
+            with span("batch_rerank"):
+                reranked = self.reranker.rerank_batch([entry["processed_query"] for entry in pending], retrieved, top_k=top_k)
+            for entry, results in zip(pending, reranked):
+                entry["prepared"] = self.build_prompt(entry["query"], entry["processed_query"], results)
+
+        logger.info(f"Prepared batch of {len(queries)} queries: {len(entries)} distinct, "
+                    f"{len(entries) - len(pending)} answered from cache")
+        return entries
+
+    def _batch_search(self, entries: List[dict], initial_k: int, where: Optional[Dict[str, str]] = None):
+        """
+        Fill entry["retrieved"] for every entry with one batch_query over all of their phrasings
+        """
+        if not entries:
+            return
+        rankings = self.vectorstore.batch_query([text for entry in entries for text in entry["texts"]],
+                                                np.concatenate([entry["embeddings"] for entry in entries]),
+                                                top_k=initial_k, hybrid=self.retrieval_mode == "hybrid", where=where)
+        offset = 0
+        for entry in entries:
+            own = rankings[offset:offset + len(entry["texts"])]
+            offset += len(entry["texts"])
+            entry["retrieved"] = own[0] if len(own) == 1 else self.vectorstore.fuse_rankings(own, initial_k)
+
+    def candidate_k(self, top_k: int) -> int:
+        """
+        Candidates retrieved for re-ranking when top_k documents are wanted
+        """
+        return self.retrieval_policy.candidate_k(top_k)
+
+    def embed(self, query: str, processed_query: str) -> Tuple[np.ndarray, Optional[List[Tuple[str, np.ndarray]]]]:
+        """
+        Embedding of the preprocessed query and, in multi-query mode, the
+        (text, embedding) pairs of its rephrasings, all from one encode call
+        """
+        if not self.multi_query:
+            return self.vectorstore.embed_query(processed_query), None
+        texts = self.query_texts(query, processed_query)
+        embeddings = self.vectorstore.embed_queries(texts)
+        return embeddings[0], list(zip(texts[1:], embeddings[1:]))
+
+    def query_texts(self, query: str, processed_query: str) -> List[str]:
+        """
+        Texts retrieved for a query: processed_query, then its rephrasings in multi-query mode
+        """
+        if not self.multi_query:
+            return [processed_query]
+        # The first variation is processed_query itself
+        return self.query_preprocessor.generate_variations(query, self.query_variations)
+
+    def route(self, processed_query: str, query_embedding: np.ndarray) -> Optional[Dict[str, str]]:
+        """
+        Metadata filter for the query's document_type when intent routing is on
+        and the classifier is confident, None to search the whole corpus
+        """
+        if self.intent_classifier is None:
+            return None
+        return self.intent_classifier.route(processed_query, query_embedding)
+
+    def _count_route(self, where: Optional[Dict[str, str]], found: int, top_k: int) -> bool:
+        """
+        Record a routing decision; True when the filtered search found enough
+        candidates, False when the full search has to run
+        """
+        if self.intent_classifier is None:
+            return False
+        outcome = "unrouted" if where is None else "filtered" if found >= top_k else "fallback"
+        REGISTRY.counter("rag_intent_routes_total", "Intent routing decisions by outcome", outcome=outcome).inc()
+        if outcome == "fallback":
+            logger.debug(f"Only {found} {where['document_type']} candidates, searching all documents")
+        return outcome == "filtered"
+
+    def retrieve(self, processed_query: str, query_embedding: np.ndarray, top_k: int,
+                 variations: Optional[List[Tuple[str, np.ndarray]]] = None) -> List[Dict]:
+        """
+        First-stage retrieval: up to candidate_k(top_k) documents for the re-ranker,
+        as selected by the retrieval policy. With variations (see embed()) every
+        phrasing is searched in one multi-query lookup and the rankings fused.
+        With intent routing only chunks of the query's document_type are searched,
+        unless that yields fewer than top_k candidates.
+        """
+        # Step 2: Retrieve more candidates for re-ranking
+        initial_k = self.candidate_k(top_k)
+        where = self.route(processed_query, query_embedding)
+        results = None
+        if where is not None:
+            results = self._search(processed_query, query_embedding, initial_k, variations, where)
+        if not self._count_route(where, len(results or []), top_k):
+            results = self._search(processed_query, query_embedding, initial_k, variations)
+        return self.retrieval_policy.select(results, top_k)
+
+    def _search(self, processed_query: str, query_embedding: np.ndarray, initial_k: int,
+                variations: Optional[List[Tuple[str, np.ndarray]]] = None,
+                where: Optional[Dict[str, str]] = None) -> List[Dict]:
+        if variations:
+            return self.vectorstore.multi_query([processed_query] + [text for text, _ in variations],
+                                                np.stack([query_embedding] + [embedding for _, embedding in variations]),
+                                                top_k=initial_k, hybrid=self.retrieval_mode == "hybrid", where=where)
+        if self.retrieval_mode == "hybrid":
+            return self.vectorstore.hybrid_query(processed_query, top_k=initial_k, query_embedding=query_embedding,
+                                                 where=where)
+        return self.vectorstore.query(processed_query, top_k=initial_k, query_embedding=query_embedding, where=where)
+
+    def rerank(self, processed_query: str, candidates: List[Dict], top_k: int) -> List[Dict]:
+        """
+        Second stage: the top_k candidates by cross-encoder score, per the retrieval policy
+        """
+        return self.retrieval_policy.rerank(self.reranker, processed_query, candidates, top_k)
+
+    def _get_session(self, session_id: Optional[str]) -> Optional[Dict]:
+        """
+        The session a follow-up question continues; None for a first turn or without a session store
+        """
+        if self.sessions is None or not session_id:
+            return None
+        session = self.sessions.get(session_id)
+        REGISTRY.counter("rag_session_turns_total", "Questions asked with a session_id by turn",
+                         turn="first" if session is None else "follow_up").inc()
+        return session
+
+    def _remember(self, session_id: Optional[str], query: str, processed_query: str, result: dict,
+                  prepared: Optional[dict] = None):
+        """
+        Record an answered turn in its session; cached answers carry no chunk ids,
+        so the next turn then retrieves at full depth
+        """
+        if self.sessions is None or not session_id or result["answer"] == LLM_ERROR_ANSWER \
+                or result["answer"].startswith(FALLBACK_ANSWER_PREFIX):
+            return
+        answer = result["answer"]
+        if answer.endswith(LOW_CONFIDENCE_NOTE):
+            answer = answer[:-len(LOW_CONFIDENCE_NOTE)]
+        prepared = prepared or {}
+        # A follow-up is remembered by the text it was searched with, so "and then?" chains keep the topic
+        self.sessions.record(session_id, query, prepared.get("search_query", processed_query), answer,
+                             prepared.get("chunks", []))
+
+    async def _get_session_async(self, session_id: Optional[str]) -> Optional[Dict]:
+        """
+        _get_session() for the event loop: the session store is read on the thread pool
+        """
+        if self.sessions is None or not session_id:
+            return None
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._get_session, session_id)
+
+    async def _remember_async(self, session_id: Optional[str], query: str, processed_query: str, result: dict,
+                              prepared: Optional[dict] = None):
+        """
+        _remember() for the event loop: a write can wait on another worker's lock,
+        so it runs on the thread pool
+        """
+        if self.sessions is None or not session_id:
+            return
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._remember, session_id, query,
+                                                         processed_query, result, prepared)
+
+    def follow_up_query(self, processed_query: str, session: Dict) -> str:
+        """
+        Text retrieved and re-ranked for a follow-up: a question that refers back
+        ("what's the fee for that?") or is only a few words is searched together
+        with the previous question
+        """
+        if FOLLOW_UP_PATTERN.search(processed_query) or len(processed_query.split()) <= 3:
+            return " ".join(f"{session['processed_query']} {processed_query}".split()[-MAX_FOLLOW_UP_WORDS:])
+        return processed_query
+
+    def history(self, session: Dict) -> str:
+        """
+        The most recent turns of a session for the prompt, within history_max_tokens
+        """
+        turns: List[str] = []
+        budget = self.history_max_tokens
+        for question, answer in reversed(session["turns"]):
+            turn = f"Student: {question}\nAssistant: {answer}"
+            tokens = estimate_tokens(turn)
+            if tokens > budget:
+                if not turns and budget > 0:
+                    # The latest turn alone is over budget: keep its beginning
+                    turns.append(turn[:budget * 4].rstrip() + "...")
+                break
+            turns.insert(0, turn)
+            budget -= tokens
+        if not turns:
+            return ""
+        return "PREVIOUS CONVERSATION:\n" + "\n\n".join(turns) + "\n\n"
+
+    def _prepare_follow_up(self, query: str, processed_query: str, top_k: int, session: Dict,
+                           trace: Optional[Dict[str, float]] = None) -> dict:
+        """
+        _prepare() for a follow-up turn: the previous turn's chunks are re-ranked
+        together with a narrow fresh retrieval (top_k instead of candidate_k(top_k)
+        candidates), and the conversation so far goes into the prompt
+        """
+        search_query = self.follow_up_query(processed_query, session)
+        with span("embed", trace):
+            query_embedding = self.vectorstore.embed_query(search_query)
+        with span("retrieve", trace):
+            # Best previous chunks first; chunks re-indexed since then are skipped
+            chunk_ids = [chunk_id for chunk_id, _ in sorted(session["chunks"], key=lambda chunk: chunk[1], reverse=True)]
+            previous = self.vectorstore.get_documents(chunk_ids, query_embedding) if chunk_ids else []
+            fresh = self._search(search_query, query_embedding, top_k if previous else self.candidate_k(top_k))
+            fresh_ids = {doc["id"] for doc in fresh}
+            candidates = fresh + [doc for doc in previous if doc["id"] not in fresh_ids]
+        if not candidates:
+            return {**self.build_prompt(query, processed_query, []), "search_query": search_query}
+
+        with span("rerank", trace):
+            reranked_results = self.rerank(search_query, candidates, top_k)
+        logger.debug(f"Follow-up re-ranked {len(fresh)} fresh + {len(candidates) - len(fresh)} previous chunks")
+        with span("prompt", trace):
+            prepared = self.build_prompt(query, processed_query, reranked_results, self.history(session))
+        return {**prepared, "search_query": search_query}
+
+    def _prepare(self, query: str, processed_query: str, query_embedding: np.ndarray, top_k: int,
+                 trace: Optional[Dict[str, float]] = None,
+                 variations: Optional[List[Tuple[str, np.ndarray]]] = None) -> dict:
+        """
+        Retrieve, re-rank and build the prompt for an already preprocessed query.
+        Everything here is local CPU work; the LLM call is left to the caller.
+        "prompt" is None when nothing relevant was retrieved.
+        Stage timings are added to trace when given.
+        """
+        with span("retrieve", trace):
+            results = self.retrieve(processed_query, query_embedding, top_k, variations)
         
         if not results:
+            return self.build_prompt(query, processed_query, [])
+        
+        # Step 3: Re-rank documents for better accuracy
+        with span("rerank", trace):
+            reranked_results = self.rerank(processed_query, results, top_k)
+        logger.debug(f"Re-ranked {len(results)} documents to top {len(reranked_results)}")
+        with span("prompt", trace):
+            return self.build_prompt(query, processed_query, reranked_results)
+
+    def build_prompt(self, query: str, processed_query: str, reranked_results: List[Dict], history: str = "") -> dict:
+        """
+        Confidence, context and prompt from the re-ranked documents of one query;
+        history (see history()) is placed before the question
+        """
+        if not reranked_results:
             return {
-                "answer": "I don't have information about that in my knowledge base. Please ask questions related to campus events, clubs, courses, facilities, or other campus-specific topics.",
+                "prompt": None,
                 "sources": [],
                 "context": "",
                 "confidence": {"level": "low", "score": 0.0},
-                "relevance_score": 0.0
+                "num_sources": 0
             }
-        
-        # Step 3: Re-rank documents for better accuracy
-        reranked_results = self.reranker.rerank(processed_query, results, top_k=top_k)
-        print(f"[INFO] Re-ranked {len(results)} documents to top {len(reranked_results)}")
-        
+
         # Step 4: Calculate confidence
         confidence = self.calculate_confidence(processed_query, reranked_results)
-        print(f"[INFO] Confidence: {confidence['level']} (score: {confidence['score']:.2f})")
+        logger.debug(f"Confidence: {confidence['level']} (score: {confidence['score']:.2f})")
         
         # Step 5: Build context with source attribution
-        context_parts = []
         sources = []
         
         for i, result in enumerate(reranked_results, 1):
@@ -146,53 +1000,57 @@ class RAGSearch:
                 "content_preview": content[:200] + "..." if len(content) > 200 else content
             }
             sources.append(source_info)
-            
-            # Build context without source markers (cleaner for user)
-            context_parts.append(content)
         
-        context = "\n\n---\n\n".join(context_parts)
+        # Build context without source markers (cleaner for user); overlapping
+        # chunks are merged and the total is kept within the token budget
+        context = "\n\n---\n\n".join(self.context_builder.build(reranked_results))
+        REGISTRY.histogram("rag_context_tokens", "Estimated tokens of the prompt's context block",
+                           buckets=CONTEXT_TOKEN_BUCKETS).observe(estimate_tokens(context))
         
         # Step 6: Enhanced prompt template with clear instructions
-        prompt_template = """You are a helpful campus assistant for CampusConnect. Your role is to provide accurate, specific information based on official campus documents.
-
-CRITICAL INSTRUCTIONS:
-1. Answer ONLY based on the provided context from official documents
-2. If the context doesn't contain enough information, say: "I don't have specific information about that in my knowledge base. Please contact the campus office or visit the official campus website for more details."
-3. Be specific with dates, times, locations, deadlines, and requirements
-4. If multiple sources provide different information, mention all perspectives
-5. Use bullet points for lists and multiple items
-6. Be concise but comprehensive - provide complete answers
-7. If asked about procedures, list all steps clearly
-8. Provide information naturally without citing sources
-
-CONTEXT FROM OFFICIAL CAMPUS DOCUMENTS:
-{context}
+        return {
+            "prompt": PROMPT_TEMPLATE.format(context=context, history=history, question=query),
+            "sources": sources,
+            "context": context,
+            "confidence": confidence,
+            "num_sources": len(reranked_results),
+            # What a session remembers of this turn
+            "chunks": [(result["id"], result.get("rerank_score", 0.0)) for result in reranked_results if "id" in result]
+        }
 
-STUDENT QUESTION: {question}
+    def _fallback_answer(self, prepared: dict) -> str:
+        """
+        Extractive answer for when the LLM is unavailable: the leading sentences
+        of the best re-ranked passage
+        """
+        REGISTRY.counter("rag_llm_fallbacks_total", "Answers served without the LLM by kind", kind="extractive").inc()
+        passage = prepared["context"].split("\n\n---\n\n")[0].strip()
+        excerpt = ""
+        for sentence in re.split(r"(?<=[.!?])\s+", passage):
+            if excerpt and len(excerpt) + len(sentence) > FALLBACK_EXCERPT_CHARS:
+                break
+            excerpt = f"{excerpt} {sentence}".strip()
+        return FALLBACK_ANSWER_PREFIX + excerpt[:FALLBACK_EXCERPT_CHARS]
 
-DETAILED ANSWER:"""
-        
-        prompt = prompt_template.format(context=context, question=query)
-        
-        try:
-            # Generate response with optimal parameters for accuracy
-            response = self.llm.invoke(prompt)
-            answer = response.content
-            
-            # Add disclaimer for low confidence
-            if confidence['level'] == 'low':
-                answer += "\n\n⚠️ Note: My confidence in this answer is low. Please verify this information with official campus sources."
-            
-        except Exception as e:
-            print(f"[ERROR] LLM invocation failed: {str(e)}")
-            answer = "I encountered an error processing your question. Please try again."
+    def _finish(self, prepared: dict, answer: Optional[str], failed: bool) -> dict:
+        """
+        Assemble the response dict, adding the low-confidence disclaimer or
+        the error message when the LLM call failed (failed with an answer is
+        the extractive fallback).
+        """
+        confidence = prepared["confidence"]
+        if failed:
+            answer = answer or LLM_ERROR_ANSWER
             confidence = {"level": "low", "score": 0.0}
-        
+        elif prepared["prompt"] is not None and confidence['level'] == 'low':
+            # Add disclaimer for low confidence
+            answer += LOW_CONFIDENCE_NOTE
+
         return {
             "answer": answer,
-            "sources": sources,
-            "context": context,
+            "sources": prepared["sources"],
+            "context": prepared["context"],
             "confidence": confidence,
             "relevance_score": confidence['score'],
-            "num_sources": len(reranked_results)
-        }
\ No newline at end of file
+            "num_sources": prepared["num_sources"]
+        }
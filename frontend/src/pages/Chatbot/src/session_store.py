@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+class SessionStore:
+    """
+    Conversation state for multi-turn chats, shared by every worker process.
+
+    Each session holds its last max_turns (question, answer) pairs, the last
+    preprocessed question and the (chunk id, rerank score) pairs the last turn
+    was answered from. Sessions expire ttl_seconds after their last turn and
+    the least recently used are evicted beyond max_sessions. Only ids are kept,
+    so a session costs a few hundred bytes plus its history text.
+
+    Sessions live in one SQLite file (WAL mode), so a follow-up can land on any
+    pre-fork worker. Each process opens its own connection on first use; one
+    inherited across a fork is never used. Without a path the store is an
+    in-memory database private to the process.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_sessions: int = 10000, ttl_seconds: float = 1800,
+                 max_turns: int = 4):
+        """
+        Args:
+            path: SQLite file shared by the workers (None: this process only)
+            max_sessions: Sessions kept; least recently used are evicted first
+            ttl_seconds: Idle time after which a session is forgotten
+            max_turns: Question/answer pairs remembered per session
+        """
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._inherited: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self.counters = {"evictions": 0, "expirations": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        # Called with the lock held
+        if self._connection is not None and self._pid == os.getpid():
+            return self._connection
+        if self._connection is not None:
+            # Opened by the parent before a fork; closing it here could release the parent's locks
+            self._inherited.append(self._connection)
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path or ":memory:", timeout=10, isolation_level=None,
+                                     check_same_thread=False)
+        if self.path:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS sessions "
+                           "(id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)")
+        # Expiry order is also least-recently-used order, since every turn sets expires_at = now + ttl
+        connection.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+        self._connection, self._pid = connection, os.getpid()
+        return connection
+
+    def new_id(self) -> str:
+        """
+        A fresh, unguessable session id
+        """
+        return uuid.uuid4().hex
+
+    def resolve(self, session_id: Optional[str]) -> str:
+        """
+        The id a turn should be recorded under: session_id if it names a live
+        session, a new id otherwise. Client-chosen ids are never adopted, so
+        nobody can join another student's conversation by guessing its id.
+        """
+        if session_id and self.get(session_id) is not None:
+            return session_id
+        return self.new_id()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Snapshot of a live session: "turns", "processed_query" and "chunks";
+        None if unknown or expired
+        """
+        with self._lock:
+            row = self._connect().execute("SELECT data FROM sessions WHERE id = ? AND expires_at > ?",
+                                          (session_id, time.time())).fetchone()
+        if row is None:
+            return None
+        session = json.loads(row[0])
+        return {
+            "turns": [tuple(turn) for turn in session["turns"]],
+            "processed_query": session["processed_query"],
+            "chunks": [tuple(chunk) for chunk in session["chunks"]],
+        }
+
+    def record(self, session_id: str, query: str, processed_query: str, answer: str,
+               chunks: List[Tuple[str, float]]):
+        """
+        Append a turn to the session (creating it if needed) and replace its chunks
+        """
+        with self._lock:
+            connection = self._connect()
+            now = time.time()
+            # IMMEDIATE takes the write lock up front, so two workers can't both extend the same history
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                expired = connection.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+                row = connection.execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+                turns = json.loads(row[0])["turns"] if row is not None else []
+                session = {
+                    "turns": (turns + [[query, answer]])[-self.max_turns:],
+                    "processed_query": processed_query,
+                    "chunks": [list(chunk) for chunk in chunks],
+                }
+                connection.execute("INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)",
+                                   (session_id, json.dumps(session), now + self.ttl_seconds))
+                (count,) = connection.execute("SELECT COUNT(*) FROM sessions").fetchone()
+                evicted = 0
+                if count > self.max_sessions:
+                    evicted = connection.execute(
+                        "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions ORDER BY expires_at LIMIT ?)",
+                        (count - self.max_sessions,)).rowcount
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            self.counters["expirations"] += expired
+            self.counters["evictions"] += evicted
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM sessions")
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._connect().execute("SELECT COUNT(*) FROM sessions WHERE expires_at > ?",
+                                               (time.time(),)).fetchone()
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "sessions": len(self)}
@@ -0,0 +1,200 @@
+import os
+import re
+import json
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+from src.embedding_cache import KEY_BYTES, text_key
+from src.metrics import REGISTRY
+
+# Positions a tokenizer without a real model_max_length is assumed to allow
+DEFAULT_MAX_LENGTH = 512
+
+class ChunkTokenStore:
+    """
+    Cross-encoder token ids of every indexed chunk, keyed by chunk-text hash,
+    so re-ranking only has to tokenize the query.
+
+    Ids are stored without special tokens and truncated to the model's max
+    length minus query_reserve and the pair's special tokens. Layout follows
+    EmbeddingCache: a directory per tokenizer holding the flat int32 ids
+    (ids.i32, read through np.memmap), the id count of each chunk
+    (lengths.i32) and the parallel 16-byte text hashes (keys.bin). Rows are
+    only appended; a partial tail left by a crash is trimmed on open. A
+    read-only store (pre-fork workers) never writes and picks up rows appended
+    by the index writer when it misses.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, query_reserve: int = 64, read_only: bool = False):
+        """
+        Args:
+            cache_dir: Directory holding one sub-directory per tokenizer
+            model_name: Cross-encoder whose tokenizer produces the ids
+            query_reserve: Tokens left for the query when truncating chunks
+            read_only: Never write; misses are tokenized but not stored
+        """
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.dir = os.path.join(cache_dir, safe_name)
+        self.model_name = model_name
+        self.query_reserve = query_reserve
+        self.read_only = read_only
+        self.keys_path = os.path.join(self.dir, "keys.bin")
+        self.lengths_path = os.path.join(self.dir, "lengths.i32")
+        self.ids_path = os.path.join(self.dir, "ids.i32")
+        self.meta_path = os.path.join(self.dir, "meta.json")
+        self.index: Dict[bytes, int] = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._ids: Optional[np.memmap] = None
+        self._keys_size = 0
+        self._tokenizer = None
+        self._lock = threading.Lock()
+        if not read_only:
+            os.makedirs(self.dir, exist_ok=True)
+        self._load()
+
+    @property
+    def tokenizer(self) -> Any:
+        """
+        The cross-encoder's tokenizer, loaded on first use (without the model weights)
+        """
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        return self._tokenizer
+
+    @property
+    def max_length(self) -> int:
+        model_max_length = self.tokenizer.model_max_length
+        return model_max_length if model_max_length and model_max_length < 100000 else DEFAULT_MAX_LENGTH
+
+    @property
+    def max_chunk_tokens(self) -> int:
+        return self.max_length - self.query_reserve - self.tokenizer.num_special_tokens_to_add(pair=True)
+
+    def _load(self):
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("query_reserve") != self.query_reserve:
+                if self.read_only:
+                    return
+                # Ids were truncated for another reserve, start over
+                for path in (self.keys_path, self.lengths_path, self.ids_path, self.meta_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                return
+        keys = b""
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "rb") as f:
+                keys = f.read()
+        lengths = np.fromfile(self.lengths_path, dtype=np.int32) if os.path.exists(self.lengths_path) else np.zeros(0, np.int32)
+        id_count = os.path.getsize(self.ids_path) // 4 if os.path.exists(self.ids_path) else 0
+        offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        # Rows whose keys, length and ids are all on disk
+        rows = min(len(keys) // KEY_BYTES, len(lengths), int(np.searchsorted(offsets, id_count, side="right")) - 1)
+
+        if not self.read_only:
+            # Trim any partially written tail so the three files stay aligned
+            for path, size in ((self.keys_path, rows * KEY_BYTES), (self.lengths_path, rows * 4),
+                               (self.ids_path, int(offsets[rows]) * 4)):
+                if os.path.exists(path) and os.path.getsize(path) != size:
+                    with open(path, "r+b") as f:
+                        f.truncate(size)
+
+        self._keys_size = rows * KEY_BYTES
+        self._offsets = offsets[:rows + 1]
+        self._ids = None
+        self.index = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(rows)}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _get_ids(self) -> np.memmap:
+        # Re-map when rows were appended since the last map
+        total = int(self._offsets[-1])
+        if self._ids is None or self._ids.shape[0] < total:
+            self._ids = np.memmap(self.ids_path, dtype=np.int32, mode="r", shape=(total,))
+        return self._ids
+
+    def _refresh(self):
+        # Read-only: the writer may have appended rows since we loaded
+        if os.path.exists(self.keys_path) and os.path.getsize(self.keys_path) > self._keys_size:
+            self._load()
+
+    def lookup(self, texts: List[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """
+        Look up stored token ids.
+
+        Returns:
+            (hits, misses): hits maps position in texts -> int32 ids,
+            misses lists the positions that are not stored
+        """
+        hits: Dict[int, np.ndarray] = {}
+        misses: List[int] = []
+        with self._lock:
+            keys = [text_key(text) for text in texts]
+            if any(key not in self.index for key in keys) and self.read_only:
+                self._refresh()
+            ids = self._get_ids() if self.index and int(self._offsets[-1]) else None
+            for i, key in enumerate(keys):
+                row = self.index.get(key)
+                if row is None:
+                    misses.append(i)
+                else:
+                    hits[i] = ids[self._offsets[row]:self._offsets[row + 1]] if ids is not None else np.zeros(0, np.int32)
+        return hits, misses
+
+    def tokenize(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Token ids of texts as stored: no special tokens, at most max_chunk_tokens
+        """
+        encoded = self.tokenizer(texts, add_special_tokens=False, truncation=True, max_length=self.max_chunk_tokens)
+        return [np.asarray(ids, dtype=np.int32) for ids in encoded["input_ids"]]
+
+    def add(self, texts: List[str], token_ids: Optional[List[np.ndarray]] = None):
+        """
+        Tokenize and append texts that are not stored yet (ids may be passed in)
+        """
+        if self.read_only:
+            return
+        with self._lock:
+            new = {}
+            for position, text in enumerate(texts):
+                key = text_key(text)
+                if key not in self.index and key not in new:
+                    new[key] = position
+            if not new:
+                return
+            positions = list(new.values())
+            rows = ([token_ids[p] for p in positions] if token_ids is not None
+                    else self.tokenize([texts[p] for p in positions]))
+            if not os.path.exists(self.meta_path):
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model_name": self.model_name, "query_reserve": self.query_reserve}, f)
+
+            # Ids and lengths first, then keys: a key is only visible once its ids are on disk
+            with open(self.ids_path, "ab") as f:
+                f.write(np.concatenate(rows).astype(np.int32).tobytes() if rows else b"")
+            with open(self.lengths_path, "ab") as f:
+                f.write(np.asarray([len(row) for row in rows], dtype=np.int32).tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(new))
+            start = len(self.index)
+            for offset, key in enumerate(new):
+                self.index[key] = start + offset
+            self._offsets = np.concatenate([self._offsets, self._offsets[-1] + np.cumsum([len(row) for row in rows])])
+            self._keys_size += len(new) * KEY_BYTES
+
+    def get(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Token ids of every text; misses are tokenized now and stored unless read-only
+        """
+        hits, misses = self.lookup(texts)
+        REGISTRY.counter("rag_rerank_token_cache_total", "Chunk token id lookups by result", result="hit").inc(len(hits))
+        if misses:
+            REGISTRY.counter("rag_rerank_token_cache_total", "Chunk token id lookups by result", result="miss").inc(len(misses))
+            tokenized = self.tokenize([texts[i] for i in misses])
+            self.add([texts[i] for i in misses], tokenized)
+            hits.update(zip(misses, tokenized))
+        return [hits[i] for i in range(len(texts))]
@@ -1,166 +1,553 @@
 import os
-import uuid
 import numpy as np
-from typing import List, Any, Dict
-from sentence_transformers import SentenceTransformer
+from typing import List, Any, Dict, Iterator, Optional, Tuple
 import chromadb
 from chromadb.config import Settings
 from src.embedding import EmbeddingPipeline
+from src.models import get_embedding_model
+from src.indexer import IncrementalIndexer, assign_chunk_ids
+from src.lexical_index import BM25Index, reciprocal_rank_fusion
+from src import logger
+from concurrent.futures import ThreadPoolExecutor
 
-class ChromaVectorStore:
-    def __init__(self, persist_dir: str = "./data/vector_store", embedding_model: str = "openai/gpt-oss-120b", 
-                 chunk_size: int = 1000, chunk_overlap: int = 200, collection_name: str = "pdf_documents"):
+LEXICAL_INDEX_FILENAME = "lexical_index.pkl"
+
+def matches_where(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """
+    Whether metadata satisfies a Chroma-style filter: {"field": value} or
+    {"field": {"$in": [values]}}, all fields must match
+    """
+    if not where:
+        return True
+    for field, condition in where.items():
+        value = (metadata or {}).get(field)
+        if isinstance(condition, dict):
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+class BaseVectorStore:
+    """
+    Indexing and retrieval logic shared by the vector store backends.
+
+    A backend only stores rows of (id, embedding, text, metadata) and implements
+    count(), _upsert(), _delete_ids(), _clear(), _dense_search(), _fetch() and
+    _iter_texts(). Chunking, embedding, incremental sync, the BM25 index and
+    hybrid fusion live here, so every backend answers queries the same way.
+    """
+
+    def __init__(self, persist_dir: str, embedding_model: str, chunk_size: int, chunk_overlap: int,
+                 batch_size: int, inference_backend: str):
         self.persist_dir = persist_dir
-        self.collection_name = collection_name
+        self.batch_size = batch_size
         self.embedding_model = embedding_model
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.model = SentenceTransformer(embedding_model)
-        self.client = None
-        self.collection = None
-        self._initialize_store()
-        print(f"[INFO] Loaded embedding model: {embedding_model}")
+        self.inference_backend = inference_backend
+        self._embedding_pipeline = None
+        # Optional callable(list of texts) -> embeddings used for queries, e.g. a MicroBatcher
+        self.query_encoder = None
+        # Optional ChunkTokenStore given the cross-encoder token ids of every chunk added
+        self.token_store = None
+        # Bumped on every write so caches built on query results can tell they are stale
+        self.version = 0
+        self.lexical_index = None
+        # Dense and lexical searches of a hybrid query run side by side
+        self._search_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hybrid-search")
 
-    def _initialize_store(self):
+    def _init_lexical_index(self, sync: bool = True):
+        # Called by the backend once its storage is open, since a rebuild reads the stored texts.
+        # Read-only stores pass sync=False: only the writer rebuilds and saves the index
+        self.lexical_index = BM25Index(os.path.join(self.persist_dir, LEXICAL_INDEX_FILENAME))
+        if sync:
+            self._sync_lexical_index()
+
+    def after_fork(self):
+        # The parent's search threads don't exist in a forked child
+        self._search_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hybrid-search")
+
+    @property
+    def model(self):
         """
-        Initialize the ChromaDB client and collection
+        Shared SentenceTransformer, loaded on the first query or build
         """
-        try:
-            # Make persistent ChromaDB client
-            os.makedirs(self.persist_dir, exist_ok=True)
-            self.client = chromadb.PersistentClient(
-                path=self.persist_dir,
-                settings=Settings(anonymized_telemetry=False)
-            )
+        return get_embedding_model(self.embedding_model, self.inference_backend)
 
-            # Get or create collection
-            self.collection = self.client.get_or_create_collection(
-                name=self.collection_name,
-                metadata={"hnsw:space": "cosine", "description": "PDF Document embeddings for RAG"}
-            )
-            print(f"[INFO] Vector Store initialized with collection: {self.collection_name}")
-            print(f"[INFO] Existing documents in collection: {self.collection.count()}")
+    # --- storage interface implemented by each backend ---
 
-        except Exception as e:
-            print(f"[ERROR] Error initializing ChromaDB: {str(e)}")
-            raise e
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def _max_write_batch(self) -> int:
+        return self.batch_size
+
+    def _upsert(self, ids: List[str], embeddings: np.ndarray, texts: List[str], metadatas: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def _delete_ids(self, ids: List[str]):
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+    def _dense_search(self, query_embedding: np.ndarray, top_k: int,
+                      where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Nearest chunks by cosine similarity, only among those whose metadata matches where
+        """
+        raise NotImplementedError
+
+    def _dense_search_batch(self, query_embeddings: np.ndarray, top_k: int,
+                            where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        _dense_search for several queries; backends with a multi-query lookup override it
+        """
+        return [self._dense_search(query_embedding, top_k, where) for query_embedding in query_embeddings]
+
+    def _fetch(self, ids: List[str]) -> List[Tuple[str, str, Dict[str, Any], np.ndarray]]:
+        """
+        (id, text, metadata, embedding) for each stored id; unknown ids are skipped
+        """
+        raise NotImplementedError
+
+    def _iter_texts(self, page_size: int) -> Iterator[Tuple[List[str], List[str]]]:
+        """
+        Yield (ids, texts) pages covering every stored document
+        """
+        raise NotImplementedError
+
+    def maybe_refresh(self):
+        """
+        Pick up writes published by another process; called before every query.
+        Backends whose reads always see the latest data need not override it.
+        """
+
+    # --- shared behaviour ---
+
+    def _sync_lexical_index(self):
+        """
+        Rebuild the lexical index from the stored documents if they disagree
+        (first run with hybrid search, or a crash before the index was saved)
+        """
+        total = self.count()
+        if len(self.lexical_index) == total:
+            return
+        print(f"[INFO] Rebuilding lexical index from {total} stored documents...")
+        self.lexical_index.clear()
+        for ids, texts in self._iter_texts(1000):
+            self.lexical_index.add(ids, texts)
+        self.lexical_index.save()
+
+    def flush(self):
+        """
+        Persist the lexical index after a batch of writes
+        """
+        self.lexical_index.save()
+
+    def get_embedding_pipeline(self) -> EmbeddingPipeline:
+        """
+        Return the chunking/embedding pipeline, creating it on first use
+        """
+        if self._embedding_pipeline is None:
+            self._embedding_pipeline = EmbeddingPipeline(
+                model_name=self.embedding_model,
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                batch_size=self.batch_size,
+                cache_dir=os.path.join(self.persist_dir, "embedding_cache"),
+                backend=self.inference_backend
+            )
+        return self._embedding_pipeline
 
     def build_from_documents(self, documents: List[Any]):
         """
-        Build vector store from raw documents
+        Build vector store from raw documents.
+        Chunk ids are derived from the source file and chunk content, so
+        building twice from the same documents does not create duplicates.
         """
         print(f"[INFO] Building vector store from {len(documents)} raw documents...")
-        emb_pipe = EmbeddingPipeline(model_name=self.embedding_model, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+        emb_pipe = self.get_embedding_pipeline()
         chunks = emb_pipe.chunk_documents(documents)
-        
-        # Generate embeddings
-        texts = [chunk.page_content for chunk in chunks]
-        print(f"[INFO] Generating embeddings for {len(texts)} chunks...")
-        embeddings = emb_pipe.embed_chunks(chunks)
-        
-        # Add to vector store
-        self.add_documents(chunks, embeddings)
+        ids = assign_chunk_ids(chunks)
+
+        # Embed and upsert batch by batch so memory stays bounded by batch_size
+        print(f"[INFO] Generating embeddings for {len(chunks)} chunks...")
+        start = 0
+        for batch, embeddings in emb_pipe.iter_embedded_batches(chunks):
+            self.add_documents(batch, embeddings, ids=ids[start:start + len(batch)])
+            start += len(batch)
+        self.flush()
         print(f"[INFO] Vector store built and saved to {self.persist_dir}")
 
-    def add_documents(self, documents: List[Any], embeddings: np.ndarray):
+    def sync_directory(self, data_dir: str, max_workers: Optional[int] = None, max_in_flight: Optional[int] = None) -> Dict[str, int]:
+        """
+        Incrementally index a data directory: only new or changed files are
+        loaded and embedded, and chunks of deleted files are removed.
+        Files are parsed in parallel and embedded as they finish.
+        Returns per-category file counts.
+        """
+        return IncrementalIndexer(self, data_dir, max_workers=max_workers, max_in_flight=max_in_flight).sync()
+
+    def add_documents(self, documents: List[Any], embeddings: np.ndarray, ids: Optional[List[str]] = None):
         """
-        Add documents to the vector store
+        Add or update documents in the vector store
         Args:
         documents: List of LangChain Document objects
         embeddings: Numpy array of embeddings
+        ids: Chunk ids (default: derived from source file and chunk content)
         """
         if len(documents) != len(embeddings):
             raise ValueError("Number of documents and embeddings must match")
-        
+        if ids is None:
+            ids = assign_chunk_ids(documents)
+        elif len(ids) != len(documents):
+            raise ValueError("Number of documents and ids must match")
+
         print(f"[INFO] Adding {len(documents)} documents to the vector store...")
 
-        # Prepare data for ChromaDB
-        ids = []
-        metadatas = []
-        documents_text = []
-        embeddings_list = []
-        
-        for i, (doc, embedding) in enumerate(zip(documents, embeddings)):
-            # Generate unique id
-            try:
-                doc_id = f"doc_{uuid.uuid4().hex[:8]}_{i}"
-                ids.append(doc_id)
-                
+        max_batch = self._max_write_batch()
+        for start in range(0, len(documents), max_batch):
+            end = min(start + max_batch, len(documents))
+            metadatas = []
+            for i in range(start, end):
+                doc = documents[i]
                 # Add metadata
                 metadata = dict(doc.metadata)
                 metadata['doc_index'] = i
                 metadata['content_length'] = len(doc.page_content)
                 metadatas.append(metadata)
-                
-                documents_text.append(doc.page_content)
-                embeddings_list.append(embedding.tolist())
+            texts = [doc.page_content for doc in documents[start:end]]
+
+            try:
+                # Upsert so re-indexing a chunk replaces it instead of duplicating it
+                self._upsert(list(ids[start:end]), np.asarray(embeddings[start:end], dtype=np.float32), texts, metadatas)
             except Exception as e:
-                print(f"[ERROR] Error preparing document {i} for ChromaDB: {str(e)}")
-                continue
-        
-        try:
-            # Add to ChromaDB collection
-            self.collection.add(
-                ids=ids,
-                embeddings=embeddings_list,
-                metadatas=metadatas,
-                documents=documents_text
-            )
-            print(f"[INFO] Added {len(documents)} documents to the vector store.")
-            print(f"[INFO] Total documents in collection: {self.collection.count()}")
-        except Exception as e:
-            print(f"[ERROR] Error adding documents to vector store: {str(e)}")
-            raise e
+                print(f"[ERROR] Error adding documents to vector store: {str(e)}")
+                raise e
+
+            self.lexical_index.add(list(ids[start:end]), texts)
+            if self.token_store is not None:
+                self.token_store.add(texts)
+            self.version += 1
+
+        print(f"[INFO] Added {len(documents)} documents to the vector store.")
+        print(f"[INFO] Total documents in collection: {self.count()}")
 
-    def query(self, query_text: str, top_k: int = 5, score_threshold: float = 0.0) -> List[Dict[str, Any]]:
+    def delete(self, ids: List[str]):
+        """
+        Remove chunks from the vector store by id
+        """
+        if not ids:
+            return
+        self._delete_ids(list(ids))
+        self.lexical_index.delete(ids)
+        self.version += 1
+        print(f"[INFO] Deleted {len(ids)} documents from the vector store.")
+
+    def clear(self):
+        """
+        Drop every document
+        """
+        self._clear()
+        self.lexical_index.clear()
+        self.lexical_index.save()
+        self.version += 1
+
+    def embed_query(self, query_text: str) -> np.ndarray:
+        if self.query_encoder is not None:
+            return self.query_encoder([query_text])[0]
+        return self.model.encode([query_text])[0]
+
+    def embed_queries(self, query_texts: List[str]) -> np.ndarray:
+        """
+        Embeddings of several queries from one encode call (one micro-batch job when batching)
+        """
+        if self.query_encoder is not None:
+            return np.asarray(self.query_encoder(query_texts))
+        return self.model.encode(query_texts, batch_size=len(query_texts), show_progress_bar=False)
+
+    def query(self, query_text: str, top_k: int = 5, score_threshold: float = 0.0,
+              query_embedding: Optional[np.ndarray] = None, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
         Retrieve relevant documents for a given query
         Args:
         query_text: Input query string
         top_k: Number of top results to retrieve (default: 5)
         score_threshold: Minimum similarity score threshold (default: 0.0)
+        query_embedding: Precomputed embedding of query_text (default: encoded here)
+        where: Metadata filter, e.g. {"document_type": "events"} (see matches_where)
         Returns:
         List of retrieved documents with metadata and similarity scores
         """
-        print(f"[INFO] Querying vector store for: '{query_text}'")
-        print(f"[INFO] Using top_k: {top_k}, score_threshold: {score_threshold}")
-        
+        self.maybe_refresh()
+        logger.debug(f"Querying vector store for: '{query_text}' (top_k: {top_k}, score_threshold: {score_threshold})")
+
         # Generate embedding for the query
-        query_embedding = self.model.encode([query_text])[0]
+        if query_embedding is None:
+            query_embedding = self.embed_query(query_text)
 
         try:
-            results = self.collection.query(
-                query_embeddings=[query_embedding.tolist()],
-                n_results=top_k
-            )
-            
-            # Process results
-            retrieved_docs = []
-
-            if results['documents'] and results['documents'][0]:
-                documents = results['documents'][0]
-                metadatas = results['metadatas'][0]
-                distances = results['distances'][0]
-                ids = results['ids'][0]
-
-                for i, (doc_id, document, metadata, distance) in enumerate(zip(ids, documents, metadatas, distances)):
-                    # Convert distance to similarity score (ChromaDB uses cosine distance)
-                    similarity_score = 1 - distance
-                    if similarity_score >= score_threshold:
-                        retrieved_docs.append({
-                            "id": doc_id,
-                            "content": document,
-                            "metadata": metadata,
-                            "similarity_score": similarity_score,
-                            "distance": distance,
-                            "rank": i + 1
-                        })
-                print(f"[INFO] Retrieved {len(retrieved_docs)} documents from vector store query.")
+            retrieved_docs = [doc for doc in self._dense_search(query_embedding, top_k, where) if doc["similarity_score"] >= score_threshold]
+            if retrieved_docs:
+                logger.debug(f"Retrieved {len(retrieved_docs)} documents from vector store query.")
             else:
-                print("[INFO] No documents retrieved from vector store query.")
-            
+                logger.debug("No documents retrieved from vector store query.")
             return retrieved_docs
 
         except Exception as e:
-            print(f"[ERROR] Error during retrieval: {str(e)}")
-            raise e
\ No newline at end of file
+            logger.error(f"Error during retrieval: {str(e)}")
+            raise e
+
+    def hybrid_query(self, query_text: str, top_k: int = 5, lexical_k: Optional[int] = None, rrf_k: int = 60,
+                     query_embedding: Optional[np.ndarray] = None,
+                     where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieve documents with dense and BM25 search in parallel and fuse the
+        two rankings with reciprocal-rank fusion.
+        Args:
+        query_text: Input query string
+        top_k: Number of fused results to return
+        lexical_k: Candidates taken from each side before fusion (default: top_k)
+        rrf_k: RRF damping constant
+        query_embedding: Precomputed embedding of query_text (default: encoded here)
+        where: Metadata filter applied to both sides, as in query()
+        Returns:
+        List of retrieved documents in the same format as query(), ranked by fused score
+        """
+        self.maybe_refresh()
+        candidate_k = lexical_k or top_k
+        if query_embedding is None:
+            query_embedding = self.embed_query(query_text)
+        dense_future = self._search_pool.submit(self._dense_search, query_embedding, candidate_k, where)
+        lexical_future = self._search_pool.submit(self.lexical_index.search, query_text, candidate_k)
+        return self._fuse(dense_future.result(), lexical_future.result(), query_embedding, top_k, rrf_k, where)
+
+    def batch_query(self, query_texts: List[str], query_embeddings: np.ndarray, top_k: int = 5,
+                    hybrid: bool = False, lexical_k: Optional[int] = None, rrf_k: int = 60,
+                    score_threshold: float = 0.0, where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        query() or hybrid_query() for many queries at once: all dense lookups go
+        to the store in one multi-query call.
+        Args:
+        query_texts: Input query strings
+        query_embeddings: One precomputed embedding per query
+        top_k: Results per query
+        hybrid: Fuse with BM25 like hybrid_query() (score_threshold is then ignored)
+        lexical_k, rrf_k: As in hybrid_query()
+        score_threshold: Minimum similarity score for dense-only results
+        where: Metadata filter for every query, as in query()
+        Returns:
+        One result list per query, in the same format as query() / hybrid_query()
+        """
+        self.maybe_refresh()
+        if not query_texts:
+            return []
+        candidate_k = (lexical_k or top_k) if hybrid else top_k
+        dense_batches = self._dense_search_batch(np.asarray(query_embeddings, dtype=np.float32), candidate_k, where)
+        if not hybrid:
+            results = [[doc for doc in docs if doc["similarity_score"] >= score_threshold] for docs in dense_batches]
+            logger.debug(f"Batch retrieval: {len(query_texts)} queries, {sum(map(len, results))} documents")
+            return results
+        lexical_batches = list(self._search_pool.map(lambda text: self.lexical_index.search(text, candidate_k), query_texts))
+        return [self._fuse(dense, lexical, query_embedding, top_k, rrf_k, where)
+                for dense, lexical, query_embedding in zip(dense_batches, lexical_batches, query_embeddings)]
+
+    def multi_query(self, query_texts: List[str], query_embeddings: np.ndarray, top_k: int = 5,
+                    hybrid: bool = False, rrf_k: int = 60, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieve for several phrasings of one question with a single batch_query()
+        call and merge the rankings by reciprocal rank fusion.
+        Args:
+        query_texts: Phrasings of the question, the main one first
+        query_embeddings: One precomputed embedding per phrasing
+        top_k: Number of fused results
+        hybrid, rrf_k: As in hybrid_query(); rrf_k also damps the fusion across phrasings
+        where: Metadata filter, as in query()
+        Returns:
+        Documents in the format of query(), each chunk once with the best
+        similarity_score any phrasing gave it
+        """
+        rankings = self.batch_query(query_texts, query_embeddings, top_k=top_k, hybrid=hybrid, rrf_k=rrf_k, where=where)
+        return self.fuse_rankings(rankings, top_k, rrf_k)
+
+    @staticmethod
+    def fuse_rankings(rankings: List[List[Dict[str, Any]]], top_k: int, rrf_k: int = 60) -> List[Dict[str, Any]]:
+        """
+        Reciprocal-rank fusion of result lists of the same question (see multi_query())
+        """
+        by_id: Dict[str, Dict[str, Any]] = {}
+        for docs in rankings:
+            for doc in docs:
+                best = by_id.get(doc["id"])
+                if best is None or doc["similarity_score"] > best["similarity_score"]:
+                    by_id[doc["id"]] = doc
+
+        fused = reciprocal_rank_fusion([[doc["id"] for doc in docs] for docs in rankings], k=rrf_k)[:top_k]
+        retrieved_docs = []
+        for rank, (doc_id, fused_score) in enumerate(fused, 1):
+            doc = dict(by_id[doc_id])
+            doc["rank"] = rank
+            doc["fusion_score"] = fused_score
+            retrieved_docs.append(doc)
+        logger.debug(f"Multi-query retrieval: {len(rankings)} phrasings, {len(by_id)} distinct -> {len(retrieved_docs)} fused")
+        return retrieved_docs
+
+    def get_documents(self, ids: List[str], query_embedding: np.ndarray,
+                      where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Stored chunks by id, in the format of query() without "rank", their
+        similarity_score computed against query_embedding from the stored
+        embedding. Ids no longer in the store (or not matching where) are skipped.
+        """
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query_vector) or 1.0
+        documents = []
+        for doc_id, document, metadata, embedding in self._fetch(ids):
+            if not matches_where(metadata, where):
+                continue
+            embedding = np.asarray(embedding, dtype=np.float32)
+            similarity_score = float(np.dot(query_vector, embedding) / (query_norm * (np.linalg.norm(embedding) or 1.0)))
+            documents.append({
+                "id": doc_id,
+                "content": document,
+                "metadata": metadata,
+                "similarity_score": similarity_score,
+                "distance": 1 - similarity_score,
+            })
+        return documents
+
+    def _fuse(self, dense_results: List[Dict[str, Any]], lexical_results: List[Tuple[str, float]],
+              query_embedding: np.ndarray, top_k: int, rrf_k: int,
+              where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Reciprocal-rank fusion of one query's dense and BM25 results. The BM25
+        index has no metadata, so with a where filter lexical-only hits are
+        fetched before the cut to top_k and the non-matching ones dropped.
+        """
+        fused = reciprocal_rank_fusion([[doc["id"] for doc in dense_results], [doc_id for doc_id, _ in lexical_results]], k=rrf_k)
+        if not where:
+            fused = fused[:top_k]
+        by_id = {doc["id"]: doc for doc in dense_results}
+        bm25_scores = dict(lexical_results)
+
+        # Lexical-only hits are fetched from the store; their cosine
+        # similarity is computed from the stored embedding so scores stay comparable
+        missing = [doc_id for doc_id, _ in fused if doc_id not in by_id]
+        if missing:
+            by_id.update((doc["id"], doc) for doc in self.get_documents(missing, query_embedding, where))
+
+        retrieved_docs = []
+        for doc_id, fused_score in fused:
+            doc = by_id.get(doc_id)
+            if doc is None:
+                continue
+            if len(retrieved_docs) == top_k:
+                break
+            rank = len(retrieved_docs) + 1
+            doc = dict(doc)
+            doc["rank"] = rank
+            doc["fusion_score"] = fused_score
+            doc["bm25_score"] = bm25_scores.get(doc_id, 0.0)
+            retrieved_docs.append(doc)
+        logger.debug(f"Hybrid retrieval: {len(dense_results)} dense + {len(lexical_results)} lexical -> {len(retrieved_docs)} fused")
+        return retrieved_docs
+
+
+class ChromaVectorStore(BaseVectorStore):
+    def __init__(self, persist_dir: str = "./data/vector_store", embedding_model: str = "openai/gpt-oss-120b",
+                 chunk_size: int = 1000, chunk_overlap: int = 200, collection_name: str = "pdf_documents",
+                 batch_size: int = 256, inference_backend: str = "torch"):
+        super().__init__(persist_dir, embedding_model, chunk_size, chunk_overlap, batch_size, inference_backend)
+        self.collection_name = collection_name
+        self.client = None
+        self.collection = None
+        self._initialize_store()
+        self._init_lexical_index()
+
+    def _initialize_store(self):
+        """
+        Initialize the ChromaDB client and collection
+        """
+        try:
+            # Make persistent ChromaDB client
+            os.makedirs(self.persist_dir, exist_ok=True)
+            self.client = chromadb.PersistentClient(
+                path=self.persist_dir,
+                settings=Settings(anonymized_telemetry=False)
+            )
+
+            # Get or create collection
+            self.collection = self._get_or_create_collection()
+            print(f"[INFO] Vector Store initialized with collection: {self.collection_name}")
+            print(f"[INFO] Existing documents in collection: {self.collection.count()}")
+
+        except Exception as e:
+            print(f"[ERROR] Error initializing ChromaDB: {str(e)}")
+            raise e
+
+    def _get_or_create_collection(self):
+        return self.client.get_or_create_collection(
+            name=self.collection_name,
+            metadata={"hnsw:space": "cosine", "description": "PDF Document embeddings for RAG"}
+        )
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def _max_write_batch(self) -> int:
+        # Chroma rejects requests above its max batch size, so upsert in slices
+        if hasattr(self.client, "get_max_batch_size"):
+            return min(self.batch_size, self.client.get_max_batch_size())
+        return self.batch_size
+
+    def _upsert(self, ids: List[str], embeddings: np.ndarray, texts: List[str], metadatas: List[Dict[str, Any]]):
+        self.collection.upsert(ids=ids, embeddings=embeddings.tolist(), metadatas=metadatas, documents=texts)
+
+    def _delete_ids(self, ids: List[str]):
+        self.collection.delete(ids=ids)
+
+    def _clear(self):
+        # Recreating the collection is much faster than deleting every id
+        self.client.delete_collection(self.collection_name)
+        self.collection = self._get_or_create_collection()
+        print(f"[INFO] Cleared collection: {self.collection_name}")
+
+    def _fetch(self, ids: List[str]) -> List[Tuple[str, str, Dict[str, Any], np.ndarray]]:
+        fetched = self.collection.get(ids=ids, include=["documents", "metadatas", "embeddings"])
+        return list(zip(fetched["ids"], fetched["documents"], fetched["metadatas"], fetched["embeddings"]))
+
+    def _iter_texts(self, page_size: int) -> Iterator[Tuple[List[str], List[str]]]:
+        total = self.collection.count()
+        for offset in range(0, total, page_size):
+            page = self.collection.get(include=["documents"], limit=page_size, offset=offset)
+            yield page["ids"], page["documents"]
+
+    def _dense_search(self, query_embedding: np.ndarray, top_k: int,
+                      where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return self._dense_search_batch(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1), top_k, where)[0]
+
+    def _dense_search_batch(self, query_embeddings: np.ndarray, top_k: int,
+                            where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        # One collection.query call for every query; similarity is 1 - cosine distance (hnsw:space=cosine)
+        results = self.collection.query(
+            query_embeddings=np.asarray(query_embeddings, dtype=np.float32).tolist(),
+            n_results=top_k,
+            where=where or None
+        )
+        batches = []
+        for q in range(len(query_embeddings)):
+            retrieved_docs = []
+            if results['documents'] and results['documents'][q]:
+                for i, (doc_id, document, metadata, distance) in enumerate(zip(results['ids'][q], results['documents'][q], results['metadatas'][q], results['distances'][q])):
+                    retrieved_docs.append({
+                        "id": doc_id,
+                        "content": document,
+                        "metadata": metadata,
+                        "similarity_score": 1 - distance,
+                        "distance": distance,
+                        "rank": i + 1
+                    })
+            batches.append(retrieved_docs)
+        return batches
@@ -0,0 +1,227 @@
+"""
+LLMGateway against the local Groq stub (benchmarks/stub_groq_server.py).
+Run from the Chatbot directory:
+
+    python -m pytest tests        (or: python -m unittest discover tests)
+"""
+import json
+import time
+import asyncio
+import threading
+import unittest
+import urllib.request
+from benchmarks.stub_groq_server import serve
+from src.llm_gateway import CircuitBreaker, LLMGateway, LLMUnavailableError
+from src.metrics import REGISTRY
+
+PROMPT = "CONTEXT:\nThe library is in block C.\n\nSTUDENT QUESTION: Where is the library?\n\nDETAILED ANSWER:"
+
+def _counter(name: str, **labels) -> float:
+    return REGISTRY.counter(name, **labels).value()
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_opens_after_threshold_and_lets_one_probe_through(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_released_probe_reopens_the_circuit(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.release_probe()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+
+    def test_release_without_probe_is_a_no_op(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+        breaker.release_probe()
+        self.assertEqual(breaker.state, "closed")
+
+
+class LLMGatewayTest(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = serve(port=0)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.control(latency_ms=20, jitter_ms=0, slow_rate=0, slow_ms=2000, error_rate=0, rate_limit_rate=0,
+                     retry_after=0.01, down=False, slow_next=0, rate_limit_next=0)
+
+    def control(self, **faults):
+        request = urllib.request.Request(f"{self.base_url}/control", data=json.dumps(faults).encode("utf-8"),
+                                         method="POST")
+        urllib.request.urlopen(request).read()
+
+    def upstream_requests(self) -> int:
+        return json.loads(urllib.request.urlopen(f"{self.base_url}/control").read())["counts"]["requests"]
+
+    def gateway(self, **kwargs) -> LLMGateway:
+        options = {"deadline_seconds": 5.0, "hedge_percentile": None, "backoff_base": 0.01, **kwargs}
+        gateway = LLMGateway(base_url=self.base_url, **options)
+        gateway.connect_groq("test-key", "stub-model")
+        return gateway
+
+    async def test_coalesces_identical_async_calls(self):
+        gateway = self.gateway()
+        self.control(latency_ms=200)
+        before, coalesced = self.upstream_requests(), _counter("rag_llm_coalesced_total")
+        responses = await asyncio.gather(*[gateway.ainvoke(PROMPT) for _ in range(10)])
+        self.assertEqual(self.upstream_requests() - before, 1)
+        self.assertEqual(_counter("rag_llm_coalesced_total") - coalesced, 9)
+        self.assertEqual({response.content for response in responses}, {"Stub answer to: Where is the library?"})
+
+    async def test_coalesces_identical_sync_calls(self):
+        gateway = self.gateway()
+        self.control(latency_ms=300)
+        before = self.upstream_requests()
+        answers = []
+        threads = [threading.Thread(target=lambda: answers.append(gateway.invoke(PROMPT).content)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.upstream_requests() - before, 1)
+        self.assertEqual(len(set(answers)), 1)
+        self.assertEqual(len(answers), 5)
+
+    async def test_cancelled_leader_still_answers_coalesced_calls(self):
+        gateway = self.gateway()
+        self.control(latency_ms=300)
+        before = self.upstream_requests()
+        leader = asyncio.ensure_future(gateway.ainvoke(PROMPT))
+        await asyncio.sleep(0.05)
+        follower = asyncio.ensure_future(gateway.ainvoke(PROMPT))
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.assertEqual((await follower).content, "Stub answer to: Where is the library?")
+        self.assertEqual(self.upstream_requests() - before, 1)
+
+    async def test_call_is_cancelled_once_every_caller_is(self):
+        gateway = self.gateway()
+        self.control(latency_ms=2000)
+        callers = [asyncio.ensure_future(gateway.ainvoke(PROMPT)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        for caller in callers:
+            caller.cancel()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        self.assertTrue(all(isinstance(result, asyncio.CancelledError) for result in results))
+        self.assertEqual(gateway._inflight_async, {})
+
+    async def test_retries_rate_limits_until_an_answer(self):
+        gateway = self.gateway(max_retries=3)
+        self.control(rate_limit_next=2)
+        before, retries = self.upstream_requests(), _counter("rag_llm_retries_total", reason="rate_limited")
+        response = await gateway.ainvoke(PROMPT)
+        self.assertEqual(response.content, "Stub answer to: Where is the library?")
+        self.assertEqual(self.upstream_requests() - before, 3)
+        self.assertEqual(_counter("rag_llm_retries_total", reason="rate_limited") - retries, 2)
+        # A 429 is an answer: it doesn't count against the circuit
+        self.assertEqual(gateway.breaker.state, "closed")
+
+    async def test_gives_up_after_max_retries(self):
+        gateway = self.gateway(max_retries=2)
+        self.control(rate_limit_rate=1.0)
+        before = self.upstream_requests()
+        with self.assertRaises(LLMUnavailableError):
+            await gateway.ainvoke(PROMPT)
+        self.assertEqual(self.upstream_requests() - before, 3)
+
+    async def test_hedges_a_request_slower_than_usual(self):
+        gateway = self.gateway(hedge_percentile=0.95, hedge_min_samples=5)
+        for i in range(5):
+            await gateway.ainvoke(f"{PROMPT} {i}")
+        self.assertIsNotNone(gateway.hedge_delay())
+        self.control(slow_next=1, slow_ms=3000)
+        before, hedges = self.upstream_requests(), _counter("rag_llm_hedges_total")
+        started = time.monotonic()
+        response = await gateway.ainvoke(PROMPT)
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(response.content, "Stub answer to: Where is the library?")
+        self.assertEqual(_counter("rag_llm_hedges_total") - hedges, 1)
+        self.assertEqual(self.upstream_requests() - before, 2)
+
+    async def test_open_circuit_fails_fast_and_serves_the_last_answer(self):
+        gateway = self.gateway(max_retries=0, failure_threshold=2, reset_seconds=60)
+        answer = (await gateway.ainvoke(PROMPT)).content
+        self.control(down=True)
+        for i in range(2):
+            with self.assertRaises(LLMUnavailableError):
+                await gateway.ainvoke(f"other question {i}")
+        self.assertEqual(gateway.breaker.state, "open")
+        before = self.upstream_requests()
+        self.assertEqual((await gateway.ainvoke(PROMPT)).content, answer)
+        with self.assertRaises(LLMUnavailableError):
+            await gateway.ainvoke("a new question")
+        self.assertEqual(self.upstream_requests(), before)
+
+    async def _open_and_wait_for_probe(self, gateway: LLMGateway):
+        self.control(down=True)
+        with self.assertRaises(LLMUnavailableError):
+            await gateway.ainvoke("fails")
+        self.assertEqual(gateway.breaker.state, "open")
+        await asyncio.sleep(gateway.breaker.reset_seconds + 0.05)
+        self.control(down=False, latency_ms=2000)
+
+    async def test_cancelled_probe_does_not_hold_the_circuit_half_open(self):
+        gateway = self.gateway(max_retries=0, failure_threshold=1, reset_seconds=0.2)
+        await self._open_and_wait_for_probe(gateway)
+        probe = asyncio.ensure_future(gateway.ainvoke("probe"))
+        await asyncio.sleep(0.1)
+        self.assertEqual(gateway.breaker.state, "half_open")
+        probe.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await probe
+        self.assertEqual(gateway.breaker.state, "open")
+
+        await asyncio.sleep(0.25)
+        self.control(latency_ms=20)
+        self.assertEqual((await gateway.ainvoke(PROMPT)).content, "Stub answer to: Where is the library?")
+        self.assertEqual(gateway.breaker.state, "closed")
+
+    async def test_cancelled_stream_probe_does_not_hold_the_circuit_half_open(self):
+        gateway = self.gateway(max_retries=0, failure_threshold=1, reset_seconds=0.2)
+        await self._open_and_wait_for_probe(gateway)
+
+        async def consume():
+            return [chunk.content async for chunk in gateway.astream("probe")]
+
+        probe = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.1)
+        probe.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await probe
+        self.assertEqual(gateway.breaker.state, "open")
+
+        await asyncio.sleep(0.25)
+        self.control(latency_ms=20)
+        chunks = [chunk.content async for chunk in gateway.astream(PROMPT)]
+        self.assertEqual("".join(chunks), "Stub answer to: Where is the library?")
+        self.assertEqual(gateway.breaker.state, "closed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -36,6 +36,82 @@ export const askChatbot = async (query, topK = 5) => {
   }
 };
 
+/**
+ * Ask a question and stream the answer as it is generated (Server-Sent Events)
+ * @param {string} query - The question to ask
+ * @param {Object} handlers - Callbacks: onMeta({confidence, relevance_score, session_id}), onToken(text),
+ *   onDone({answer}), onError({message}) when generating the answer fails (thrown as an Error without onError)
+ * @param {number} topK - Number of documents to retrieve (default: 5)
+ * @param {Object} session - Conversation to continue: {sessionId} from a previous meta event,
+ *   or {newSession: true} to start one (default: the question stands alone)
+ * @returns {Promise<string>} The full answer once the stream ends
+ */
+export const askChatbotStream = async (
+  query,
+  { onMeta, onToken, onDone, onError } = {},
+  topK = 5,
+  { sessionId, newSession } = {},
+) => {
+  const response = await fetch(`${CHATBOT_API_URL}/ask/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      query,
+      top_k: topK,
+      ...(sessionId ? { session_id: sessionId } : newSession ? { new_session: true } : {}),
+    }),
+  });
+
+  if (!response.ok || !response.body) {
+    const errorData = await response.json().catch(() => ({}));
+    throw new Error(errorData.error || 'Failed to get response from chatbot');
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let answer = '';
+
+  const handleEvent = (block) => {
+    let event = 'message';
+    const dataLines = [];
+    for (const line of block.split('\n')) {
+      if (line.startsWith('event:')) event = line.slice(6).trim();
+      else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+    }
+    if (!dataLines.length) return;
+    const data = JSON.parse(dataLines.join('\n'));
+
+    if (event === 'meta') onMeta?.(data);
+    else if (event === 'token') {
+      answer += data.text;
+      onToken?.(data.text);
+    } else if (event === 'done') {
+      answer = data.answer;
+      onDone?.(data);
+    } else if (event === 'error') {
+      if (!onError) throw new Error(data.message);
+      onError(data);
+    }
+  };
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    // Events are separated by a blank line
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      handleEvent(buffer.slice(0, boundary));
+      buffer = buffer.slice(boundary + 2);
+    }
+  }
+
+  return answer;
+};
+
 /**
  * Check if the chatbot service is available
  * @returns {Promise<boolean>} True if service is reachable